@@ -0,0 +1,85 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Iterator, Sequence
+from typing import TypeVar
+from unittest.mock import patch
+
+import pytest
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.wibeee.api import WibeeeAPI
+from custom_components.wibeee.const import NEST_NULL_UPSTREAM
+from custom_components.wibeee.nest import DATA_NEST_PROXY, NestProxy
+from custom_components.wibeee.sensor import DeviceInfo, KNOWN_SENSORS
+from tests.test_helpers import build_values
+from .replay import RecordedPush, ReplayReport, meter_mac, replay_push_traffic
+
+T = TypeVar('T')
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    yield
+
+
+@pytest.fixture
+def run_in_loop() -> Iterator[Callable[[Awaitable[T]], T]]:
+    """
+    Returns a function that runs an awaitable to completion in an event loop created once for the test, so that sync tests
+    can measure coroutines without timing the creation of a loop.
+    """
+    with asyncio.Runner() as runner:
+        yield runner.get_loop().run_until_complete
+
+
+@pytest.fixture
+def setup_meters(hass: HomeAssistant) -> Callable[..., Awaitable[list[MockConfigEntry]]]:
+    """
+    Returns a function that sets up a config entry per 3-phase meter, with every known sensor, using a mocked WibeeeAPI.
+    Extra keyword arguments are set as the entries' options. The entries register with a `NestProxy` that isn't served,
+    instead of `get_nest_proxy` starting the proxy's thread and listening on port 8600.
+    """
+
+    def device_info(api: WibeeeAPI, *args, **kwargs) -> DeviceInfo:
+        n = int(api.host.rsplit('.', 1)[1])
+        return DeviceInfo(f'Meter{n}', meter_mac(n), '4.4.171', 'WBT', api.host)
+
+    def fetch_values(api: WibeeeAPI, *args, **kwargs) -> dict:
+        return build_values(device_info(api), {
+            f'{s.poll_var_prefix}{slot.value.poll_var_suffix}': '0' for s in KNOWN_SENSORS for slot in s.slots
+        })
+
+    async def setup(meters: int = 1, **options) -> list[MockConfigEntry]:
+        hass.data.setdefault(DATA_NEST_PROXY, NestProxy())
+        entries = []
+        with patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True, side_effect=device_info), \
+                patch.object(WibeeeAPI, 'async_fetch_values', autospec=True, side_effect=fetch_values):
+            for n in range(meters):
+                entry = MockConfigEntry(domain='wibeee', data=dict(host=f'10.0.0.{n}', mac_address=meter_mac(n), wibeee_id=f'Meter{n}'),
+                                        options={'nest_upstream': NEST_NULL_UPSTREAM} | options, version=5)
+                entry.add_to_hass(hass)
+                await hass.config_entries.async_setup(entry.entry_id)
+                entries.append(entry)
+            await hass.async_block_till_done()
+
+        return entries
+
+    return setup
+
+
+@pytest.fixture
+def push_replay(hass: HomeAssistant, setup_meters, socket_enabled) -> Callable[..., Awaitable[ReplayReport]]:
+    """
+    Returns a function that sets up a config entry per meter and replays a recording through the Nest proxy's application,
+    so that the report covers the decoding, the handover to Home Assistant's event loop and the sensor update path too.
+    Extra keyword arguments are set as the entries' options.
+    """
+
+    async def run(recording: Sequence[RecordedPush], speed: float = 1.0, meters: int = 1, **options) -> ReplayReport:
+        await setup_meters(meters, **options)
+
+        report = await replay_push_traffic(hass.data[DATA_NEST_PROXY], recording, speed, meters)
+        await hass.async_block_till_done()
+        return report
+
+    return run
@@ -0,0 +1,10 @@
+"""Shared helpers for the benchmarks."""
+from homeassistant.helpers.device_registry import DeviceInfo as HassDeviceInfo
+
+from custom_components.wibeee.sensor import KNOWN_SENSORS, WibeeeSensor
+
+
+def make_meter_sensors(mac_addr: str) -> list[WibeeeSensor]:
+    """Creates the sensors of a 3-phase meter, with every known sensor type in every slot."""
+    device_info = HassDeviceInfo(identifiers={('wibeee', mac_addr)})
+    return [WibeeeSensor(mac_addr, device_info, slot, sensor_type, None, None) for sensor_type in KNOWN_SENSORS for slot in sensor_type.slots]
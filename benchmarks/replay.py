@@ -0,0 +1,190 @@
+"""
+Replays recorded push traffic through the Nest proxy, in-process, to load test the push path. As in production, the
+proxy's application runs on a `NestProxyThread` and hands decoded frames over to the calling event loop (Home Assistant's
+in the benchmarks), whose lag is measured. The requests are sent from a client on a thread of its own, so that sending
+them loads neither event loop.
+
+A recording is a JSON lines file with one request per line: the time `t` in seconds since the start of the recording,
+the HTTP `method`, the `path`, the `query` string and the `body` (null for GET requests). The recording is replayed once
+per simulated meter, with the recorded MAC address replaced by a MAC per meter, and the meters staggered over the first
+second as real devices aren't synchronized. Run this module to replay a recording against the proxy alone:
+
+    python -m benchmarks.replay tests/fixtures/test_nest_push_recording.jsonl --speed 10 --meters 50
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.parse
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import unused_port
+
+from custom_components.wibeee.const import NEST_NULL_UPSTREAM
+from custom_components.wibeee.nest import FrameBatcher, NestProxy, NestProxyThread, create_application
+
+LOOP_LAG_INTERVAL = 0.005
+"""Seconds between checks of the event loop's lag."""
+
+
+class RecordedPush(NamedTuple):
+    t: float
+    method: str
+    path: str
+    query: str
+    body: str | None
+
+    @property
+    def mac(self) -> str:
+        if self.body is not None:
+            return json.loads(self.body)['mac']
+        return urllib.parse.parse_qs(self.query)['mac'][0]
+
+
+def load_recording(path: Path) -> list[RecordedPush]:
+    with open(path) as f:
+        return [RecordedPush(**json.loads(line)) for line in f if line.strip()]
+
+
+def meter_mac(n: int) -> str:
+    return f'{0x02a000000000 + n:012x}'
+
+
+class ReplayReport(NamedTuple):
+    requests: int
+    errors: int
+    duration: float
+    handler_latency_p50: float
+    handler_latency_p99: float
+    loop_lag_p99: float
+    loop_lag_max: float
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.duration if self.duration else 0.0
+
+    def __str__(self) -> str:
+        return (f'{self.requests} requests ({self.errors} errors) in {self.duration:.2f}s, {self.requests_per_second:.1f} req/s, '
+                f'handler p50 {self.handler_latency_p50 * 1000:.2f}ms p99 {self.handler_latency_p99 * 1000:.2f}ms, '
+                f'loop lag p99 {self.loop_lag_p99 * 1000:.2f}ms max {self.loop_lag_max * 1000:.2f}ms')
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def replay_push_traffic(nest_proxy: NestProxy, recording: Sequence[RecordedPush], speed: float = 1.0, meters: int = 1) -> ReplayReport:
+    """
+    Replays `recording` for `meters` devices at `speed` times the recorded rate, through an application that routes with
+    `nest_proxy`. The handler latency is measured inside the application on the proxy's thread, excluding the client, and
+    the calling event loop's lag is measured by a task that sleeps in short intervals.
+    """
+    loop = asyncio.get_running_loop()
+    handler_latencies = []
+
+    @web.middleware
+    async def measure_handler(req: web.Request, handler) -> web.StreamResponse:
+        started = time.perf_counter()
+        try:
+            return await handler(req)
+        finally:
+            handler_latencies.append(time.perf_counter() - started)
+
+    async def start_server(port: int) -> web.AppRunner:
+        # runs on the proxy's event loop, like get_nest_proxy does.
+        app = create_application(nest_proxy.get_device_info, FrameBatcher(loop))
+        app.middlewares.append(measure_handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host='127.0.0.1', port=port).start()
+        return runner
+
+    recorded_mac = recording[0].mac
+    schedule = sorted(
+        ((push.t + n / meters) / speed, push._replace(query=push.query.replace(recorded_mac, mac),
+                                                      body=push.body and push.body.replace(recorded_mac, mac)))
+        for n, mac in enumerate(meter_mac(n) for n in range(meters))
+        for push in recording
+    )
+
+    loop_lags = []
+
+    async def measure_loop_lag() -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            loop_lags.append(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL))
+
+    port = unused_port()
+    proxy_thread = NestProxyThread()
+    proxy_thread.start()
+    try:
+        runner = await proxy_thread.async_run(start_server(port))
+        lag_task = asyncio.create_task(measure_loop_lag())
+        try:
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix='wibeee_replay_client') as client_executor:
+                errors, duration = await loop.run_in_executor(client_executor, asyncio.run, _send_all(f'http://127.0.0.1:{port}', schedule))
+
+            # frames of the last responses may still be on their way to this loop.
+            await proxy_thread.async_run(asyncio.sleep(0))
+            await asyncio.sleep(0)
+        finally:
+            lag_task.cancel()
+            await proxy_thread.async_run(runner.cleanup())
+    finally:
+        await proxy_thread.async_stop()
+
+    return ReplayReport(len(schedule), errors, duration, _percentile(handler_latencies, 50), _percentile(handler_latencies, 99),
+                        _percentile(loop_lags, 99), max(loop_lags, default=0.0))
+
+
+async def _send_all(base_url: str, schedule: Sequence[tuple[float, RecordedPush]]) -> tuple[int, float]:
+    """Sends the scheduled requests, returning the number of errors and how long it took."""
+    async with aiohttp.ClientSession(base_url) as session:
+        errors = 0
+
+        async def send(push: RecordedPush) -> None:
+            nonlocal errors
+            async with session.request(push.method, f'{push.path}?{push.query}', data=push.body) as res:
+                await res.read()
+                errors += res.status != 200
+
+        started = time.perf_counter()
+        requests = []
+        for due, push in schedule:
+            if (delay := due - (time.perf_counter() - started)) > 0:
+                await asyncio.sleep(delay)
+            requests.append(asyncio.create_task(send(push)))
+
+        await asyncio.gather(*requests)
+        return errors, time.perf_counter() - started
+
+
+async def _replay_to_proxy(recording: Sequence[RecordedPush], speed: float, meters: int) -> ReplayReport:
+    nest_proxy = NestProxy()
+    for n in range(meters):
+        nest_proxy.register_device(meter_mac(n), lambda push_data: None, NEST_NULL_UPSTREAM)
+
+    return await replay_push_traffic(nest_proxy, recording, speed, meters)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Replays recorded push traffic through the Nest proxy.')
+    parser.add_argument('recording', type=Path)
+    parser.add_argument('--speed', type=float, default=1.0, help='multiplier of the recorded push rate')
+    parser.add_argument('--meters', type=int, default=1, help='number of simulated meters')
+    args = parser.parse_args(argv)
+
+    print(asyncio.run(_replay_to_proxy(load_recording(args.recording), args.speed, args.meters)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Measures the cost of fetching and parsing values.xml from a stub device served locally."""
+from datetime import timedelta
+from pathlib import Path
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from custom_components.wibeee.api import WibeeeAPI, create_device_session
+
+FIXTURES = Path(__file__).parent.parent / 'tests' / 'fixtures'
+
+
+def make_stub_device(values_xml: bytes) -> web.Application:
+    async def values(_: web.Request) -> web.Response:
+        return web.Response(body=values_xml, content_type='text/xml')
+
+    app = web.Application()
+    app.router.add_get('/services/user/values.xml', values)
+    return app
+
+
+@pytest.mark.parametrize('fixture', ['test_api_values_1phase.xml', 'test_api_values.xml'])
+def test_fetch_values(benchmark, run_in_loop, socket_enabled, fixture):
+    server = TestServer(make_stub_device((FIXTURES / fixture).read_bytes()))
+    run_in_loop(server.start_server())
+
+    async def make_session() -> aiohttp.ClientSession:
+        return create_device_session()
+
+    session = run_in_loop(make_session())
+    api = WibeeeAPI(session, f'{server.host}:{server.port}', timedelta(seconds=5))
+    try:
+        values = benchmark(lambda: run_in_loop(api.async_fetch_values('WIBEEE')))
+        assert values['macAddr'] == '11:11:11:11:11:11'
+    finally:
+        run_in_loop(session.close())
+        run_in_loop(server.close())
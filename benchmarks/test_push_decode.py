@@ -0,0 +1,42 @@
+"""Measures the cost of decoding push requests into push data, as done by the Nest proxy for every request."""
+import json
+import urllib.parse
+from pathlib import Path
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+from custom_components.wibeee.nest import extract_json_body, extract_query_params
+
+FIXTURES = Path(__file__).parent.parent / 'tests' / 'fixtures'
+
+
+class BodyPayload(object):
+    """The smallest stand-in for a request's StreamReader, returning the whole body as its only chunk."""
+
+    def __init__(self, body: bytes):
+        self._chunks = [body]
+
+    async def readany(self) -> bytes:
+        return self._chunks.pop() if self._chunks else b''
+
+
+def test_extract_query_params(benchmark, run_in_loop):
+    push_data = json.loads((FIXTURES / 'test_nest_push_valid.json').read_text())
+    query = urllib.parse.urlencode(push_data)
+
+    decoded = benchmark.pedantic(lambda req: run_in_loop(extract_query_params(req)), rounds=2000,
+                                 setup=lambda: ((make_mocked_request('GET', f'/Wibeee/receiverLeap?{query}'),), {}))
+    assert decoded.push_data == push_data
+
+
+@pytest.mark.parametrize('fixture', ['test_nest_push_valid.json', 'test_nest_push_double_comma.json'])
+def test_extract_json_body(benchmark, run_in_loop, fixture):
+    body = (FIXTURES / fixture).read_bytes()
+
+    def make_request():
+        req = make_mocked_request('POST', '/Wibeee/receiverJSON', headers={'Content-Type': 'application/json'}, payload=BodyPayload(body))
+        return (req,), {}
+
+    decoded = benchmark.pedantic(lambda req: run_in_loop(extract_json_body(req)), setup=make_request, rounds=2000)
+    assert decoded.macAddr is not None
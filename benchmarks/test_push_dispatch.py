@@ -0,0 +1,25 @@
+"""Measures how many Nest pushes per second can be dispatched to a device's sensors."""
+import pytest
+from homeassistant.helpers.device_registry import DeviceInfo as HassDeviceInfo
+
+from custom_components.wibeee.sensor import WibeeeSensor, SensorType, Slot, _make_push_dispatcher
+
+
+def make_sensors(count: int) -> list[WibeeeSensor]:
+    device_info = HassDeviceInfo(identifiers={('wibeee', '001122334455')})
+    sensor_types = [SensorType(f'var{n}', f'x{n}_', f'Sensor {n}', 'W', 'power') for n in range(count)]
+    return [WibeeeSensor('001122334455', device_info, Slot.L1, st, None, None) for st in sensor_types]
+
+
+@pytest.mark.parametrize('sensor_count', [5, 50, 500])
+def test_push_dispatch(benchmark, monkeypatch, sensor_count):
+    monkeypatch.setattr(WibeeeSensor, 'async_schedule_update_ha_state', lambda self, force_refresh=False: None)
+
+    sensors = make_sensors(sensor_count)
+    dispatch_push_data = _make_push_dispatcher(sensors)
+    pushed_data = {'mac': '001122334455', 'ip': '127.0.0.1', 'soft': '3.3.614', 'model': 'WBM', 'time': '1740333343'} | {
+        s.nest_push_param: '123.45' for s in sensors
+    }
+
+    benchmark(dispatch_push_data, pushed_data)
+    assert {s.native_value for s in sensors} == {'123.45'}
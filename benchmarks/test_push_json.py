@@ -0,0 +1,31 @@
+"""
+Compares the cost of decoding JSON pushes, including malformed ones. The malformed frames are synthetic: a valid frame with
+the defects that Wibeee devices send at times inserted by hand.
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+from custom_components.wibeee.nest import decode_push_json
+
+FIXTURES = Path(__file__).parent.parent / 'tests' / 'fixtures'
+
+
+def decode_with_json_loads(body: str) -> tuple[dict, str]:
+    """The previous approach: parse, repair with string replacements and parse again, then re-serialize to forward."""
+    try:
+        push_data = json.loads(body)
+    except json.decoder.JSONDecodeError:
+        push_data = json.loads(body.replace(',,', ',').replace('""', '","'))
+
+    return push_data, json.dumps(push_data)
+
+
+@pytest.mark.parametrize('fixture', ['test_nest_push_valid.json', 'test_nest_push_double_comma.json', 'test_nest_push_missing_comma.json'])
+@pytest.mark.parametrize('decode', [decode_with_json_loads, decode_push_json], ids=['json.loads', 'decode_push_json'])
+def test_decode_push_json(benchmark, fixture, decode):
+    body = (FIXTURES / fixture).read_text()
+
+    push_data, _ = benchmark(decode, body)
+    assert push_data == json.loads((FIXTURES / 'test_nest_push_valid.json').read_text())
@@ -0,0 +1,26 @@
+"""
+Replays recorded push traffic through the Nest proxy and the sensors of many meters, reporting throughput and latency.
+
+This benchmark is report-only: it fails only if requests are lost or rejected. The throughput and latencies depend on the
+machine, so they have no thresholds and are recorded as properties in the JUnit XML report (`--junitxml`) instead.
+"""
+from pathlib import Path
+
+import pytest
+
+from .replay import load_recording
+
+RECORDING = Path(__file__).parent.parent / 'tests' / 'fixtures' / 'test_nest_push_recording.jsonl'
+
+
+@pytest.mark.parametrize('meters', [1, 10, 50])
+async def test_push_replay(push_replay, record_property, meters):
+    recording = load_recording(RECORDING)
+    report = await push_replay(recording, speed=10, meters=meters, throttle_sensors=0)
+
+    for name, value in report._asdict().items():
+        record_property(name, value)
+    record_property('requests_per_second', report.requests_per_second)
+
+    assert report.requests == len(recording) * meters
+    assert report.errors == 0
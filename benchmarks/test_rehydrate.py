@@ -0,0 +1,23 @@
+"""Measures the cost of restoring a meter's sensors from the registries at start-up, with many unrelated registry entries."""
+import pytest
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr, entity_registry as er
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.wibeee.sensor import rehydrate_saved_entities
+
+
+@pytest.mark.parametrize('other_entities', [0, 1000, 10000])
+async def test_rehydrate_saved_entities(hass: HomeAssistant, benchmark, setup_meters, other_entities):
+    [entry] = await setup_meters()
+    sensor_count = len(hass.states.async_entity_ids('sensor'))
+
+    other_entry = MockConfigEntry(domain='other')
+    other_entry.add_to_hass(hass)
+    device_registry, entity_registry = dr.async_get(hass), er.async_get(hass)
+    for n in range(other_entities):
+        device = device_registry.async_get_or_create(config_entry_id=other_entry.entry_id, identifiers={('other', str(n // 10))})
+        entity_registry.async_get_or_create('sensor', 'other', f'other_{n}', config_entry=other_entry, device_id=device.id)
+
+    sensors = benchmark(rehydrate_saved_entities, hass, entry, None, None, None)
+    assert len(sensors) == sensor_count
@@ -0,0 +1,25 @@
+"""Measures the cost of the periodic check for sensors that have stopped receiving push data."""
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from custom_components.wibeee.sensor import setup_repairs
+
+
+@pytest.mark.parametrize('stale', [False, True], ids=['fresh', 'stale'])
+async def test_check_for_stale_states(hass: HomeAssistant, benchmark, setup_meters, stale):
+    [entry] = await setup_meters()
+    sensors = [hass.data['sensor'].get_entity(entity_id) for entity_id in hass.states.async_entity_ids('sensor')]
+
+    with patch('custom_components.wibeee.sensor.async_track_time_interval') as mock_track_time_interval:
+        setup_repairs(hass, entry, sensors)
+        check_for_stale_states = mock_track_time_interval.call_args.args[1]
+
+    now = dt_util.utcnow() + (timedelta(minutes=10) if stale else timedelta())
+    benchmark(check_for_stale_states, now)
+    await hass.async_block_till_done()
+
+    assert all(not s.available for s in sensors) == stale
@@ -0,0 +1,67 @@
+"""
+Measures the event loop time taken by one push frame from a 3-phase meter, writing state per sensor or batched. Both
+variants go through the same dispatcher and write every sensor's state once per frame, only the scheduling differs.
+"""
+import itertools
+from unittest.mock import patch
+
+import pytest
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import HomeAssistant, callback
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.wibeee.api import WibeeeAPI
+from custom_components.wibeee.sensor import DeviceInfo, KNOWN_SENSORS, StateWriteBatcher, _make_push_dispatcher
+from tests.test_helpers import build_values
+
+
+@pytest.mark.parametrize('batched', [False, True], ids=['per_sensor', 'batched'])
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_push_frame_state_writes(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant, benchmark, batched):
+    dev = DeviceInfo('Wibeee', 'xxxxxx3pccdd', '7.6.5', 'WBT', '4.3.2.1')
+    mock_async_fetch_device_info.return_value = dev
+    mock_async_fetch_values.return_value = build_values(dev, {
+        f'{s.poll_var_prefix}{slot.value.poll_var_suffix}': '123' for s in KNOWN_SENSORS for slot in s.slots
+    })
+
+    entry = MockConfigEntry(domain='wibeee', data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+                            options={'throttle_sensors': 0}, version=5)
+    entry.add_to_hass(hass)
+    await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    sensors = [hass.data['sensor'].get_entity(entity_id) for entity_id in hass.states.async_entity_ids('sensor')]
+    state_writer = StateWriteBatcher(hass) if batched else _PerSensorWriter()
+    for s in sensors:
+        s.state_writer = state_writer
+
+    dispatch_push_data = _make_push_dispatcher(sensors, state_writer)
+    # alternate between two frames so that every frame changes every sensor's state
+    next_frame = itertools.cycle([{s.nest_push_param: str(n) for s in sensors} for n in range(2)]).__next__
+
+    def push_frame():
+        dispatch_push_data(next_frame())
+        state_writer.flush()
+
+    benchmark(push_frame)
+    await hass.async_block_till_done()
+
+    state_changes = []
+    hass.bus.async_listen(EVENT_STATE_CHANGED, callback(lambda event: state_changes.append(event)))
+    push_frame()
+    await hass.async_block_till_done()
+    assert len(state_changes) == len(sensors)
+
+
+class _PerSensorWriter(object):
+    """Writes each sensor's state as soon as it's updated, as sensors did before StateWriteBatcher."""
+
+    def start_frame(self) -> None:
+        pass
+
+    def schedule_write(self, sensor) -> None:
+        sensor.async_write_ha_state()
+
+    def flush(self) -> None:
+        pass
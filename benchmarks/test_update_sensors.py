@@ -0,0 +1,20 @@
+"""Measures the cost of fanning out one push frame per meter to the sensors of 1, 10 and 50 3-phase meters."""
+import pytest
+
+from custom_components.wibeee.sensor import WibeeeSensor, update_sensors
+from .helpers import make_meter_sensors
+
+
+@pytest.mark.parametrize('meters', [1, 10, 50])
+def test_update_sensors(benchmark, monkeypatch, meters):
+    monkeypatch.setattr(WibeeeSensor, 'async_schedule_update_ha_state', lambda self, force_refresh=False: None)
+
+    meter_sensors = [make_meter_sensors(f'{0x02a000000000 + n:012x}') for n in range(meters)]
+    frame = {s.nest_push_param: 123.45 for s in meter_sensors[0]}
+
+    def push_frames():
+        for sensors in meter_sensors:
+            update_sensors(sensors, 'Nest push', lambda s: s.nest_push_param, frame)
+
+    benchmark(push_frames)
+    assert {s.native_value for sensors in meter_sensors for s in sensors} == {123.45}
@@ -0,0 +1,23 @@
+"""Compares the cost of parsing values.xml responses from 1-phase and 3-phase meters."""
+from pathlib import Path
+
+import pytest
+import xmltodict
+
+from custom_components.wibeee.util import parse_values_xml
+
+FIXTURES = Path(__file__).parent.parent / 'tests' / 'fixtures'
+
+
+def parse_with_xmltodict(xml_text: bytes) -> dict:
+    values = xmltodict.parse(xml_text.decode())
+    return {var['id']: var['value'] for var in values['values']['variable']}
+
+
+@pytest.mark.parametrize('fixture', ['test_api_values_1phase.xml', 'test_api_values.xml'])
+@pytest.mark.parametrize('parse', [parse_with_xmltodict, parse_values_xml], ids=['xmltodict', 'ValuesXmlParser'])
+def test_parse_values_xml(benchmark, fixture, parse):
+    xml_text = (FIXTURES / fixture).read_bytes()
+
+    values = benchmark(parse, xml_text)
+    assert values == parse_with_xmltodict(xml_text)
@@ -7,19 +7,30 @@ import logging
 import os
 import re
 
+import homeassistant.helpers.config_validation as cv
 import homeassistant.helpers.entity_registry as er
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import Platform
+from homeassistant.const import CONF_HOST, Platform
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.typing import ConfigType
 
-from .api import WibeeeAPI
+from .api import WibeeeAPI, async_close_device_session
 from .config_flow import validate_input
 from .const import DOMAIN, CONF_NEST_UPSTREAM, NEST_DEFAULT_UPSTREAM, CONF_MAC_ADDRESS, CONF_WIBEEE_ID, NEST_NULL_UPSTREAM, CONF_THROTTLE
+from .services import async_setup_services
 
 _LOGGER = logging.getLogger(__name__)
 
 PLATFORMS = [Platform.SENSOR]
 
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the Wibeee services."""
+    async_setup_services(hass)
+    return True
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up platform from a ConfigEntry."""
@@ -37,6 +48,8 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     _LOGGER.debug(f"Unloading sensor entry for {entry.title} (unique_id={entry.unique_id})")
     unload_ok = await hass.config_entries.async_forward_entry_unload(entry, "sensor")
+    # the entry may be reloaded with a different host (or pool options), don't leave the old connections open.
+    await async_close_device_session(hass, entry.data[CONF_HOST])
     _LOGGER.info(f"Unloaded config entry '{entry.title}' (unique_id={entry.unique_id})")
     return unload_ok
 
@@ -5,11 +5,13 @@ from typing import NamedTuple, Optional, Dict
 from urllib.parse import quote_plus
 
 import aiohttp
-import xmltodict
 from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import HomeAssistant, Event, callback, CALLBACK_TYPE
 from homeassistant.helpers.typing import StateType
 
-from .util import scrub_values_xml
+from .const import DOMAIN, DEFAULT_DEVICE_CONNECTIONS, DEFAULT_DEVICE_KEEPALIVE, DEFAULT_MAX_URL_LENGTH
+from .util import ValuesXmlParser
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -21,6 +23,9 @@ _VALUES_SCRUB_KEYS = ['securKey', 'ssid']
 type WibeeeID = str
 """The id of a Wibeee device."""
 
+_DATA_DEVICE_SESSIONS = f'{DOMAIN}_device_sessions'
+"""Key for the per-host sessions in hass.data."""
+
 
 class DeviceInfo(NamedTuple):
     id: WibeeeID
@@ -35,30 +40,82 @@ class DeviceInfo(NamedTuple):
     "IP address"
 
 
+class _Redacted(object):
+    """Renders values with sensitive keys redacted. Formatting is deferred until the log record is actually emitted."""
+    __slots__ = ('values', 'keys')
+
+    def __init__(self, values: dict[str, str | None], keys: list[str]):
+        self.values = values
+        self.keys = keys
+
+    def __str__(self) -> str:
+        return str(async_redact_data(self.values, self.keys))
+
+
+def create_device_session(max_connections: int = DEFAULT_DEVICE_CONNECTIONS,
+                          keepalive_timeout: timedelta = DEFAULT_DEVICE_KEEPALIVE) -> aiohttp.ClientSession:
+    """
+    Creates a session that keeps a small pool of persistent connections to a single Wibeee device. Requests in excess of
+    `max_connections` wait for a connection to be released instead of opening more sockets than the device can handle.
+    """
+    connector = aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=keepalive_timeout.total_seconds())
+    return aiohttp.ClientSession(connector=connector)
+
+
+@callback
+def async_get_device_session(hass: HomeAssistant, host: str, max_connections: int = DEFAULT_DEVICE_CONNECTIONS,
+                             keepalive_timeout: timedelta = DEFAULT_DEVICE_KEEPALIVE) -> aiohttp.ClientSession:
+    """
+    Returns the session shared by all requests to `host`, creating it if needed. Sessions are closed by
+    `async_close_device_session`, or when HA closes.
+    """
+    sessions: dict[str, tuple[aiohttp.ClientSession, CALLBACK_TYPE]] = hass.data.setdefault(_DATA_DEVICE_SESSIONS, {})
+    if host not in sessions:
+        session = create_device_session(max_connections, keepalive_timeout)
+
+        async def close_session(_: Event) -> None:
+            sessions.pop(host, None)
+            await session.close()
+
+        sessions[host] = (session, hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, close_session))
+
+    return sessions[host][0]
+
+
+async def async_close_device_session(hass: HomeAssistant, host: str) -> None:
+    """Closes the session shared by all requests to `host`, if there is one."""
+    if (session_entry := hass.data.get(_DATA_DEVICE_SESSIONS, {}).pop(host, None)) is not None:
+        session, unsubscribe_close = session_entry
+        unsubscribe_close()
+        await session.close()
+
+
 class WibeeeAPI(object):
     """Gets the latest data from Wibeee device."""
 
-    def __init__(self, session: aiohttp.ClientSession, host: str, timeout: timedelta):
+    def __init__(self, session: aiohttp.ClientSession, host: str, timeout: timedelta, max_url_length: int = DEFAULT_MAX_URL_LENGTH):
         """Initialize the data object."""
         self.session = session
         self.host = host
         self.timeout = timeout
+        self.max_url_length = max_url_length
         self.min_wait = timedelta(milliseconds=100)
         self.max_wait = min(timedelta(seconds=5), timeout)
         _LOGGER.info("Initializing WibeeeAPI with host: %s, timeout %s, max_wait: %s", host, self.timeout, self.max_wait)
 
     async def async_fetch_values(self, wibeee_id: WibeeeID, var_names: list[str] = None, retries: int = 0) -> Dict[str, any]:
         """Fetches the values from Wibeee as a dict, optionally retries"""
+        url = f'http://{self.host}/services/user/values.xml?'
         if var_names:
             var_ids = [f"{quote_plus(wibeee_id)}.{quote_plus(var)}" for var in var_names]
-            query = f'var={"&".join(var_ids)}'
+            queries = [f'var={"&".join(chunk)}' for chunk in _chunk_by_length(var_ids, self.max_url_length - len(url) - len('var='))]
         else:
-            query = f'id={quote_plus(wibeee_id)}'
-
-        values = await self.async_fetch_url(f'http://{self.host}/services/user/values.xml?{query}', retries, scrub_keys=_VALUES_SCRUB_KEYS)
+            queries = [f'id={quote_plus(wibeee_id)}']
 
         # <values><variable><id>macAddr</id><value>11:11:11:11:11:11</value></variable></values>
-        values_vars = {var['id']: var['value'] for var in values['values']['variable']}
+        values_vars = {}
+        for query in queries:
+            values_vars.update(await self.async_fetch_url(f'{url}{query}', retries, scrub_keys=_VALUES_SCRUB_KEYS))
 
         # attempt to scrub WiFi secrets before they make it into logs, etc.
         return async_redact_data(values_vars, _VALUES_SCRUB_KEYS)
@@ -66,7 +123,7 @@ class WibeeeAPI(object):
     async def async_fetch_device_info(self, retries: int = 0) -> Optional[DeviceInfo]:
         # <devices><id>WIBEEE</id></devices>
         devices = await self.async_fetch_url(f'http://{self.host}/services/user/devices.xml', retries)
-        wibeee_id = devices['devices']['id']
+        wibeee_id = devices['id']
 
         var_names = ['macAddr', 'softVersion', 'model', 'ipAddr']
         device_vars = await self.async_fetch_values(wibeee_id, var_names, retries)
@@ -79,7 +136,8 @@ class WibeeeAPI(object):
             device_vars['ipAddr'],
         ) if set(var_names) <= set(device_vars.keys()) else None
 
-    async def async_fetch_url(self, url: str, retries: int = 0, scrub_keys: list[str] = []):
+    async def async_fetch_url(self, url: str, retries: int = 0, scrub_keys: list[str] = []) -> dict[str, str | None]:
+        """Fetches a Wibeee XML document, returning its variables as a flat dict (or an empty dict on failure)."""
         async def fetch_with_retries(try_n):
             if try_n > 0:
                 wait = min(pow(2, try_n) * self.min_wait.total_seconds(), self.max_wait.total_seconds())
@@ -87,22 +145,24 @@ class WibeeeAPI(object):
                 await asyncio.sleep(wait)
 
             try:
-                resp = await self.session.get(url, timeout=self.timeout.total_seconds())
-                if resp.status != 200:
-                    raise aiohttp.ClientResponseError(
-                        resp.request_info,
-                        resp.history,
-                        status=resp.status,
-                        message=resp.reason,
-                        headers=resp.headers,
-                    )
-
-                xml_data = await resp.text()
-                if _LOGGER.isEnabledFor(logging.DEBUG):
-                    _LOGGER.debug("RAW Response from %s: %s)", url, scrub_values_xml(scrub_keys, await resp.read()))
-
-                xml_as_dict = xmltodict.parse(xml_data)
-                return xml_as_dict
+                # release the connection back to the pool as soon as the body has been read.
+                async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=self.timeout.total_seconds())) as resp:
+                    if resp.status != 200:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info,
+                            resp.history,
+                            status=resp.status,
+                            message=resp.reason,
+                            headers=resp.headers,
+                        )
+
+                    parser = ValuesXmlParser()
+                    async for chunk in resp.content.iter_any():
+                        parser.feed(chunk)
+
+                values = parser.close()
+                _LOGGER.debug("Response from %s: %s", url, _Redacted(values, scrub_keys))
+                return values
 
             except Exception as exc:
                 if try_n == retries:
@@ -114,3 +174,18 @@ class WibeeeAPI(object):
                     return await fetch_with_retries(try_n + 1)
 
         return await fetch_with_retries(0)
+
+
+def _chunk_by_length(var_ids: list[str], max_length: int) -> list[list[str]]:
+    """Splits up `var_ids` so that each chunk is at most `max_length` long when joined by '&' (but never empty)."""
+    chunks: list[list[str]] = [[]]
+    chunk_length = -1
+    for var_id in var_ids:
+        if chunks[-1] and chunk_length + 1 + len(var_id) > max_length:
+            chunks.append([])
+            chunk_length = -1
+
+        chunks[-1].append(var_id)
+        chunk_length += 1 + len(var_id)
+
+    return chunks
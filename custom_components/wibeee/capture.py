@@ -0,0 +1,195 @@
+"""
+Capture of every push frame to binary files, for power-quality investigations that need more than the recorder keeps.
+
+Each file starts with a header describing its columns, followed by fixed-width little-endian records of a float64 POSIX
+timestamp and a float32 per column (NaN when a frame didn't include the variable). Records are only ever appended, so
+files can be memory-mapped and sliced by time with a binary search. For that, timestamps never decrease: if the wall
+clock steps back, frames are recorded with the latest timestamp until the clock catches up. Run this module to print a
+time range as CSV:
+
+    python -m custom_components.wibeee.capture <file> [--start TIMESTAMP] [--end TIMESTAMP]
+"""
+import argparse
+import asyncio
+import logging
+import math
+import mmap
+import struct
+import sys
+import time
+from collections.abc import Iterator, Mapping, Sequence
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from .const import CAPTURE_FLUSH_INTERVAL, CAPTURE_MAX_FILE_SIZE, CAPTURE_MAX_FILES
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'WBEECAP1'
+_HEADER = struct.Struct('<8sII')
+"""Magic, total header length (a multiple of 8) and column count, followed by the newline-separated column names."""
+
+CAPTURE_SUFFIX = '.wbcap'
+
+
+def _record_struct(column_count: int) -> struct.Struct:
+    return struct.Struct(f'<d{column_count}f')
+
+
+def encode_header(column_names: Sequence[str]) -> bytes:
+    names = '\n'.join(column_names).encode()
+    header_len = -(-(_HEADER.size + len(names)) // 8) * 8
+    return _HEADER.pack(MAGIC, header_len, len(column_names)) + names.ljust(header_len - _HEADER.size, b'\0')
+
+
+class PushCapture(object):
+    """
+    Appends push frames to rotating capture files in `directory`. Records are buffered in memory and written from the
+    executor at most every `flush_interval` seconds. A new file is started when the current one reaches `max_file_size`,
+    and only the newest `max_files` are kept.
+    """
+
+    def __init__(self, directory: Path, columns: Mapping[str, str], flush_interval: float = CAPTURE_FLUSH_INTERVAL,
+                 max_file_size: int = CAPTURE_MAX_FILE_SIZE, max_files: int = CAPTURE_MAX_FILES):
+        """`columns` maps the push param of each variable to the name of its column."""
+        self.directory = directory
+        self.push_params = tuple(columns.keys())
+        self.header = encode_header(tuple(columns.values()))
+        self.flush_interval = flush_interval
+        self.max_file_size = max_file_size
+        self.max_files = max_files
+        self.records = 0
+        self._record = _record_struct(len(self.push_params))
+        self._pending = bytearray()
+        self._flushed_at = time.monotonic()
+        self._path: Path | None = None
+        self._size = 0
+        self._flush_task: asyncio.Future | None = None
+        self._last_timestamp = -math.inf
+
+    def append(self, timestamp: float, push_data: Mapping[str, Any]) -> None:
+        # keep the records sorted for CaptureReader's binary search, even if the clock was set back.
+        timestamp = self._last_timestamp = max(timestamp, self._last_timestamp)
+        values = (push_data.get(p) for p in self.push_params)
+        self._pending += self._record.pack(timestamp, *(v if isinstance(v, (int, float, Decimal)) else math.nan for v in values))
+        self.records += 1
+
+        if time.monotonic() - self._flushed_at >= self.flush_interval and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = self._async_flush()
+
+    async def async_close(self) -> None:
+        # write errors are logged by _write_done.
+        if self._flush_task is not None:
+            await asyncio.wait([self._flush_task])
+        await asyncio.wait([self._async_flush()])
+
+    def _async_flush(self) -> asyncio.Future:
+        data, self._pending = bytes(self._pending), bytearray()
+        self._flushed_at = time.monotonic()
+        future = asyncio.get_running_loop().run_in_executor(None, self.write, data)
+        future.add_done_callback(self._write_done)
+        return future
+
+    def _write_done(self, future: asyncio.Future) -> None:
+        if not future.cancelled() and (error := future.exception()) is not None:
+            LOGGER.error('Failed to write push capture to %s: %s', self.directory, error)
+
+    def write(self, data: bytes) -> None:
+        """Writes records to the current capture file, rotating it if needed. Blocking, must be called from the executor."""
+        if not data:
+            return
+
+        if self._path is None or self._size + len(data) > self.max_file_size:
+            self._rotate()
+
+        with open(self._path, 'ab') as f:
+            f.write(data)
+        self._size += len(data)
+
+    def _rotate(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._path = self.directory / f'{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}{CAPTURE_SUFFIX}'
+        self._path.write_bytes(self.header)
+        self._size = len(self.header)
+        LOGGER.debug('Capturing push data to %s', self._path)
+
+        for old_path in sorted(self.directory.glob(f'*{CAPTURE_SUFFIX}'))[:-self.max_files]:
+            LOGGER.debug('Deleting old capture %s', old_path)
+            old_path.unlink()
+
+
+class CaptureSlice(NamedTuple):
+    timestamps: list[float]
+    columns: dict[str, list[float]]
+
+
+class CaptureReader(object):
+    """Reads a capture file through a memory map, so that slicing a time range doesn't load the whole file."""
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._header_len, column_count = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'Not a Wibeee capture file: {path}')
+
+        self.column_names = tuple(bytes(self._mmap[_HEADER.size:self._header_len]).rstrip(b'\0').decode().split('\n'))[:column_count]
+        self._record = _record_struct(column_count)
+
+    def __enter__(self) -> 'CaptureReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        # a partially written record at the end is ignored
+        return (len(self._mmap) - self._header_len) // self._record.size
+
+    def timestamp(self, index: int) -> float:
+        return struct.unpack_from('<d', self._mmap, self._header_len + index * self._record.size)[0]
+
+    def records(self, start: float = -math.inf, end: float = math.inf) -> Iterator[tuple[float, ...]]:
+        """Yields the records between `start` and `end` (inclusive), found with a binary search on their timestamps."""
+        first, last = self._bisect(start, lambda ts, t: ts < t), self._bisect(end, lambda ts, t: ts <= t)
+        for index in range(first, last):
+            yield self._record.unpack_from(self._mmap, self._header_len + index * self._record.size)
+
+    def read(self, start: float = -math.inf, end: float = math.inf) -> CaptureSlice:
+        rows = list(self.records(start, end))
+        return CaptureSlice([row[0] for row in rows], {name: [row[n + 1] for row in rows] for n, name in enumerate(self.column_names)})
+
+    def _bisect(self, t: float, before: Any) -> int:
+        """Index of the first record for which `before(timestamp, t)` is false."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if before(self.timestamp(mid), t):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Prints the records of a Wibeee capture file as CSV.')
+    parser.add_argument('path', type=Path)
+    parser.add_argument('--start', type=float, default=-math.inf, help='POSIX timestamp of the first record to print')
+    parser.add_argument('--end', type=float, default=math.inf, help='POSIX timestamp of the last record to print')
+    args = parser.parse_args(argv)
+
+    with CaptureReader(args.path) as reader:
+        print(','.join(('timestamp',) + reader.column_names))
+        for record in reader.records(args.start, args.end):
+            print(','.join(['%.3f' % record[0]] + ['' if math.isnan(v) else '%g' % v for v in record[1:]]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -9,18 +9,26 @@ from homeassistant import config_entries, exceptions
 from homeassistant.const import (CONF_HOST)
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import AbortFlow
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.device_registry import format_mac
 from homeassistant.helpers.selector import SelectSelectorConfig, SelectSelectorMode, SelectSelector, NumberSelector, NumberSelectorConfig, \
-    NumberSelectorMode
+    NumberSelectorMode, BooleanSelector
 
-from .api import WibeeeAPI
+from .api import WibeeeAPI, create_device_session
 from .const import (
     DOMAIN,
     CONF_MAC_ADDRESS,
     CONF_NEST_UPSTREAM,
+    CONF_NEST_ASYNC_FORWARD,
+    CONF_NEST_SPOOL_SIZE,
+    CONF_PUSH_INTERVAL,
+    CONF_CAPTURE_PUSH,
+    CONF_DEVICE_CONNECTIONS,
+    CONF_DEVICE_KEEPALIVE,
+    CONF_POLL_FALLBACK,
     CONF_THROTTLE,
+    CONF_THROTTLE_AGGREGATE,
     CONF_WIBEEE_ID,
+    CONF_WRITE_ON_CHANGE,
     NEST_ALL_UPSTREAMS,
     NEST_NULL_UPSTREAM,
 )
@@ -31,12 +39,13 @@ _LOGGER = logging.getLogger(__name__)
 
 async def validate_input(hass: HomeAssistant, user_input: dict) -> [str, str, dict[str, Any]]:
     """Validate the user input allows us to connect. """
-    session = async_get_clientsession(hass)
-    api = WibeeeAPI(session, user_input[CONF_HOST], timeout=timedelta(seconds=1))
-    try:
-        device = await api.async_fetch_device_info(retries=5)
-    except Exception as e:
-        raise NoDeviceInfo from e
+    # hosts tried here may never be set up, so their session is closed instead of being shared.
+    async with create_device_session() as session:
+        api = WibeeeAPI(session, user_input[CONF_HOST], timeout=timedelta(seconds=1))
+        try:
+            device = await api.async_fetch_device_info(retries=5)
+        except Exception as e:
+            raise NoDeviceInfo from e
 
     mac_addr = format_mac(device.macAddr)
     unique_id = mac_addr
@@ -109,9 +118,36 @@ class WibeeeOptionsFlowHandler(config_entries.OptionsFlow):
                 CONF_NEST_UPSTREAM,
                 default=self.options.get(CONF_NEST_UPSTREAM, NEST_NULL_UPSTREAM)
             ): SelectSelector(SelectSelectorConfig(options=NEST_ALL_UPSTREAMS, mode=SelectSelectorMode.DROPDOWN)),
+            vol.Optional(
+                CONF_NEST_ASYNC_FORWARD,
+            ): BooleanSelector(),
+            vol.Optional(
+                CONF_NEST_SPOOL_SIZE,
+            ): NumberSelector(NumberSelectorConfig(min=1, max=1024, unit_of_measurement="MB", mode=NumberSelectorMode.BOX)),
+            vol.Optional(
+                CONF_PUSH_INTERVAL,
+            ): NumberSelector(NumberSelectorConfig(min=1, max=300, unit_of_measurement="seconds", mode=NumberSelectorMode.BOX)),
             vol.Optional(
                 CONF_THROTTLE,
             ): NumberSelector(NumberSelectorConfig(min=0, max=300, unit_of_measurement="seconds", mode=NumberSelectorMode.BOX)),
+            vol.Optional(
+                CONF_THROTTLE_AGGREGATE,
+            ): BooleanSelector(),
+            vol.Optional(
+                CONF_WRITE_ON_CHANGE,
+            ): BooleanSelector(),
+            vol.Optional(
+                CONF_POLL_FALLBACK,
+            ): NumberSelector(NumberSelectorConfig(min=10, max=3600, unit_of_measurement="seconds", mode=NumberSelectorMode.BOX)),
+            vol.Optional(
+                CONF_DEVICE_CONNECTIONS,
+            ): NumberSelector(NumberSelectorConfig(min=1, max=8, mode=NumberSelectorMode.BOX)),
+            vol.Optional(
+                CONF_DEVICE_KEEPALIVE,
+            ): NumberSelector(NumberSelectorConfig(min=1, max=300, unit_of_measurement="seconds", mode=NumberSelectorMode.BOX)),
+            vol.Optional(
+                CONF_CAPTURE_PUSH,
+            ): BooleanSelector(),
         }), self.options)
 
         if user_input is not None:
@@ -7,8 +7,57 @@ NEST_DEFAULT_UPSTREAM = 'http://nest-ingest.wibeee.com'
 
 DEFAULT_TIMEOUT = timedelta(seconds=10)
 
+CONF_DEVICE_CONNECTIONS = 'device_connections'
+"""Maximum number of concurrent connections (and therefore requests) to the device."""
+
+DEFAULT_DEVICE_CONNECTIONS = 2
+"""Maximum number of concurrent connections (and therefore requests) to a single Wibeee device."""
+
+CONF_DEVICE_KEEPALIVE = 'device_keepalive'
+"""How long in seconds idle connections to the device are kept open for reuse."""
+
+DEFAULT_DEVICE_KEEPALIVE = timedelta(seconds=10)
+"""How long idle connections to a Wibeee device are kept open for reuse."""
+
+DEFAULT_MAX_URL_LENGTH = 512
+"""
+Longest URL sent to a Wibeee device, requests for more variables than fit in the URL are split up. The firmware doesn't
+document a limit and none has been measured, so this is a conservative value that still fits most variables in one
+request: polling every sensor of a three-phase device (a URL of about 600 characters) takes two requests.
+"""
+
 CONF_NEST_UPSTREAM = 'nest_upstream'
 
+CONF_NEST_ASYNC_FORWARD = 'nest_async_forward'
+"""Reply to the device immediately and forward push data to the upstream in the background."""
+
+NEST_FORWARD_QUEUE_SIZE = 100
+"""Maximum number of push requests waiting to be forwarded upstream. The oldest ones are dropped when full."""
+
+NEST_FORWARD_WORKERS = 2
+"""Number of tasks forwarding queued push requests upstream."""
+
+NEST_FORWARD_TIMEOUT = timedelta(seconds=30)
+"""Timeout for requests forwarded upstream in the background."""
+
+NEST_UPSTREAM_KEEPALIVE = timedelta(seconds=5)
+"""How long idle connections to the upstream are kept open for reuse, shorter than the Wibeee Cloud's idle timeout."""
+
+CONF_NEST_SPOOL_SIZE = 'nest_spool_size'
+"""Maximum size in MB of the on-disk spool for push data that could not be forwarded upstream (disabled if not set)."""
+
+NEST_SPOOL_SEGMENT_SIZE = 1024 * 1024
+"""Size in bytes at which the spool starts a new segment file."""
+
+NEST_SPOOL_REPLAY_RATE = 5
+"""Maximum number of spooled requests replayed per second once the upstream is back up."""
+
+CONF_PUSH_INTERVAL = 'push_interval'
+"""Seconds between pushes requested from the device in the proxy's replies (device's default rate if not set)."""
+
+NEST_DEFAULT_GRADIENT = 7
+"""Value of the WGRADIENT parameter in replies to devices that have no push interval set."""
+
 CONF_MAC_ADDRESS = 'mac_address'
 """Device's MAC address."""
 
@@ -21,6 +70,39 @@ CONF_THROTTLE = 'throttle_sensors'
 DEFAULT_THROTTLE = timedelta(seconds=5)
 """Default minimum interval between sensor updates."""
 
+CONF_THROTTLE_AGGREGATE = 'throttle_aggregate'
+"""Publish the mean of measurements received during the throttle interval, instead of the latest one."""
+
+CONF_WRITE_ON_CHANGE = 'write_on_change'
+"""Only write sensor states when their value changes by more than the sensor type's deadband."""
+
+WRITE_ON_CHANGE_MAX_AGE = timedelta(seconds=60)
+"""Maximum interval between writes of an unchanged sensor state, keeps `last_reported` fresh for the stale state check."""
+
+CONF_POLL_FALLBACK = 'poll_fallback'
+"""Interval for polling values.xml while no push data is being received (disabled if not set)."""
+
+SAMPLE_BUFFER_SIZE = 15 * 60
+"""Number of push frames kept in memory for each device, 15 minutes at the usual rate of one frame per second."""
+
+FRAME_TRACE_HISTORY = 50
+"""Number of push frame traces kept for each device, shown in the diagnostics."""
+
+PROFILE_SAMPLE_INTERVAL = 0.005
+"""Seconds between stack samples taken by the `profile` service."""
+
+CONF_CAPTURE_PUSH = 'capture_push'
+"""Record every push frame to binary capture files in the config directory."""
+
+CAPTURE_FLUSH_INTERVAL = 10
+"""Seconds between writes of buffered push frames to the capture file."""
+
+CAPTURE_MAX_FILE_SIZE = 16 * 1024 * 1024
+"""Size in bytes at which a new capture file is started, about a day of frames for a three-phase device."""
+
+CAPTURE_MAX_FILES = 30
+"""Number of capture files kept for each device, older files are deleted."""
+
 
 def _format_options(upstreams: list[tuple[str, str]]) -> list[SelectOptionDict]:
     return [SelectOptionDict(label=f'{cloud} ({url})', value=url) for cloud, url in upstreams]
@@ -0,0 +1,29 @@
+"""Diagnostics support for Wibeee."""
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_HOST
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_MAC_ADDRESS
+from .nest import get_nest_proxy
+from .tracing import DATA_FRAME_TRACERS
+
+TO_REDACT = {CONF_HOST, CONF_MAC_ADDRESS, 'mac', 'macAddr', 'ssid', 'securKey', 'title', 'unique_id'}
+"""Keys whose values identify the device or its network."""
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """
+    Return diagnostics for a Wibeee config entry, including the timing of its recent push frames and the queue metrics of
+    the Nest proxy's background forwarding.
+    """
+    frame_tracer = hass.data.get(DATA_FRAME_TRACERS, {}).get(entry.entry_id)
+    upstream_forwarder = (await get_nest_proxy(hass)).upstream_forwarder
+
+    return async_redact_data({
+        'entry': entry.as_dict(),
+        'push_frame_timing': frame_tracer.as_dict() if frame_tracer is not None else None,
+        'upstream_forwarder': upstream_forwarder.metrics if upstream_forwarder is not None else None,
+    }, TO_REDACT)
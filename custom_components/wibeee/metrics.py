@@ -0,0 +1,123 @@
+"""
+Metrics of the Nest proxy, served at `/metrics` in the Prometheus text exposition format.
+
+Metrics are only updated from the event loop that runs the proxy, so they are plain ints and lists that are incremented
+without any locking. Nothing is formatted until the metrics are scraped.
+"""
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Iterable, Mapping
+from typing import Any, NamedTuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Upper bounds in seconds of the latency histogram buckets."""
+
+
+class Histogram(object):
+    """Counts observations into fixed buckets, keeping their sum. Bucket counts are only made cumulative when rendered."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def as_dict(self) -> dict[str, Any]:
+        """Returns the cumulative count of each bucket by its upper bound, with the sum and count of all observations."""
+        cumulative = 0
+        buckets = {}
+        for le, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            buckets['+Inf' if le == float('inf') else repr(le)] = cumulative
+        return {'buckets': buckets, 'sum': self.sum, 'count': cumulative}
+
+    def samples(self, name: str, labels: Mapping[str, str]) -> Iterable[str]:
+        histogram = self.as_dict()
+        for le, count in histogram['buckets'].items():
+            yield f'{name}_bucket{_labels({**labels, "le": le})} {count}'
+        yield f'{name}_sum{_labels(labels)} {self.sum!r}'
+        yield f'{name}_count{_labels(labels)} {histogram["count"]}'
+
+
+class Metric(NamedTuple):
+    """A single value kept outside of ProxyMetrics, e.g. by the upstream forwarder, that is rendered with the metrics."""
+    name: str
+    metric_type: str
+    """'counter' or 'gauge'."""
+    help_text: str
+    value: int | float
+
+
+class ProxyMetrics(object):
+    """Counters and histograms of the requests handled by the Nest proxy and the requests it forwards upstream."""
+
+    def __init__(self):
+        self.pushes: Counter[tuple[str, str]] = Counter()
+        """Push requests by MAC address and route."""
+        self.unknown_devices: Counter[str] = Counter()
+        """Requests from devices that are not configured, by route."""
+        self.decode_failures: Counter[str] = Counter()
+        """Requests whose push data could not be decoded, by route."""
+        self.json_repairs: Counter[str] = Counter()
+        """Requests with malformed JSON that was repaired, by route."""
+        self.upstream_responses: Counter[str] = Counter()
+        """Upstream responses by status code, or 'error' when no response was received."""
+        self.upstream_latency = Histogram()
+        self.handler_latency: dict[str, Histogram] = {}
+        """Handler latency by route."""
+
+    def observe_handler(self, route: str, latency: float) -> None:
+        if (histogram := self.handler_latency.get(route)) is None:
+            histogram = self.handler_latency[route] = Histogram()
+        histogram.observe(latency)
+
+    def observe_upstream(self, status: int | None, latency: float) -> None:
+        self.upstream_responses['error' if status is None else str(status)] += 1
+        self.upstream_latency.observe(latency)
+
+    def render(self, extra_metrics: Iterable[Metric] = ()) -> str:
+        """Renders all metrics in the text exposition format, followed by `extra_metrics`."""
+        lines = []
+
+        def metric(name: str, metric_type: str, help_text: str, samples: Iterable[str]) -> None:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(samples)
+
+        metric('wibeee_nest_pushes_total', 'counter', 'Push requests received from configured devices.',
+               (f'wibeee_nest_pushes_total{_labels({"mac": mac, "route": route})} {n}' for (mac, route), n in sorted(self.pushes.items())))
+        metric('wibeee_nest_unknown_device_total', 'counter', 'Push requests from unknown devices, answered with 404.',
+               _counter_samples('wibeee_nest_unknown_device_total', 'route', self.unknown_devices))
+        metric('wibeee_nest_decode_failures_total', 'counter', 'Push requests whose data could not be decoded.',
+               _counter_samples('wibeee_nest_decode_failures_total', 'route', self.decode_failures))
+        metric('wibeee_nest_json_repairs_total', 'counter', 'Push requests with malformed JSON that was repaired.',
+               _counter_samples('wibeee_nest_json_repairs_total', 'route', self.json_repairs))
+        metric('wibeee_nest_upstream_responses_total', 'counter', 'Responses to requests forwarded upstream, by status code.',
+               _counter_samples('wibeee_nest_upstream_responses_total', 'status', self.upstream_responses))
+        metric('wibeee_nest_upstream_duration_seconds', 'histogram', 'Time taken by requests forwarded upstream.',
+               self.upstream_latency.samples('wibeee_nest_upstream_duration_seconds', {}))
+        metric('wibeee_nest_handler_duration_seconds', 'histogram', 'Time taken to handle push requests.',
+               (sample for route, histogram in sorted(self.handler_latency.items())
+                for sample in histogram.samples('wibeee_nest_handler_duration_seconds', {'route': route})))
+
+        for extra in extra_metrics:
+            metric(extra.name, extra.metric_type, extra.help_text, [f'{extra.name} {extra.value!r}'])
+
+        return '\n'.join(lines) + '\n'
+
+
+def _counter_samples(name: str, label: str, counter: Mapping[str, int]) -> Iterable[str]:
+    return (f'{name}{_labels({label: value})} {n}' for value, n in sorted(counter.items()))
+
+
+def _labels(labels: Mapping[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
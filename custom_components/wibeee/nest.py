@@ -1,17 +1,29 @@
+import asyncio
+import functools
 import json
 import logging
+import re
+import threading
 import time
-from typing import Callable, Dict, NamedTuple, Awaitable, Optional, Any
-from urllib.parse import parse_qsl
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, NamedTuple, Awaitable, Optional, Any, TypeVar
+from urllib.parse import parse_qsl, unquote_plus
 
 from aiohttp.web_request import Request
 from aiohttp.web_response import StreamResponse
+from multidict import CIMultiDictProxy
 from homeassistant.components.network import async_get_source_ip
 from homeassistant.components.network.const import PUBLIC_TARGET_IP
-from homeassistant.core import callback, Event
+from homeassistant.core import Event
 from homeassistant.helpers import singleton
 
-from .const import NEST_NULL_UPSTREAM
+from .const import DOMAIN, NEST_NULL_UPSTREAM, NEST_DEFAULT_GRADIENT, NEST_FORWARD_QUEUE_SIZE, NEST_FORWARD_WORKERS, NEST_FORWARD_TIMEOUT, \
+    NEST_UPSTREAM_KEEPALIVE
+from .metrics import Metric, ProxyMetrics
+from .spool import SpoolRecord, UpstreamSpool
+from .tracing import NULL_TRACE, FrameTrace, FrameTracer
 
 LOGGER = logging.getLogger(__name__)
 
@@ -22,105 +34,598 @@ from aiohttp.web_routedef import _HandlerType
 from homeassistant.core import HomeAssistant
 from homeassistant.const import EVENT_HOMEASSISTANT_STOP
 
+T = TypeVar('T')
+
+NEST_PROXY_THREAD_NAME = 'wibeee_nest_proxy'
+
+DATA_NEST_PROXY = f'{DOMAIN}_nest_proxy'
+"""Key for the Nest proxy in hass.data, set by `get_nest_proxy`."""
+
+
+def _keep_push_data(push_data: Dict) -> Dict:
+    return push_data
+
 
 class DeviceConfig(NamedTuple):
-    handle_push_data: Callable[[Dict], None]
-    """Callback that will receive push data."""
+    handle_push_data: Callable[[Any], None]
+    """Callback that will receive push data, as returned by `decode_push_data`."""
     upstream: str
     """The upstream server to forward data to"""
+    async_forward: bool = False
+    """Whether to reply to the device immediately and forward data to the upstream in the background."""
+    spool: Optional[UpstreamSpool] = None
+    """Where to store data that could not be forwarded to the upstream, for replaying later."""
+    push_interval: Optional[int] = None
+    """Seconds between pushes requested from the device in the proxy's replies, or None to keep the device's default rate."""
+    frame_tracers: tuple[FrameTracer, ...] = ()
+    """Where to record the time taken by each stage of handling the device's push frames, one per listener that traces."""
+    decode_push_data: Callable[[Dict], Any] = _keep_push_data
+    """Converts push data for `handle_push_data`. Called on the proxy's event loop, before the data is handed over."""
+
+    def receive_push_data(self, push_data: Dict) -> None:
+        """Decodes and handles push data on the calling thread."""
+        self.handle_push_data(self.decode_push_data(push_data))
 
 
 class DecodedRequest(NamedTuple):
     macAddr: str | None = None
     push_data: dict[str, Any] = {}
     body: str | None = None
+    failed: bool = False
+    """Whether the request's data could not be decoded."""
+    repaired: bool = False
+    """Whether the request's data was malformed and had to be repaired."""
 
 
 class NestProxy(object):
-    _listeners: Dict[str, DeviceConfig] = {}
+    """Routes push data to the listeners registered for each device MAC address."""
+
+    def __init__(self):
+        self._listeners: Dict[str, tuple[DeviceConfig, ...]] = {}
+        """Listeners by normalized MAC address, in registration order."""
+        self._routes: Dict[str, DeviceConfig] = {}
+        """Routing table used by the request path, rebuilt whenever a listener is (un)registered."""
+        self._spools: Dict[str, UpstreamSpool] = {}
+        """Spools by normalized MAC address, kept for as long as the proxy runs."""
+        self.upstream_forwarder: Optional['UpstreamForwarder'] = None
+        """Forwards push data to upstreams in the background, set once the proxy's application is running."""
+
+    def register_device(self, mac_address: str, push_data_listener: Callable[[Dict], None], upstream: str,
+                        async_forward: bool = False, spool: Optional[UpstreamSpool] = None,
+                        push_interval: Optional[int] = None, frame_tracer: Optional[FrameTracer] = None,
+                        decode_push_data: Callable[[Dict], Dict] = _keep_push_data) -> Callable[[], None]:
+        """
+        Registers a listener for push data from `mac_address`, returning a function that unregisters it. The push data is
+        passed through `decode_push_data` on the proxy's event loop before it reaches the listener.
+        """
+        mac_key = normalize_mac(mac_address)
+        registered = True
+        if spool is not None:
+            spool.resume_replay()
+
+        def handle_push_data(push_data: Dict) -> None:
+            # frames that were already handed over when the listener was unregistered are dropped.
+            if registered:
+                push_data_listener(push_data)
+
+        device_config = DeviceConfig(handle_push_data=handle_push_data, upstream=upstream, async_forward=async_forward, spool=spool,
+                                     push_interval=push_interval, frame_tracers=(frame_tracer,) if frame_tracer is not None else (),
+                                     decode_push_data=decode_push_data)
+        self._update_route(mac_key, self._listeners.get(mac_key, ()) + (device_config,))
+        LOGGER.debug('Registered MAC address %s with upstream: %s (async forward: %s, push interval: %s)', mac_address, upstream,
+                     async_forward, push_interval)
+
+        def unregister_device() -> None:
+            nonlocal registered
+            registered = False
+            self._update_route(mac_key, tuple(c for c in self._listeners.get(mac_key, ()) if c is not device_config))
+            if spool is not None and all(c.spool is not spool for c in self._listeners.get(mac_key, ())):
+                # requests that are still queued may append to the spool, but it is only replayed once it has a listener.
+                spool.pause_replay()
+            LOGGER.debug('Unregistered device: %s', mac_address)
+
+        return unregister_device
+
+    def get_spool(self, mac_address: str, directory: Path, max_bytes: int) -> UpstreamSpool:
+        """
+        Returns the spool of `mac_address`, creating it the first time. The same spool is returned when a device is
+        registered again (e.g. when its config entry is reloaded), as requests that were queued before may still use it
+        and only one spool may read and write its directory.
+        """
+        mac_key = normalize_mac(mac_address)
+        if (spool := self._spools.get(mac_key)) is None:
+            spool = self._spools[mac_key] = UpstreamSpool(directory, max_bytes)
+        else:
+            spool.resize(max_bytes)
+        return spool
 
-    def register_device(self, mac_address: str, push_data_listener: Callable[[Dict], None], upstream: str):
-        LOGGER.debug('Registered MAC address %s with upstream: %s', mac_address, upstream)
-        self._listeners[mac_address] = DeviceConfig(
-            handle_push_data=push_data_listener,
-            upstream=upstream
-        )
+    def get_device_info(self, mac_addr: str | None) -> DeviceConfig | None:
+        return self._routes.get(normalize_mac(mac_addr), None) if mac_addr else None
 
-    def unregister_device(self, mac_address: str):
-        self._listeners.pop(mac_address)
-        LOGGER.debug('Unregistered device: %s', mac_address)
+    def _update_route(self, mac_key: str, listeners: tuple[DeviceConfig, ...]) -> None:
+        if listeners:
+            self._listeners[mac_key] = listeners
+            self._routes[mac_key] = listeners[0] if len(listeners) == 1 else _fan_out(listeners)
+        else:
+            self._listeners.pop(mac_key, None)
+            self._routes.pop(mac_key, None)
+
+
+def normalize_mac(mac_addr: str) -> str:
+    """Normalizes a MAC address for use as a routing key (e.g. '00:1A:2B:...' -> '001a2b...')."""
+    return mac_addr.replace(':', '').replace('-', '').lower()
 
-    def get_device_info(self, mac_addr: str) -> DeviceConfig | None:
-        return self._listeners.get(mac_addr, None)
 
+def _fan_out(listeners: tuple[DeviceConfig, ...]) -> DeviceConfig:
+    """
+    Combines several listeners for the same device. Data is forwarded to the first upstream that isn't local-only, as the
+    device can only act on one response. The device is asked to push at the shortest interval that any listener requests.
+    """
+    handlers = tuple(c.handle_push_data for c in listeners)
+    decoders = tuple(c.decode_push_data for c in listeners)
+
+    def decode_push_data(push_data: Dict) -> tuple[Any, ...]:
+        return tuple(decode(push_data) for decode in decoders)
+
+    def handle_push_data(decoded_push_data: tuple[Any, ...]) -> None:
+        for handler, push_data in zip(handlers, decoded_push_data):
+            try:
+                handler(push_data)
+            except Exception:
+                LOGGER.exception('Error handling push data from %s', push_data.get('mac'))
 
-def respond(response: str | Callable[[web.Request], str]) -> Callable[[Request], Awaitable[StreamResponse]]:
-    async def respond_(req: web.Request) -> web.StreamResponse:
-        return web.Response(status=200, body=response(req) if callable(response) else response)
+    forwarding = next((c for c in listeners if c.upstream != NEST_NULL_UPSTREAM), listeners[0])
+    push_interval = min((c.push_interval for c in listeners if c.push_interval is not None), default=None)
+    frame_tracers = tuple(tracer for c in listeners for tracer in c.frame_tracers)
+    return DeviceConfig(handle_push_data=handle_push_data, upstream=forwarding.upstream, async_forward=forwarding.async_forward,
+                        spool=forwarding.spool, push_interval=push_interval, frame_tracers=frame_tracers, decode_push_data=decode_push_data)
+
+
+class UpstreamResponse(NamedTuple):
+    status: int
+    headers: CIMultiDictProxy[str]
+    body: bytes
+
+
+class _ConnectionReuse(object):
+    """Passed as a request's `trace_request_ctx` to find out whether it was sent over a pooled connection."""
+    __slots__ = ('reused',)
+
+    def __init__(self):
+        self.reused = False
+
+
+def _upstream_trace_config() -> aiohttp.TraceConfig:
+    """Trace config for upstream sessions, which `request_upstream` needs to tell whether a connection was reused."""
+    async def on_connection_reuseconn(_: aiohttp.ClientSession, trace_config_ctx: SimpleNamespace, __: aiohttp.TraceConnectionReuseconnParams) -> None:
+        if isinstance(trace_config_ctx.trace_request_ctx, _ConnectionReuse):
+            trace_config_ctx.trace_request_ctx.reused = True
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+async def request_upstream(session: aiohttp.ClientSession, method: str, url: str, body: str | bytes | None,
+                           timeout: aiohttp.ClientTimeout | None = None) -> UpstreamResponse:
+    """
+    Sends a request to an upstream server over a pooled connection. If the server closed the idle connection just as it
+    was reused, the request is retried once on a new connection. A request that fails on a new connection isn't retried, as
+    the server may already have processed it. Connection reuse is only detected for sessions created with
+    `_upstream_trace_config`.
+    """
+    connection = _ConnectionReuse()
+    try:
+        async with session.request(method, url, data=body, timeout=timeout, trace_request_ctx=connection) as res:
+            return UpstreamResponse(res.status, res.headers, await res.read())
+
+    except aiohttp.ServerDisconnectedError as e:
+        if not connection.reused:
+            raise
+        LOGGER.debug('Upstream closed the reused connection during %s %s, retrying: %s', method, url, e)
+
+    async with session.request(method, url, data=body, timeout=timeout) as res:
+        return UpstreamResponse(res.status, res.headers, await res.read())
+
+
+class ForwardRequest(NamedTuple):
+    method: str
+    upstream: str
+    path_qs: str
+    """Path and query string of the request, relative to the upstream."""
+    body: str | bytes | None
+    queued_at: float
+    """Monotonic time at which the request was queued."""
+    spool: Optional[UpstreamSpool] = None
+    """Where to store the request if it can't be forwarded."""
+
+    @property
+    def url(self) -> str:
+        return f'{self.upstream}{self.path_qs}'
+
+
+class UpstreamForwarder(object):
+    """
+    Forwards push data to upstream servers from a bounded queue, using a few worker tasks. When the queue is full the
+    oldest request is dropped, as the upstream only cares about the most recent readings.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, max_size: int = NEST_FORWARD_QUEUE_SIZE,
+                 workers: int = NEST_FORWARD_WORKERS, timeout: timedelta = NEST_FORWARD_TIMEOUT,
+                 proxy_metrics: Optional[ProxyMetrics] = None):
+        self.session = session
+        self.proxy_metrics = proxy_metrics
+        self.workers = workers
+        self.timeout = aiohttp.ClientTimeout(total=timeout.total_seconds())
+        self._queue: asyncio.Queue[ForwardRequest] = asyncio.Queue(maxsize=max_size)
+        self._tasks: list[asyncio.Task] = []
+        self.queued = 0
+        self.dropped = 0
+        self.forwarded = 0
+        self.failed = 0
+        self.queue_latency_total = 0.0
+        """Total time that forwarded requests spent in the queue, in seconds."""
+        self.upstream_latency_total = 0.0
+        """Total time spent waiting for upstream responses, in seconds."""
+        self.upstream_latency_max = 0.0
+
+    def submit(self, method: str, upstream: str, path_qs: str, body: str | bytes | None, spool: Optional[UpstreamSpool] = None) -> None:
+        """Queues a request for forwarding, dropping the oldest queued request if the queue is full."""
+        if self._queue.full():
+            dropped = self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+            LOGGER.debug('Upstream queue is full, dropped %s %s', dropped.method, dropped.url)
+
+        self._queue.put_nowait(ForwardRequest(method, upstream, path_qs, body, time.monotonic(), spool))
+        self.queued += 1
+
+    async def start(self, _: web.Application | None = None) -> None:
+        self._tasks = [asyncio.create_task(self._work(), name=f'wibeee_upstream_forwarder_{n}') for n in range(self.workers)]
+
+    async def stop(self, _: web.Application | None = None) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self) -> None:
+        """Waits until all queued requests have been forwarded (or have failed)."""
+        await self._queue.join()
+
+    @property
+    def metrics(self) -> dict[str, int | float]:
+        """Queue depth, drops and latencies (in seconds) of the requests forwarded so far."""
+        completed = self.forwarded + self.failed
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_max_size': self._queue.maxsize,
+            'queued': self.queued,
+            'dropped': self.dropped,
+            'forwarded': self.forwarded,
+            'failed': self.failed,
+            'queue_latency_avg': self.queue_latency_total / completed if completed else 0.0,
+            'upstream_latency_avg': self.upstream_latency_total / completed if completed else 0.0,
+            'upstream_latency_max': self.upstream_latency_max,
+        }
+
+    async def resend(self, upstream: str, record: SpoolRecord) -> bool:
+        """
+        Sends a spooled request to `upstream`, returning whether the upstream is up (and the record can be discarded). The
+        upstream is the one currently configured, which may not be the one that the request was spooled for.
+        """
+        started_at = time.monotonic()
+        status = None
+        url = f'{upstream}{record.path_qs}'
+        try:
+            res = await request_upstream(self.session, record.method, url, record.body, self.timeout)
+            status = res.status
+            LOGGER.debug('%s returned %d for spooled request: %s', url, res.status, res.body)
+            return res.status < 500
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            LOGGER.debug('Wibeee Cloud HTTP error during spooled %s %s: %s: %s', record.method, url, e.__class__.__name__, e)
+            return False
+
+        finally:
+            if self.proxy_metrics is not None:
+                self.proxy_metrics.observe_upstream(status, time.monotonic() - started_at)
+
+    async def _work(self) -> None:
+        while True:
+            request = await self._queue.get()
+            try:
+                await self._forward(request)
+            finally:
+                self._queue.task_done()
+
+    async def _forward(self, request: ForwardRequest) -> None:
+        if request.spool is not None and await request.spool.async_append_if_pending(SpoolRecord(request.method, request.path_qs, request.body)):
+            # the request is replayed after the data that was spooled before it.
+            request.spool.async_replay(functools.partial(self.resend, request.upstream))
+            return
+
+        started_at = time.monotonic()
+        self.queue_latency_total += started_at - request.queued_at
+        status = None
+        try:
+            res = await request_upstream(self.session, request.method, request.url, request.body, self.timeout)
+            status = res.status
+            if res.status < 200 or res.status > 299:
+                LOGGER.warning('Wibeee Cloud returned %d for forwarded request: %s', res.status, res.body)
+
+            LOGGER.debug('%s returned %d for forwarded request: %s', request.url, res.status, res.body)
+            self.forwarded += 1
+            if request.spool is not None:
+                request.spool.async_replay(functools.partial(self.resend, request.upstream))
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            LOGGER.warning('Wibeee Cloud HTTP error during %s %s: %s: %s', request.method, request.url, e.__class__.__name__, e)
+            self.failed += 1
+            if request.spool is not None:
+                await request.spool.async_append(SpoolRecord(request.method, request.path_qs, request.body))
+
+        finally:
+            latency = time.monotonic() - started_at
+            self.upstream_latency_total += latency
+            self.upstream_latency_max = max(self.upstream_latency_max, latency)
+            if self.proxy_metrics is not None:
+                self.proxy_metrics.observe_upstream(status, latency)
+
+
+def respond(response: str | Callable[[web.Request, DeviceConfig], str]) -> Callable[[Request, DeviceConfig], Awaitable[StreamResponse]]:
+    async def respond_(req: web.Request, device_info: DeviceConfig) -> web.StreamResponse:
+        return web.Response(status=200, body=response(req, device_info) if callable(response) else response)
 
     return respond_
 
 
-def create_application(get_device_info: Callable[[str], Optional[DeviceConfig]]) -> aiohttp.web.Application:
-    # disable persistent HTTP connections as the Wibeee Cloud will otherwise
-    # time out our connections, causing a ServerDisconnectedError below.
-    connector = aiohttp.TCPConnector(force_close=True)
-    session = aiohttp.ClientSession(connector=connector)
+def json_reply(_: web.Request, __: DeviceConfig) -> str:
+    """Reply to `receiverJSON`, which carries the current time."""
+    return f'<<<WBJSON {int(time.time())}'
+
+
+def gradient_reply(_: web.Request, device_info: DeviceConfig) -> str:
+    """
+    Reply to `receiverLeap`, which carries the push interval requested from the device.
+
+    The only evidence for this parameter is the reply of the Wibeee cloud, `<<<WGRADIENT=007 `. Its value is read as the
+    seconds between pushes, which hasn't been confirmed by the manufacturer, so the cloud's reply is kept unless a push
+    interval is set. The other replies carry no parameters that are known to control the device.
+    """
+    return f'<<<WGRADIENT={device_info.push_interval or NEST_DEFAULT_GRADIENT:03d} '
+
+
+class PushFrame(NamedTuple):
+    trace: FrameTrace
+    handle_push_data: Callable[[Any], None]
+    push_data: Any
+    """Push data as returned by the device's `decode_push_data`."""
+
+
+class FrameBatcher(object):
+    """
+    Hands decoded push frames from the Nest proxy's event loop to `target_loop`. Frames decoded in the same iteration of
+    the proxy's loop are handed over together, with a single `call_soon_threadsafe`.
+    """
+
+    def __init__(self, target_loop: asyncio.AbstractEventLoop):
+        self.target_loop = target_loop
+        self._frames: list[PushFrame] = []
+        self.batches = 0
+        self.frames = 0
+
+    def submit(self, trace: FrameTrace, handle_push_data: Callable[[Any], None], push_data: Any) -> None:
+        if not self._frames:
+            asyncio.get_running_loop().call_soon(self._flush)
+
+        trace.handoff()
+        self._frames.append(PushFrame(trace, handle_push_data, push_data))
+
+    def _flush(self) -> None:
+        frames, self._frames = self._frames, []
+        try:
+            self.target_loop.call_soon_threadsafe(_handle_frames, frames)
+        except RuntimeError:
+            LOGGER.debug('Dropped %d push frames, Home Assistant is shutting down', len(frames))
+            return
+
+        self.batches += 1
+        self.frames += len(frames)
+
+
+def _handle_frames(frames: list[PushFrame]) -> None:
+    for frame in frames:
+        try:
+            frame.trace.handle_handed_off(frame.handle_push_data, frame.push_data)
+        except Exception:
+            LOGGER.exception('Error handling push data handed over by the Nest proxy')
+
+
+def _handle_frame(trace: FrameTrace, handle_push_data: Callable[[Any], None], push_data: Any) -> None:
+    trace.handle(handle_push_data, push_data)
+
+
+UPSTREAM_FORWARDER = web.AppKey('upstream_forwarder', UpstreamForwarder)
+PROXY_METRICS = web.AppKey('proxy_metrics', ProxyMetrics)
+
+_FORWARDER_METRICS: tuple[tuple[str, str, str, str], ...] = (
+    ('queue_depth', 'wibeee_nest_forward_queue_depth', 'gauge', 'Requests waiting to be forwarded upstream in the background.'),
+    ('queue_max_size', 'wibeee_nest_forward_queue_max_size', 'gauge', 'Requests that can wait to be forwarded before the oldest is dropped.'),
+    ('queued', 'wibeee_nest_forward_queued_total', 'counter', 'Requests queued for forwarding upstream in the background.'),
+    ('dropped', 'wibeee_nest_forward_dropped_total', 'counter', 'Queued requests dropped because the queue was full.'),
+    ('forwarded', 'wibeee_nest_forward_forwarded_total', 'counter', 'Queued requests that the upstream responded to.'),
+    ('failed', 'wibeee_nest_forward_failed_total', 'counter', 'Queued requests that the upstream did not respond to.'),
+    ('queue_latency_avg', 'wibeee_nest_forward_queue_latency_avg_seconds', 'gauge', 'Average time that queued requests waited to be forwarded.'),
+    ('upstream_latency_avg', 'wibeee_nest_forward_upstream_latency_avg_seconds', 'gauge', 'Average time taken by the upstream to respond to queued requests.'),
+    ('upstream_latency_max', 'wibeee_nest_forward_upstream_latency_max_seconds', 'gauge', 'Longest time taken by the upstream to respond to a queued request.'),
+)
+"""Upstream forwarder metric key, exported metric name, type and help text."""
+
+
+def create_application(get_device_info: Callable[[str], Optional[DeviceConfig]],
+                       frame_batcher: Optional[FrameBatcher] = None) -> aiohttp.web.Application:
+    """
+    Creates the Nest proxy's application. Push data is handled by the request handlers themselves, unless a `frame_batcher`
+    is given to hand it off to another event loop.
+    """
+    # reuse connections to the upstream, but close them before the Wibeee Cloud times them out. a connection that is
+    # closed by the cloud anyway is retried by request_upstream.
+    connector = aiohttp.TCPConnector(keepalive_timeout=NEST_UPSTREAM_KEEPALIVE.total_seconds())
+    session = aiohttp.ClientSession(connector=connector, trace_configs=[_upstream_trace_config()])
+    proxy_metrics = ProxyMetrics()
+    forwarder = UpstreamForwarder(session, proxy_metrics=proxy_metrics)
+    handle_frame = frame_batcher.submit if frame_batcher is not None else _handle_frame
 
     async def close_session(app: web.Application) -> None:
         session.detach()
         await connector.close()
 
-    def nest_forward(decode_data: Callable[[web.Request], Awaitable[DecodedRequest]],
-                     make_response: Callable[[web.Request], Awaitable[web.StreamResponse]]) -> _HandlerType:
+    def nest_forward(route: str, decode_data: Callable[[web.Request], Awaitable[DecodedRequest]],
+                     make_response: Callable[[web.Request, DeviceConfig], Awaitable[web.StreamResponse]]) -> _HandlerType:
         async def handler(req: web.Request) -> web.StreamResponse:
-            mac_addr, push_data, forward_body = await decode_data(req)
+            received_at = time.monotonic()
+            try:
+                return await forward(req, received_at)
+            finally:
+                proxy_metrics.observe_handler(route, time.monotonic() - received_at)
+
+        async def forward(req: web.Request, received_at: float) -> web.StreamResponse:
+            # route on the MAC address alone so that unknown devices are turned away before their data is decoded.
+            mac_addr = await extract_mac(req)
             device_info = get_device_info(mac_addr)
 
             if device_info is None:
-                LOGGER.debug("Ignoring unexpected push data from %s received as %s %s: %s", mac_addr, req.method, req.path, push_data)
+                LOGGER.debug("Ignoring unexpected push data from %s received as %s %s", mac_addr, req.method, req.path)
+                proxy_metrics.unknown_devices[route] += 1
                 return web.Response(status=404)  # Not Found
 
-            LOGGER.debug("Updating sensors using push data from %s received as %s %s: %s", mac_addr, req.method, req.path, push_data)
-            device_info.handle_push_data(push_data)
-
-            if device_info.upstream == NEST_NULL_UPSTREAM:
-                # don't send to any upstream.
-                LOGGER.debug("Accepted local-only push data from %s in %s %s: %s", mac_addr, req.method, req.path, push_data)
-                return await make_response(req)
-
-            url = f'{device_info.upstream}{req.path_qs}'
+            trace = FrameTrace(device_info.frame_tracers, route, received_at) if device_info.frame_tracers else NULL_TRACE
             try:
-                LOGGER.debug("Forwarding push data from %s using %s %s: %s", mac_addr, req.method, url, push_data)
-                res = await session.request(req.method, url, data=forward_body)
-                res_body = await res.read()
-                if res.status < 200 or res.status > 299:
-                    LOGGER.warning('Wibeee Cloud returned %d for forwarded request: %s', res.status, res_body)
-
-                LOGGER.debug('%s returned %d for forwarded request: %s', device_info.upstream, res.status, res_body)
-                return web.Response(status=res.status, headers=res.headers, body=res_body)
-
-            except aiohttp.ClientError as e:
-                LOGGER.error('Wibeee Cloud HTTP error during %s %s', req.method, req.path, exc_info=e)
-                return web.Response(status=500)  # Server Error
+                decoded = await decode_data(req)
+                trace.mark('decode')
+                push_data, forward_body = decoded.push_data, decoded.body
+                if decoded.failed:
+                    # still forwarded upstream as received, but there's nothing to update the sensors with.
+                    LOGGER.debug("Ignoring undecodable push data from %s received as %s %s", mac_addr, req.method, req.path)
+                    proxy_metrics.decode_failures[route] += 1
+                else:
+                    proxy_metrics.pushes[normalize_mac(mac_addr), route] += 1
+                    if decoded.repaired:
+                        proxy_metrics.json_repairs[route] += 1
+
+                    LOGGER.debug("Updating sensors using push data from %s received as %s %s: %s", mac_addr, req.method, req.path, push_data)
+                    handle_frame(trace, device_info.handle_push_data, device_info.decode_push_data(push_data))
+
+                if device_info.upstream == NEST_NULL_UPSTREAM:
+                    # don't send to any upstream.
+                    LOGGER.debug("Accepted local-only push data from %s in %s %s: %s", mac_addr, req.method, req.path, push_data)
+                    return await make_response(req, device_info)
+
+                url = f'{device_info.upstream}{req.path_qs}'
+                if device_info.async_forward:
+                    LOGGER.debug("Queueing push data from %s for %s %s: %s", mac_addr, req.method, url, push_data)
+                    forwarder.submit(req.method, device_info.upstream, req.path_qs, forward_body, device_info.spool)
+                    return await make_response(req, device_info)
+
+                if device_info.spool is not None and await device_info.spool.async_append_if_pending(SpoolRecord(req.method, req.path_qs, forward_body)):
+                    # don't overtake the data that is still spooled, the upstream must receive data in order.
+                    LOGGER.debug("Spooled push data from %s behind data waiting to be replayed: %s %s", mac_addr, req.method, url)
+                    device_info.spool.async_replay(functools.partial(forwarder.resend, device_info.upstream))
+                    return await make_response(req, device_info)
+
+                upstream_started_at = time.monotonic()
+                trace.mark('forward_start')
+                try:
+                    LOGGER.debug("Forwarding push data from %s using %s %s: %s", mac_addr, req.method, url, push_data)
+                    res = await request_upstream(session, req.method, url, forward_body)
+                    trace.mark('forward_end')
+                    proxy_metrics.observe_upstream(res.status, time.monotonic() - upstream_started_at)
+                    if res.status < 200 or res.status > 299:
+                        LOGGER.warning('Wibeee Cloud returned %d for forwarded request: %s', res.status, res.body)
+
+                    LOGGER.debug('%s returned %d for forwarded request: %s', device_info.upstream, res.status, res.body)
+                    if device_info.spool is not None:
+                        device_info.spool.async_replay(functools.partial(forwarder.resend, device_info.upstream))
+
+                    return web.Response(status=res.status, headers=res.headers, body=res.body)
+
+                except aiohttp.ClientError as e:
+                    trace.mark('forward_end')
+                    proxy_metrics.observe_upstream(None, time.monotonic() - upstream_started_at)
+                    if device_info.spool is None:
+                        LOGGER.error('Wibeee Cloud HTTP error during %s %s', req.method, req.path, exc_info=e)
+                        return web.Response(status=500)  # Server Error
+
+                    # the data is safe in the spool, so the device doesn't need to retry.
+                    LOGGER.warning('Wibeee Cloud HTTP error during %s %s, spooling: %s: %s', req.method, req.path, e.__class__.__name__, e)
+                    await device_info.spool.async_append(SpoolRecord(req.method, req.path_qs, forward_body))
+                    return await make_response(req, device_info)
+
+            finally:
+                trace.finish()
 
         return handler
 
+    async def metrics(_: web.Request) -> web.StreamResponse:
+        forwarder_metrics = forwarder.metrics
+        extra_metrics = [Metric(name, metric_type, help_text, forwarder_metrics[key]) for key, name, metric_type, help_text in _FORWARDER_METRICS]
+        if frame_batcher is not None:
+            extra_metrics += [
+                Metric('wibeee_nest_handoff_batches_total', 'counter', "Batches of push frames handed over to Home Assistant's event loop.",
+                       frame_batcher.batches),
+                Metric('wibeee_nest_handoff_frames_total', 'counter', "Push frames handed over to Home Assistant's event loop.",
+                       frame_batcher.frames),
+            ]
+        return web.Response(text=proxy_metrics.render(extra_metrics), content_type='text/plain')
+
     app = aiohttp.web.Application()
+    app[UPSTREAM_FORWARDER] = forwarder
+    app[PROXY_METRICS] = proxy_metrics
+    app.on_startup.append(forwarder.start)
+    app.on_shutdown.append(forwarder.stop)
     app.on_shutdown.append(close_session)
     app.add_routes([
-        web.get('/Wibeee/receiver', nest_forward(extract_query_params, respond(''))),
-        web.get('/Wibeee/receiverAvg', nest_forward(extract_query_params, respond('<<<WBAVG '))),
-        web.get('/Wibeee/receiverLeap', nest_forward(extract_query_params, respond('<<<WGRADIENT=007 '))),
-        web.post('/Wibeee/receiverAvgPost', nest_forward(extract_json_body, respond('<<<WBAVG '))),
-        web.post('/Wibeee/receiverJSON', nest_forward(extract_json_body, respond(lambda req: f'<<<WBJSON {int(time.time())}'))),
+        web.get('/Wibeee/receiver', nest_forward('receiver', extract_query_params, respond(''))),
+        web.get('/Wibeee/receiverAvg', nest_forward('receiverAvg', extract_query_params, respond('<<<WBAVG '))),
+        web.get('/Wibeee/receiverLeap', nest_forward('receiverLeap', extract_query_params, respond(gradient_reply))),
+        web.post('/Wibeee/receiverAvgPost', nest_forward('receiverAvgPost', extract_json_body, respond('<<<WBAVG '))),
+        web.post('/Wibeee/receiverJSON', nest_forward('receiverJSON', extract_json_body, respond(json_reply))),
+        web.get('/metrics', metrics),
         web.route('*', '/{anypath:.*}', unknown_path_handler),
     ])
 
     return app
 
 
-@singleton.singleton("wibeee_nest_proxy")
+class NestProxyThread(threading.Thread):
+    """
+    Runs an event loop for the Nest proxy on its own thread, so that accepting, parsing, decoding and forwarding push
+    requests doesn't compete with Home Assistant's event loop.
+    """
+
+    def __init__(self):
+        super().__init__(name=NEST_PROXY_THREAD_NAME, daemon=True)
+        self.loop = asyncio.new_event_loop()
+
+    def run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    async def async_run(self, coro: Awaitable[T]) -> T:
+        """Runs `coro` on the proxy's event loop, waiting for it from the calling event loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def async_stop(self) -> None:
+        """Stops the proxy's event loop, waiting for the thread to exit."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        await asyncio.get_running_loop().run_in_executor(None, self.join)
+
+
+@singleton.singleton(DATA_NEST_PROXY)
 async def get_nest_proxy(hass: HomeAssistant, local_port=8600) -> NestProxy:
     # access log only if DEBUG level is enabled
     access_log = logging.getLogger(f'{__name__}.access')
@@ -130,51 +635,136 @@ async def get_nest_proxy(hass: HomeAssistant, local_port=8600) -> NestProxy:
     local_ip = await async_get_source_ip(hass, target_ip=PUBLIC_TARGET_IP)
 
     nest_proxy = NestProxy()
-    app = create_application(lambda mac_addr: nest_proxy.get_device_info(mac_addr))
-    server = hass.loop.create_task(web._run_app(app, host=local_ip, port=local_port, access_log=access_log))
+    proxy_thread = NestProxyThread()
+    proxy_thread.start()
+
+    async def start_server() -> web.AppRunner:
+        # runs on the proxy's event loop, so that the application's queues and sessions are bound to it.
+        runner = web.AppRunner(create_application(nest_proxy.get_device_info, FrameBatcher(hass.loop)), access_log=access_log)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host=local_ip, port=local_port).start()
+        except BaseException:
+            await runner.cleanup()
+            raise
+        return runner
+
+    try:
+        runner = await proxy_thread.async_run(start_server())
+    except OSError as e:
+        LOGGER.error('Wibeee Nest proxy unable to listen on http://%s:%d: %s', local_ip, local_port, e)
+        await proxy_thread.async_stop()
+        return nest_proxy
+
+    nest_proxy.upstream_forwarder = runner.app[UPSTREAM_FORWARDER]
     LOGGER.info('Wibeee Nest proxy listening on http://%s:%d', local_ip, local_port)
 
-    @callback
-    def shutdown_proxy(ev: Event) -> None:
+    async def shutdown_proxy(ev: Event) -> None:
         LOGGER.info('Wibeee Nest proxy shutting down')
-        server.cancel()
+        await proxy_thread.async_run(runner.cleanup())
+        await proxy_thread.async_stop()
 
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, shutdown_proxy)
     return nest_proxy
 
 
+_QUERY_MAC = re.compile(r'(?:^|[&;])mac=([^&;]*)')
+_JSON_MAC = re.compile(rb'"mac"\s*:\s*"([^"]*)"')
+
+
+async def extract_mac(req: web.Request) -> str | None:
+    """
+    Finds the MAC address of the device that sent a request without decoding the rest of it. The query string is checked
+    first so that the body is only read when the MAC address is not found there (e.g. JSON posts).
+    """
+    if match := _QUERY_MAC.search(req.query_string):
+        return unquote_plus(match.group(1))
+
+    if req.body_exists and (match := _JSON_MAC.search(await req.read())):
+        return match.group(1).decode(errors='replace')
+
+    return None
+
+
 async def extract_query_params(req: web.Request) -> DecodedRequest:
     """Extracts Wibeee data from query params."""
     query = {k: v for k, v in parse_qsl(req.query_string)}
-    return DecodedRequest(query['mac'], query, await req.text() if req.can_read_body else None)
+    body = await req.text() if req.body_exists else None
+    if not query.get('mac'):
+        # e.g. params separated with ';', which only extract_mac accepts.
+        LOGGER.debug("No MAC address in query params of %s %s: %s", req.method, req.path, req.query_string)
+        return DecodedRequest(None, {}, body, failed=True)
+
+    return DecodedRequest(query['mac'], query, body)
 
 
 async def extract_json_body(req: web.Request) -> DecodedRequest:
     """Extracts Wibeee data from JSON request body."""
-    body = await req.text() if req.can_read_body else None
+    body = await req.text() if req.body_exists else None
+    if body is None:
+        return DecodedRequest(None, {}, None, failed=True)
+
     LOGGER.debug("Parsing JSON in %s %s", req.method, req.path)
-    parsed_body = None
-    parse_error = None
     try:
-        parsed_body = {} if body is None else json.loads(body)
+        push_data, forward_body = decode_push_json(body)
 
-    except json.decoder.JSONDecodeError as e:
-        # Wibeee will send invalid JSON at times. make a desperate attempt to fix the JSON and try again. (╯°□°）╯︵ ┻━┻
-        fixed_body = body.replace(',,', ',').replace('""', '","')
-        if fixed_body != body:
-            try:
-                parsed_body = json.loads(fixed_body)
-                LOGGER.debug("Fixed invalid JSON in %s %s [%s]: %s", req.method, req.path, e, body)
-            except json.decoder.JSONDecodeError:
-                parse_error = e
-        else:
-            parse_error = e
+    except ValueError as e:
+        LOGGER.debug("Error parsing JSON in %s %s: %s", req.method, req.path, body, exc_info=e)
+        return DecodedRequest(None, {}, body, failed=True)
+
+    repaired = forward_body is not body
+    if repaired:
+        LOGGER.debug("Fixed invalid JSON in %s %s: %s", req.method, req.path, body)
+
+    return DecodedRequest(push_data.get('mac', None), push_data, forward_body, repaired=repaired)
+
+
+_JSON_STRING = r'"[^"\\]*+(?:\\.[^"\\]*+)*+"'
+_JSON_MEMBER = rf'{_JSON_STRING}\s*+:\s*+(?:{_JSON_STRING}|[^\s,"{{}}\[\]]++)'
+"""A member of a flat JSON object. The quantifiers are possessive as a member never has to be backtracked into."""
+_JSON_MEMBERS = re.compile(f'({_JSON_MEMBER})')
+"""Splits a flat JSON object into its members and what comes between them."""
+_JSON_SEPARATORS = ' \t\r\n,'
+"""What may come between the members of a flat JSON object sent by Wibeee devices: any number of commas."""
+
+
+def decode_push_json(body: str) -> tuple[dict[str, Any], str]:
+    """
+    Decodes the flat JSON object sent by Wibeee devices, returning the push data and the body to forward upstream. The body
+    to forward is `body` itself unless it had to be repaired.
+
+    Raises ValueError if the body can't be decoded.
+    """
+    try:
+        push_data = json.loads(body)
+
+    except json.decoder.JSONDecodeError:
+        # Wibeee will send invalid JSON at times. (╯°□°）╯︵ ┻━┻
+        body = _repair_push_json(body)
+        push_data = json.loads(body)
+
+    if not isinstance(push_data, dict):
+        raise ValueError(f'Expected a JSON object: {body[:20]!r}')
+
+    return push_data, body
+
+
+def _repair_push_json(body: str) -> str:
+    """
+    Repairs the repeated, missing and trailing commas between members that Wibeee devices send at times, by joining the
+    members again with exactly one comma between them. The object is scanned once, splitting it into its members and the
+    gaps between them, which may only contain commas and whitespace.
+    """
+    stripped = body.strip()
+    if not (stripped.startswith('{') and stripped.endswith('}')):
+        raise ValueError(f'Unable to repair JSON: {body!r}')
 
-    if parse_error:
-        LOGGER.debug("Error parsing JSON in %s %s: %s", req.method, req.path, body, exc_info=parse_error)
-        return DecodedRequest(None, {}, body)
+    # [gap, member, gap, member, ..., gap]
+    parts = _JSON_MEMBERS.split(stripped[1:-1])
+    if ''.join(parts[0::2]).strip(_JSON_SEPARATORS):
+        raise ValueError(f'Unable to repair JSON: {body!r}')
 
-    return DecodedRequest(parsed_body.get('mac', None), parsed_body, json.dumps(parsed_body))
+    return '{' + ','.join(parts[1::2]) + '}'
 
 
 async def unknown_path_handler(req: web.Request) -> web.StreamResponse:
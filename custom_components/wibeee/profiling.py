@@ -0,0 +1,68 @@
+"""
+Sampling profiler for the integration's code, started on demand by the `wibeee.profile` service.
+
+While profiling, a background thread samples the stacks of Home Assistant's event loop thread and of the Nest proxy's
+thread at a fixed interval. It keeps the part of each stack that starts at the outermost frame of this integration's code,
+so that time spent elsewhere in Home Assistant is ignored, and prefixes it with the name of the thread. Nothing is
+installed in the integration's code itself, so there's no cost when not profiling. Samples are written in the collapsed
+stack format used by flame graph tools (e.g. `flamegraph.pl` or speedscope), with a root frame per thread.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+from collections.abc import Iterable, Mapping
+from types import FrameType
+
+from .const import PROFILE_SAMPLE_INTERVAL
+
+PACKAGE_DIR = os.path.dirname(__file__) + os.sep
+
+
+class StackSampler(object):
+    """Samples the stacks of the `threads` that pass through code in `package_dir`."""
+
+    def __init__(self, threads: Mapping[int, str], interval: float = PROFILE_SAMPLE_INTERVAL, package_dir: str = PACKAGE_DIR):
+        """`threads` maps the id of each thread to sample to the name that its stacks are prefixed with."""
+        self.threads = dict(threads)
+        self.interval = interval
+        self.package_dir = package_dir
+        self.samples = 0
+        """Number of stacks sampled, including those that didn't pass through the integration's code."""
+        self.stacks: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='wibeee_profiler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def collapsed(self) -> Iterable[str]:
+        """Returns the sampled stacks in collapsed stack format, one line with the stack and its sample count per stack."""
+        return (f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, thread_name in self.threads.items():
+                if (frame := frames.get(thread_id)) is not None:
+                    self.samples += 1
+                    if stack := self._stack(frame):
+                        self.stacks[f'{thread_name};{stack}'] += 1
+
+    def _stack(self, frame: FrameType | None) -> str | None:
+        frames = []
+        outermost = None
+        while frame is not None:
+            frames.append(frame)
+            if frame.f_code.co_filename.startswith(self.package_dir):
+                outermost = len(frames)
+            frame = frame.f_back
+
+        if outermost is None:
+            return None
+
+        return ';'.join(f'{os.path.basename(f.f_code.co_filename)}:{f.f_code.co_qualname}' for f in reversed(frames[:outermost]))
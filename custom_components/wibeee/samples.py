@@ -0,0 +1,60 @@
+import math
+from array import array
+from collections.abc import Mapping
+from decimal import Decimal
+from typing import Any
+
+from .const import DOMAIN
+
+DATA_SAMPLE_BUFFERS = f'{DOMAIN}_sample_buffers'
+"""Key for the sample buffers of each config entry in hass.data."""
+
+
+class SampleRingBuffer(object):
+    """
+    Holds the most recent `capacity` push frames of a device in fixed-size columns, one per numeric variable plus one for
+    the time each frame was received. Samples are stored as C doubles in `array`s, so no Python objects are kept per
+    sample. Variables missing from a frame are stored as NaN.
+    """
+
+    def __init__(self, columns: Mapping[str, str], capacity: int):
+        """`columns` maps the push param of each variable to the name of its column."""
+        self.capacity = capacity
+        self.push_params = tuple(columns.keys())
+        self.column_names = tuple(columns.values())
+        self.frames = 0
+        self._timestamps = array('d', [math.nan]) * capacity
+        self._columns = tuple(array('d', [math.nan]) * capacity for _ in self.push_params)
+        self._next = 0
+
+    def __len__(self) -> int:
+        return min(self.frames, self.capacity)
+
+    def append(self, timestamp: float, push_data: Mapping[str, Any]) -> None:
+        row = self._next
+        self._timestamps[row] = timestamp
+        for column, push_param in zip(self._columns, self.push_params):
+            value = push_data.get(push_param)
+            column[row] = value if isinstance(value, (int, float, Decimal)) else math.nan
+
+        self._next = (row + 1) % self.capacity
+        self.frames += 1
+
+    def window(self, start: float = -math.inf, end: float = math.inf) -> dict[str, Any]:
+        """
+        Returns the samples received between `start` and `end` (inclusive, as POSIX timestamps), oldest first. Each column
+        is returned as a list of floats, with missing samples as None. Columns with no samples in the window are omitted.
+        """
+        oldest = self._next if self.frames > self.capacity else 0
+        rows = [row for n in range(len(self)) if start <= self._timestamps[row := (oldest + n) % self.capacity] <= end]
+
+        columns = {}
+        for name, column in zip(self.column_names, self._columns):
+            values = [None if math.isnan(value := column[row]) else value for row in rows]
+            if any(v is not None for v in values):
+                columns[name] = values
+
+        return {
+            'timestamps': [self._timestamps[row] for row in rows],
+            'columns': columns,
+        }
@@ -5,11 +5,16 @@ Vendor docs: https://support.wibeee.com/space/CH/184025089/XML
 Documentation: https://github.com/luuuis/hass_wibeee/
 
 """
+import asyncio
 import logging
+import math
 import re
-from collections.abc import Iterable
+import time
+from collections.abc import Collection, Iterable
 from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
 from enum import Enum, unique
+from pathlib import Path
 from types import MappingProxyType
 from typing import NamedTuple, Optional, Callable, Any, TypeVar, Mapping
 
@@ -17,7 +22,6 @@ import homeassistant.helpers.config_validation as cv
 import homeassistant.helpers.device_registry as dr
 import homeassistant.helpers.entity_registry as er
 import homeassistant.helpers.issue_registry as ir
-import homeassistant.util as util
 import homeassistant.util.dt as dt_util
 import voluptuous as vol
 from homeassistant.components.sensor import (
@@ -43,8 +47,7 @@ from homeassistant.const import (
     UnitOfEnergy,
     Platform,
 )
-from homeassistant.core import HomeAssistant, callback, CALLBACK_TYPE
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.core import HomeAssistant, Event, callback, CALLBACK_TYPE
 from homeassistant.helpers.device_registry import DeviceEntry, DeviceRegistry
 from homeassistant.helpers.entity import DeviceInfo as HassDeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
@@ -53,17 +56,33 @@ from homeassistant.helpers.issue_registry import async_create_issue, async_delet
 from homeassistant.helpers.typing import StateType
 from homeassistant.util.dt import as_local
 
-from .api import WibeeeAPI, DeviceInfo
+from .api import WibeeeAPI, DeviceInfo, async_get_device_session
 from .const import (
     DOMAIN,
+    DEFAULT_DEVICE_CONNECTIONS,
+    DEFAULT_DEVICE_KEEPALIVE,
     DEFAULT_THROTTLE,
     DEFAULT_TIMEOUT,
+    CONF_CAPTURE_PUSH,
+    CONF_DEVICE_CONNECTIONS,
+    CONF_DEVICE_KEEPALIVE,
     CONF_MAC_ADDRESS,
     CONF_NEST_UPSTREAM,
+    CONF_NEST_ASYNC_FORWARD,
+    CONF_NEST_SPOOL_SIZE,
+    CONF_POLL_FALLBACK,
+    CONF_PUSH_INTERVAL,
     CONF_THROTTLE,
+    CONF_THROTTLE_AGGREGATE,
     CONF_WIBEEE_ID,
+    CONF_WRITE_ON_CHANGE,
+    SAMPLE_BUFFER_SIZE,
+    WRITE_ON_CHANGE_MAX_AGE,
 )
+from .capture import PushCapture
 from .nest import get_nest_proxy
+from .samples import DATA_SAMPLE_BUFFERS, SampleRingBuffer
+from .tracing import DATA_FRAME_TRACERS, NULL_TRACE, FrameTracer
 from .util import short_mac
 
 _LOGGER = logging.getLogger(__name__)
@@ -125,6 +144,8 @@ class SensorType(NamedTuple):
     "slots where this sensor may be found"
     unique_name_override: Optional[str] = None
     "optional override used to build the sensor unique_id (e.g.: 'Vrms')"
+    deadband: float = 0
+    "smallest change in value that is written when only writing changed states (e.g.: 0.5)"
 
     @property
     def unique_name(self: 'SensorType') -> str:
@@ -143,13 +164,13 @@ class SensorType(NamedTuple):
 
 KNOWN_SENSORS = (
     # Energy sensors:
-    SensorType('vrms', 'v', 'Phase Voltage', UnitOfElectricPotential.VOLT, SensorDeviceClass.VOLTAGE, unique_name_override='Vrms'),
-    SensorType('irms', 'i', 'Current', UnitOfElectricCurrent.AMPERE, SensorDeviceClass.CURRENT, unique_name_override='Irms'),
-    SensorType('freq', 'q', 'Frequency', UnitOfFrequency.HERTZ, SensorDeviceClass.FREQUENCY),
-    SensorType('pac', 'a', 'Active Power', UnitOfPower.WATT, SensorDeviceClass.POWER),
-    SensorType('preac', 'r', 'Reactive Power', UnitOfReactivePower.VOLT_AMPERE_REACTIVE, SensorDeviceClass.REACTIVE_POWER),
-    SensorType('pap', 'p', 'Apparent Power', UnitOfApparentPower.VOLT_AMPERE, SensorDeviceClass.APPARENT_POWER),
-    SensorType('fpot', 'f', 'Power Factor', None, SensorDeviceClass.POWER_FACTOR),
+    SensorType('vrms', 'v', 'Phase Voltage', UnitOfElectricPotential.VOLT, SensorDeviceClass.VOLTAGE, unique_name_override='Vrms', deadband=0.5),
+    SensorType('irms', 'i', 'Current', UnitOfElectricCurrent.AMPERE, SensorDeviceClass.CURRENT, unique_name_override='Irms', deadband=0.05),
+    SensorType('freq', 'q', 'Frequency', UnitOfFrequency.HERTZ, SensorDeviceClass.FREQUENCY, deadband=0.05),
+    SensorType('pac', 'a', 'Active Power', UnitOfPower.WATT, SensorDeviceClass.POWER, deadband=1),
+    SensorType('preac', 'r', 'Reactive Power', UnitOfReactivePower.VOLT_AMPERE_REACTIVE, SensorDeviceClass.REACTIVE_POWER, deadband=1),
+    SensorType('pap', 'p', 'Apparent Power', UnitOfApparentPower.VOLT_AMPERE, SensorDeviceClass.APPARENT_POWER, deadband=1),
+    SensorType('fpot', 'f', 'Power Factor', None, SensorDeviceClass.POWER_FACTOR, deadband=0.01),
     SensorType('eac', 'e', 'Active Energy', UnitOfEnergy.WATT_HOUR, SensorDeviceClass.ENERGY),
     SensorType('ereactl', 'o', 'Inductive Reactive Energy', ENERGY_VOLT_AMPERE_REACTIVE_HOUR, ENERGY_VOLT_AMPERE_REACTIVE_HOUR),
     # Diagnostic sensors:
@@ -159,6 +180,17 @@ KNOWN_SENSORS = (
     SensorType('phasesSequence', 'ps', 'Phases Sequence', entity_category=EntityCategory.DIAGNOSTIC, slots=(Slot.Device,)),
 )
 
+
+def _known_numeric_vars(var_name: Callable[[SensorType, Slot], str]) -> frozenset[str]:
+    return frozenset(var_name(st, slot) for st in KNOWN_SENSORS if st.state_class is not None for slot in st.slots)
+
+
+NUMERIC_PUSH_VARS = _known_numeric_vars(lambda st, slot: f"{st.push_var_prefix}{slot.value.push_var_suffix}")
+"""Push params of known sensors that have numeric values."""
+
+NUMERIC_POLL_VARS = _known_numeric_vars(lambda st, slot: f"{st.poll_var_prefix}{slot.value.poll_var_suffix}")
+"""values.xml variables of known sensors that have numeric values."""
+
 KNOWN_MODELS: Mapping[str, str] = MappingProxyType({
     'WBM': 'Wibeee 1Ph',
     'WBT': 'Wibeee 3Ph',
@@ -186,34 +218,177 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
     ))
 
 
-def update_sensors(sensors: Iterable['WibeeeSensor'], update_source: str,
+def update_sensors(sensors: Collection['WibeeeSensor'], update_source: str,
                    lookup_key: Callable[['WibeeeSensor'], str], data: dict[str, Any]):
-    if _LOGGER.isEnabledFor(logging.DEBUG):
-        sensors_with_updates = [s for s in sensors if lookup_key(s) in data]
-        _LOGGER.debug('Received %d sensor values from %s: %s', len(sensors_with_updates), update_source, data)
+    _LOGGER.debug('Updating %d sensors from %s: %s', len(sensors), update_source, data)
+    _update_values(sensors, update_source, lookup_key, data)
+
 
+def _update_values(sensors: Iterable['WibeeeSensor'], update_source: str,
+                   lookup_key: Callable[['WibeeeSensor'], str], data: dict[str, Any]):
     for s in sensors:
         value = data.get(lookup_key(s), STATE_UNAVAILABLE)
         s.update_value(value, update_source)
 
 
-async def async_setup_local_push(hass: HomeAssistant, entry: ConfigEntry, mac_address: str, sensors: list['WibeeeSensor']):
+def _make_push_dispatcher(sensors: Iterable['WibeeeSensor'], state_writer: Optional['StateWriteBatcher'] = None,
+                          sample_buffer: Optional[SampleRingBuffer] = None,
+                          capture: Optional[PushCapture] = None,
+                          frame_tracer: Optional[FrameTracer] = None) -> Callable[[dict[str, Any]], None]:
+    """
+    Returns a function that updates the sensors found in push data, indexing the sensors by push param only once. The push
+    data must have been decoded by a `ValueDecoder` already, which the Nest proxy does on its own thread.
+    """
+    sensors_by_push_param: Mapping[str, WibeeeSensor] = MappingProxyType({s.nest_push_param: s for s in sensors})
+
+    def dispatch_push_data(pushed_data: dict[str, Any]) -> None:
+        if state_writer:
+            state_writer.start_frame()
+
+        if sample_buffer is not None or capture is not None:
+            received_at = time.time()
+            if sample_buffer is not None:
+                sample_buffer.append(received_at, pushed_data)
+            if capture is not None:
+                capture.append(received_at, pushed_data)
+
+        # only visit the params in the push, the device only sends a subset of the known sensors.
+        trace = frame_tracer.active if frame_tracer is not None else NULL_TRACE
+        trace.mark('update_sensors_start')
+        pushed_sensors = [s for param in pushed_data if (s := sensors_by_push_param.get(param)) is not None]
+        _LOGGER.debug('Received %d sensor values in %d push params: %s', len(pushed_sensors), len(pushed_data), pushed_data)
+        _update_values(pushed_sensors, 'Nest push', lambda s: s.nest_push_param, pushed_data)
+        trace.mark('update_sensors_end')
+
+    return dispatch_push_data
+
+
+async def async_setup_local_push(hass: HomeAssistant, entry: ConfigEntry, mac_address: str, sensors: list['WibeeeSensor'],
+                                 state_writer: 'StateWriteBatcher', push_received: Callable[[], None] = lambda: None):
     nest_proxy = await get_nest_proxy(hass)
     update_devices = await _setup_update_devices_local_push(hass, entry)
+    sample_buffer = _setup_sample_buffer(hass, entry, sensors)
+    capture = None
+    if entry.options.get(CONF_CAPTURE_PUSH):
+        capture_columns = dict(zip(sample_buffer.push_params, sample_buffer.column_names))
+        capture = PushCapture(Path(hass.config.path(f'{DOMAIN}_capture', mac_address)), capture_columns)
+    frame_tracer = hass.data.setdefault(DATA_FRAME_TRACERS, {})[entry.entry_id] = FrameTracer()
+    dispatch_push_data = _make_push_dispatcher(sensors, state_writer, sample_buffer, capture, frame_tracer)
+    # used on the Nest proxy's thread only, polled values are decoded by another ValueDecoder on Home Assistant's.
+    value_decoder = ValueDecoder(entry.title)
 
     def on_pushed_data(pushed_data: dict) -> None:
-        pushed_sensors = {s.unique_id: s for s in sensors if s.nest_push_param in pushed_data}
-        update_sensors(pushed_sensors.values(), 'Nest push', lambda s: s.nest_push_param, pushed_data)
+        push_received()
+        dispatch_push_data(pushed_data)
         update_devices(pushed_data)
 
-    def unregister_listener():
-        nest_proxy.unregister_device(mac_address)
+    spool = None
+    if spool_size := entry.options.get(CONF_NEST_SPOOL_SIZE):
+        spool = nest_proxy.get_spool(mac_address, Path(hass.config.path(f'{DOMAIN}_spool', mac_address)), int(spool_size * 1024 * 1024))
 
     upstream = entry.options.get(CONF_NEST_UPSTREAM)
-    nest_proxy.register_device(mac_address, on_pushed_data, upstream)
+    push_interval = int(entry.options[CONF_PUSH_INTERVAL]) if CONF_PUSH_INTERVAL in entry.options else None
+    unregister_device = nest_proxy.register_device(mac_address, on_pushed_data, upstream, entry.options.get(CONF_NEST_ASYNC_FORWARD, False), spool,
+                                                   push_interval, frame_tracer,
+                                                   lambda push_data: value_decoder.decode(push_data, NUMERIC_PUSH_VARS, 'Nest push'))
+
+    def unregister_listener():
+        unregister_device()
+        hass.data[DATA_SAMPLE_BUFFERS].pop(entry.entry_id, None)
+        hass.data[DATA_FRAME_TRACERS].pop(entry.entry_id, None)
+        if capture is not None:
+            hass.async_create_task(capture.async_close())
+
     return unregister_listener
 
 
+def _setup_sample_buffer(hass: HomeAssistant, entry: ConfigEntry, sensors: list['WibeeeSensor']) -> SampleRingBuffer:
+    """Creates the buffer of recent push samples for the numeric sensors, available through the `get_samples` service."""
+    numeric_sensors = sorted((s for s in sensors if s.nest_push_param in NUMERIC_PUSH_VARS), key=lambda s: s.poll_var_name)
+    sample_buffer = SampleRingBuffer({s.nest_push_param: s.poll_var_name for s in numeric_sensors}, SAMPLE_BUFFER_SIZE)
+    hass.data.setdefault(DATA_SAMPLE_BUFFERS, {})[entry.entry_id] = sample_buffer
+    return sample_buffer
+
+
+def setup_polling_fallback(hass: HomeAssistant, entry: ConfigEntry, api: WibeeeAPI, wibeee_id: str, sensors: list['WibeeeSensor'],
+                           poll_interval: timedelta, value_decoder: 'ValueDecoder') -> tuple[Callable[[], None], CALLBACK_TYPE]:
+    """
+    Polls values.xml while the device is not pushing data, making one request per interval that updates all sensors. Polling
+    stops as soon as pushes resume so that the device never has to serve both. Only the variables of enabled sensors are
+    requested.
+
+    Returns a callback to be invoked whenever push data is received, and a callback that stops polling.
+    """
+    entity_registry = er.async_get(hass)
+    last_push = dt_util.utcnow()
+    polling = False
+    fetching = False
+    polled_sensors: list[WibeeeSensor] | None = None
+
+    def enabled_sensors() -> list[WibeeeSensor]:
+        registry_entries = {s: entity_registry.async_get(s.entity_id) if s.entity_id else None for s in sensors}
+        return [s for s, registry_entry in registry_entries.items() if registry_entry is None or not registry_entry.disabled]
+
+    @callback
+    def is_enabled_change(event_data: er.EventEntityRegistryUpdatedData) -> bool:
+        if event_data['action'] == 'update' and 'disabled_by' not in event_data['changes']:
+            return False
+
+        # entity ids are read on each event, they are only assigned once the sensors have been added.
+        return event_data['entity_id'] in {s.entity_id for s in sensors}
+
+    @callback
+    def registry_updated(_: Event[er.EventEntityRegistryUpdatedData]) -> None:
+        nonlocal polled_sensors
+        polled_sensors = None  # recomputed on next poll
+
+    def push_received() -> None:
+        nonlocal last_push, polling
+        last_push = dt_util.utcnow()
+        if polling:
+            polling = False
+            _LOGGER.info("Push data received for '%s', stopped polling", entry.title)
+
+    async def poll_while_push_stale(now: datetime) -> None:
+        nonlocal polling, fetching, polled_sensors
+        if now - last_push < poll_interval or fetching:
+            return
+
+        if not polling:
+            polling = True
+            _LOGGER.info("No push data received for '%s' since %s, polling every %s", entry.title, as_local(last_push).ctime(), poll_interval)
+
+        if polled_sensors is None:
+            polled_sensors = enabled_sensors()
+            _LOGGER.debug("Polling %d enabled sensors of %d for '%s'", len(polled_sensors), len(sensors), entry.title)
+
+        sensors_to_update = polled_sensors
+        if not sensors_to_update:
+            return
+
+        fetching = True
+        try:
+            values = await api.async_fetch_values(wibeee_id, sorted({s.poll_var_name for s in sensors_to_update}))
+        finally:
+            fetching = False
+
+        # a push may have arrived while fetching, in which case the polled values are no longer needed.
+        if values and polling:
+            decoded = value_decoder.decode(values, NUMERIC_POLL_VARS, 'poll')
+            # sensors whose value was malformed keep their last value, only those missing from values.xml are unavailable.
+            sensors_to_update = [s for s in sensors_to_update if s.poll_var_name in decoded or s.poll_var_name not in values]
+            update_sensors(sensors_to_update, 'poll', lambda s: s.poll_var_name, decoded)
+
+    unsubscribe_registry = hass.bus.async_listen(er.EVENT_ENTITY_REGISTRY_UPDATED, registry_updated, event_filter=is_enabled_change)
+    unsubscribe_interval = async_track_time_interval(hass, poll_while_push_stale, poll_interval, name=f'wibeee_poll_fallback_{entry.entry_id}')
+
+    def unsubscribe() -> None:
+        unsubscribe_registry()
+        unsubscribe_interval()
+
+    return push_received, unsubscribe
+
+
 async def _setup_update_devices_local_push(hass: HomeAssistant, entry: ConfigEntry) -> Callable[[dict[str, Any]], type(None)]:
     device_registry = dr.async_get(hass)
     update_devices = {d.id: d
@@ -249,12 +424,25 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
     """Set up a Wibeee from a config entry."""
     _LOGGER.debug(f"Setting up Wibeee Sensors for '{entry.unique_id}'...")
 
-    session = async_get_clientsession(hass)
     host = entry.data[CONF_HOST]
+    session = async_get_device_session(hass, host, int(entry.options.get(CONF_DEVICE_CONNECTIONS, DEFAULT_DEVICE_CONNECTIONS)),
+                                       timedelta(seconds=entry.options.get(CONF_DEVICE_KEEPALIVE, DEFAULT_DEVICE_KEEPALIVE.total_seconds())))
     mac_addr = entry.data[CONF_MAC_ADDRESS]
     wibeee_id = entry.data[CONF_WIBEEE_ID]
     timeout = timedelta(seconds=entry.options.get(CONF_TIMEOUT, DEFAULT_TIMEOUT.total_seconds()))
     throttle = timedelta(seconds=entry.options.get(CONF_THROTTLE, DEFAULT_THROTTLE.total_seconds()))
+    poll_fallback = timedelta(seconds=entry.options.get(CONF_POLL_FALLBACK, 0))
+    write_max_age = WRITE_ON_CHANGE_MAX_AGE if entry.options.get(CONF_WRITE_ON_CHANGE, False) else None
+
+    state_writer = StateWriteBatcher(hass)
+    entry.async_on_unload(state_writer.cancel)
+    value_decoder = ValueDecoder(entry.title)
+
+    throttle_scheduler = None
+    if throttle.total_seconds() > 0:
+        throttle_scheduler = ThrottleScheduler(hass, throttle, name=f'wibeee_throttle_{entry.entry_id}',
+                                               aggregate=entry.options.get(CONF_THROTTLE_AGGREGATE, False))
+        entry.async_on_unload(throttle_scheduler.cancel)
 
     # first set up the Nest proxy. it's important to do this first because the device will not respond to status.xml
     # calls if it is unable to push data up to Wibeee Nest, causing this integration to fail at start-up.
@@ -266,6 +454,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
         """Discover existing sensors using Wibeee APIs."""
         device = await api.async_fetch_device_info(retries=5)
         fetched_values = await api.async_fetch_values(device.id, retries=10)
+        initial_values = value_decoder.decode(fetched_values, NUMERIC_POLL_VARS, 'values.xml')
 
         known_poll_var_slots = _known_sensor_slots(lambda sensor_type, slot: f"{sensor_type.poll_var_prefix}{slot.value.poll_var_suffix}")
         fetched_slots = {slot for v in fetched_values if v in known_poll_var_slots for _, slot in [known_poll_var_slots[v]]}
@@ -275,48 +464,13 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
                    for slot in fetched_slots}
 
         return [
-            WibeeeSensor(mac_addr, device, slot, sensor_type, throttle, fetched_values.get(poll_var))
+            WibeeeSensor(mac_addr, device, slot, sensor_type, throttle_scheduler, initial_values.get(poll_var), state_writer, write_max_age)
             for poll_var in fetched_values if poll_var in known_poll_var_slots
             for sensor_type, slot in [known_poll_var_slots[poll_var]]
             if (device := devices[slot])
         ]
 
-    def rehydrate_saved_entities() -> list['WibeeeSensor']:
-        """Attempt to restore previously-created sensors based on the Device and Entry registries without using Wibeee APIs."""
-        device_registry = dr.async_get(hass)
-        entity_registry = er.async_get(hass)
-
-        # device | identifiers={(DOMAIN, f'{mac_addr}_L{sensor_phase}' if is_clamp else mac_addr)},
-        reg_devices: dict[str, HassDeviceInfo] = {
-            device_id: _rehydrate_device_info(device_registry, d)
-            for d in dr.async_entries_for_config_entry(device_registry, entry.entry_id)
-            if (ids := [i[1] for i in d.identifiers if i[0] == DOMAIN])
-            for device_id in ids
-        }
-
-        known_unique_name_slots = _known_sensor_slots(lambda st, slot: f'{st.unique_name.lower()}_{slot.value.unique_name_suffix}')
-
-        reg_sensors: list[WibeeeSensor] = [
-            WibeeeSensor(device_mac_addr, device, slot, sensor_type, throttle, initial_value=None)
-            for entity_entry in er.async_entries_for_config_entry(entity_registry, entry.entry_id)
-            if entity_entry.domain == Platform.SENSOR
-
-            # sensor.unique_id = f"_{device_mac_addr}_{sensor_type.unique_name.lower()}_{sensor_phase}"
-            if entity_entry.unique_id.count('_') >= 3
-            for device_mac_addr, unique_name, slot_num_value in [re.search(r'_([^_]+)_(\w+)_(\d)', entity_entry.unique_id).groups()]
-            if (unique_name_slot := f'{unique_name}_{slot_num_value}')
-
-            if unique_name_slot in known_unique_name_slots
-            for sensor_type, slot in [known_unique_name_slots[unique_name_slot]]
-
-            if (device_id := f'{mac_addr}_L{slot.value.unique_name_suffix}' if slot.value.is_clamp else mac_addr)
-            if device_id in reg_devices
-            if (device := reg_devices[device_id])
-        ]
-
-        return reg_sensors
-
-    sensors = rehydrate_saved_entities() or await create_fetched_entities()
+    sensors = rehydrate_saved_entities(hass, entry, throttle_scheduler, state_writer, write_max_age) or await create_fetched_entities()
 
     # Diag/Top sensors need to be added first because they are referenced by the other sensors.
     async_add_entities(sorted(sensors, key=lambda s: s.slot.value.unique_name_suffix, reverse=True), True)
@@ -324,18 +478,64 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
         _LOGGER.debug("Added '%s' (unique_id=%s)", sensor, sensor.unique_id)
 
     entry.async_on_unload(setup_repairs(hass, entry, sensors))
-    entry.async_on_unload(await async_setup_local_push(hass, entry, mac_addr, sensors))
+
+    push_received = lambda: None
+    if poll_fallback.total_seconds() > 0:
+        push_received, stop_polling = setup_polling_fallback(hass, entry, api, wibeee_id, sensors, poll_fallback, value_decoder)
+        entry.async_on_unload(stop_polling)
+
+    entry.async_on_unload(await async_setup_local_push(hass, entry, mac_addr, sensors, state_writer, push_received))
 
     _LOGGER.info(f"Setup completed for '{entry.unique_id}' (host={host}, mac_addr={mac_addr}, wibeee_id: {wibeee_id}, "
-                 f"timeout={timeout}, throttle={throttle})")
+                 f"timeout={timeout}, throttle={throttle}, poll_fallback={poll_fallback}, write_max_age={write_max_age})")
     return True
 
 
+def rehydrate_saved_entities(hass: HomeAssistant, entry: ConfigEntry, throttle_scheduler: Optional['ThrottleScheduler'],
+                             state_writer: 'StateWriteBatcher', write_max_age: Optional[timedelta]) -> list['WibeeeSensor']:
+    """Attempt to restore previously-created sensors based on the Device and Entry registries without using Wibeee APIs."""
+    device_registry = dr.async_get(hass)
+    entity_registry = er.async_get(hass)
+    mac_addr = entry.data[CONF_MAC_ADDRESS]
+
+    # device | identifiers={(DOMAIN, f'{mac_addr}_L{sensor_phase}' if is_clamp else mac_addr)},
+    reg_devices: dict[str, HassDeviceInfo] = {
+        device_id: _rehydrate_device_info(device_registry, d)
+        for d in dr.async_entries_for_config_entry(device_registry, entry.entry_id)
+        if (ids := [i[1] for i in d.identifiers if i[0] == DOMAIN])
+        for device_id in ids
+    }
+
+    known_unique_name_slots = _known_sensor_slots(lambda st, slot: f'{st.unique_name.lower()}_{slot.value.unique_name_suffix}')
+
+    reg_sensors: list[WibeeeSensor] = [
+        WibeeeSensor(device_mac_addr, device, slot, sensor_type, throttle_scheduler, initial_value=None, state_writer=state_writer,
+                     write_max_age=write_max_age)
+        for entity_entry in er.async_entries_for_config_entry(entity_registry, entry.entry_id)
+        if entity_entry.domain == Platform.SENSOR
+
+        # sensor.unique_id = f"_{device_mac_addr}_{sensor_type.unique_name.lower()}_{sensor_phase}"
+        if entity_entry.unique_id.count('_') >= 3
+        for device_mac_addr, unique_name, slot_num_value in [re.search(r'_([^_]+)_(\w+)_(\d)', entity_entry.unique_id).groups()]
+        if (unique_name_slot := f'{unique_name}_{slot_num_value}')
+
+        if unique_name_slot in known_unique_name_slots
+        for sensor_type, slot in [known_unique_name_slots[unique_name_slot]]
+
+        if (device_id := f'{mac_addr}_L{slot.value.unique_name_suffix}' if slot.value.is_clamp else mac_addr)
+        if device_id in reg_devices
+        if (device := reg_devices[device_id])
+    ]
+
+    return reg_sensors
+
+
 def setup_repairs(hass: HomeAssistant, entry: ConfigEntry, sensors: list['WibeeeSensor']) -> CALLBACK_TYPE:
     issue_id = f'wibeee_stale_states_checker_{entry.entry_id}'
     stale_threshold = timedelta(minutes=1)
 
-    async def check_for_stale_states(now: datetime):
+    @callback
+    def check_for_stale_states(now: datetime) -> None:
         stale_cutoff_time = now - (stale_threshold * 1.5)
         stale_states = {sensor: state for sensor in sensors
                         if (state := hass.states.get(sensor.entity_id))
@@ -367,17 +567,230 @@ def setup_repairs(hass: HomeAssistant, entry: ConfigEntry, sensors: list['Wibeee
 
 
 def _is_zero_value(value: StateType) -> bool:
+    if isinstance(value, (int, float, Decimal)):
+        return value == 0
+
     try:
         return float(value) == 0.0
     except (TypeError, ValueError):
         return False
 
 
+class ValueDecoder(object):
+    """
+    Converts the values of numeric variables received from a device to int or Decimal once, before they are used to update
+    sensors, keeping the number of decimal places sent by the device. Values that are not valid numbers are counted and
+    left out, so they never reach the sensors.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.malformed = 0
+        self._warned_vars: set[str] = set()
+
+    def decode(self, data: dict[str, Any], numeric_vars: frozenset[str], update_source: str) -> dict[str, StateType]:
+        decoded = dict(data)
+        for var_name, value in data.items():
+            if var_name in numeric_vars and isinstance(value, str):
+                try:
+                    decoded[var_name] = _parse_number(value)
+                except ValueError:
+                    del decoded[var_name]
+                    self._malformed_number(var_name, value, update_source)
+
+        return decoded
+
+    def _malformed_number(self, var_name: str, value: str, update_source: str) -> None:
+        self.malformed += 1
+        if var_name not in self._warned_vars:
+            self._warned_vars.add(var_name)
+            _LOGGER.warning("Ignoring malformed number received from %s for '%s': %s=%r", update_source, self.name, var_name, value)
+        else:
+            _LOGGER.debug("Ignoring malformed number received from %s for '%s': %s=%r (%d so far)", update_source, self.name,
+                          var_name, value, self.malformed)
+
+
+def _parse_number(value: str) -> int | Decimal:
+    """Parses a number as sent by Wibeee devices (e.g. '230', '-615' or '0.700'), raising ValueError if it isn't one."""
+    try:
+        return int(value)
+    except ValueError:
+        pass
+
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'Not a number: {value}') from None
+
+    if not number.is_finite():
+        raise ValueError(f'Not a finite number: {value}')
+    return number
+
+
+class StateWriteBatcher(object):
+    """
+    Defers sensor state writes so that all sensors updated by a push frame have their states written in a single event
+    loop callback. Frames that arrive before the pending writes have been flushed are coalesced into the same flush.
+
+    Only the scheduling is batched: the flush still writes each sensor's state separately, so every sensor whose state is
+    written fires its own `state_changed` event. Fewer states are written only when frames are coalesced.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+        self.frames = 0
+        """Number of frames received."""
+        self.coalesced_frames = 0
+        """Number of frames that were written together with a previous frame."""
+        self._pending: dict[WibeeeSensor, None] = {}
+        self._flush_handle: asyncio.Handle | None = None
+
+    @callback
+    def start_frame(self) -> None:
+        self.frames += 1
+        if self._flush_handle is not None:
+            self.coalesced_frames += 1
+
+    @callback
+    def schedule_write(self, sensor: 'WibeeeSensor') -> None:
+        self._pending[sensor] = None
+        if self._flush_handle is None:
+            self._flush_handle = self.hass.loop.call_soon(self.flush)
+
+    @callback
+    def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending = self._pending, {}
+        for sensor in pending:
+            # sensors may have been removed since their update
+            if sensor.hass is not None:
+                sensor.async_write_ha_state()
+
+        _LOGGER.debug("Wrote %d sensor states (frames=%d, coalesced_frames=%d)", len(pending), self.frames, self.coalesced_frames)
+
+    @callback
+    def cancel(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending = {}
+
+
+class _WindowStats(object):
+    """
+    Running aggregate of the numeric samples received by a sensor within a throttle window, reused across windows. The
+    mean is rounded to the decimal places of the window's last fractional sample, which are only counted when the window
+    is applied: devices send each variable with a fixed number of decimal places, except for values sent as integers.
+    """
+    __slots__ = ('count', 'total', 'min', 'max', 'fractional_sample', 'update_source')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.fractional_sample = None
+        self.update_source = ''
+
+    def add(self, value: StateType, sample: float, update_source: str) -> None:
+        self.count += 1
+        self.total += sample
+        if sample < self.min:
+            self.min = sample
+        if sample > self.max:
+            self.max = sample
+        if type(value) is not int:
+            self.fractional_sample = value
+        self.update_source = update_source
+
+    def mean(self) -> float | int:
+        mean = self.total / self.count
+        decimals = _decimals(self.fractional_sample) if self.fractional_sample is not None else 0
+        return round(mean, decimals) if decimals else round(mean)
+
+
+class ThrottleScheduler(object):
+    """
+    Buffers the latest value of each sensor and applies the values of all updated sensors on a single timer tick per
+    throttle interval. Values that arrive within an interval supersede each other instead of being dropped, so sensors
+    are never more than one interval behind the device.
+
+    When aggregating, numeric samples of measurement sensors are instead accumulated over the interval and the mean is
+    applied, with the min and max available as state attributes.
+    """
+
+    def __init__(self, hass: HomeAssistant, interval: timedelta, name: str, aggregate: bool = False):
+        self.aggregate = aggregate
+        self._latest: dict[WibeeeSensor, tuple[StateType, str]] = {}
+        self._windows: dict[WibeeeSensor, _WindowStats] = {}
+        self._unsubscribe = async_track_time_interval(hass, self._apply_latest, interval, name=name)
+
+    @callback
+    def update(self, sensor: 'WibeeeSensor', value: StateType, update_source: str) -> None:
+        if self.aggregate and sensor.aggregates and value is not STATE_UNAVAILABLE:
+            try:
+                sample = float(value)
+            except (TypeError, ValueError):
+                pass
+            else:
+                if (window := self._windows.get(sensor)) is None:
+                    window = self._windows[sensor] = _WindowStats()
+                window.add(value, sample, update_source)
+                self._latest.pop(sensor, None)
+                return
+
+        self._latest[sensor] = (value, update_source)
+        if (window := self._windows.get(sensor)) is not None:
+            window.reset()
+
+    @callback
+    def discard(self, sensor: 'WibeeeSensor') -> None:
+        self._latest.pop(sensor, None)
+        if (window := self._windows.get(sensor)) is not None:
+            window.reset()
+
+    @callback
+    def _apply_latest(self, _: datetime) -> None:
+        latest, self._latest = self._latest, {}
+        for sensor, (value, update_source) in latest.items():
+            if self.aggregate and sensor.aggregates:
+                sensor._attr_extra_state_attributes = {}
+            sensor._update_ha_state_now(value, update_source)
+
+        for sensor, window in self._windows.items():
+            if window.count:
+                sensor._attr_extra_state_attributes = {'min': window.min, 'max': window.max, 'samples': window.count}
+                sensor._update_ha_state_now(window.mean(), window.update_source)
+                window.reset()
+
+    @callback
+    def cancel(self) -> None:
+        self._unsubscribe()
+        self._latest = {}
+        self._windows = {}
+
+
+def _decimals(value: StateType) -> int:
+    """Returns the number of decimal places in a value received from the device (e.g. 2 for '235.06')."""
+    if isinstance(value, Decimal):
+        return max(-value.as_tuple().exponent, 0)
+
+    text = value if isinstance(value, str) else str(value)
+    dot = text.find('.')
+    return len(text) - dot - 1 if dot >= 0 else 0
+
+
 class WibeeeSensor(SensorEntity):
     """Implementation of Wibeee sensor."""
 
-    def __init__(self, mac_addr: str, device_info: HassDeviceInfo, slot: Slot, sensor_type: SensorType, throttle: timedelta,
-                 initial_value: StateType):
+    def __init__(self, mac_addr: str, device_info: HassDeviceInfo, slot: Slot, sensor_type: SensorType, throttle: ThrottleScheduler | None,
+                 initial_value: StateType, state_writer: StateWriteBatcher | None = None, write_max_age: timedelta | None = None):
         """Initialize the sensor."""
         self._attr_native_unit_of_measurement = sensor_type.unit
         self._attr_native_value = initial_value
@@ -392,11 +805,13 @@ class WibeeeSensor(SensorEntity):
         self._attr_device_info = device_info
         self.slot = slot
         self.nest_push_param = f"{sensor_type.push_var_prefix}{slot.value.push_var_suffix}"
+        self.poll_var_name = f"{sensor_type.poll_var_prefix}{slot.value.poll_var_suffix}"
         self.sensor_type = sensor_type
-        if throttle.total_seconds() > 0:
-            self._update_ha_state = util.Throttle(throttle)(self._update_ha_state_now)
-        else:
-            self._update_ha_state = self._update_ha_state_now
+        self.state_writer = state_writer
+        self.write_max_age = write_max_age.total_seconds() if write_max_age else None
+        self._written_at: float | None = None
+        self.throttle = throttle
+        self.aggregates = sensor_type.state_class == SensorStateClass.MEASUREMENT
 
     @callback
     def update_value(self, value: StateType, update_source: str = '') -> None:
@@ -406,19 +821,48 @@ class WibeeeSensor(SensorEntity):
             if prev is not None and _is_zero_value(value) and not _is_zero_value(prev):
                 self._attr_last_reset = dt_util.utcnow()
                 _LOGGER.warning("Energy counter reset detected for %s (previous=%s)", self, prev)
+                if self.throttle:
+                    self.throttle.discard(self)
                 self._update_ha_state_now(value, update_source)
                 return
 
-        self._update_ha_state(value, update_source)
+        if self.throttle:
+            self.throttle.update(self, value, update_source)
+        else:
+            self._update_ha_state_now(value, update_source)
 
     @callback
     def _update_ha_state_now(self, value: StateType, update_source: str = '') -> None:
         if self.enabled:
+            if self.write_max_age is not None and not self._is_write_needed(value):
+                return
+
+            self._written_at = time.monotonic()
             self._attr_native_value = None if value is STATE_UNAVAILABLE else value
             self._attr_available = value is not STATE_UNAVAILABLE
-            self.async_schedule_update_ha_state()
+            if self.state_writer:
+                self.state_writer.schedule_write(self)
+            else:
+                self.async_schedule_update_ha_state()
             _LOGGER.debug("Updating from %s: %s", update_source, self)
 
+    def _is_write_needed(self, value: StateType) -> bool:
+        """Whether `value` differs from the written state by more than the deadband, or the written state is too old."""
+        if self._written_at is None or time.monotonic() - self._written_at >= self.write_max_age:
+            return True
+
+        prev = self._attr_native_value if self._attr_available else STATE_UNAVAILABLE
+        if value == prev:
+            return False
+
+        if self.sensor_type.deadband and value is not STATE_UNAVAILABLE and prev is not STATE_UNAVAILABLE:
+            try:
+                return abs(float(value) - float(prev)) >= self.sensor_type.deadband
+            except (TypeError, ValueError):
+                pass
+
+        return True
+
 
 def _make_device_info(device: DeviceInfo, slot: Slot, via_device: DeviceInfo | None) -> HassDeviceInfo:
     mac_addr = device.macAddr
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import math
+import threading
+from collections.abc import Iterable
+
+import homeassistant.helpers.config_validation as cv
+import homeassistant.util.dt as dt_util
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse, callback
+from homeassistant.exceptions import ServiceValidationError
+from homeassistant.helpers.selector import ConfigEntrySelector
+
+from .const import DOMAIN
+from .nest import NEST_PROXY_THREAD_NAME
+from .profiling import StackSampler
+from .samples import DATA_SAMPLE_BUFFERS, SampleRingBuffer
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_CONFIG_ENTRY = 'config_entry'
+ATTR_START = 'start'
+ATTR_END = 'end'
+ATTR_DURATION = 'duration'
+
+SERVICE_GET_SAMPLES = 'get_samples'
+SERVICE_GET_SAMPLES_SCHEMA = vol.Schema({
+    vol.Required(ATTR_CONFIG_ENTRY): ConfigEntrySelector({'integration': DOMAIN}),
+    vol.Optional(ATTR_START): cv.datetime,
+    vol.Optional(ATTR_END): cv.datetime,
+})
+
+SERVICE_PROFILE = 'profile'
+SERVICE_PROFILE_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_DURATION, default=60): vol.All(vol.Coerce(float), vol.Range(min=1, max=3600)),
+})
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Registers the Wibeee services."""
+
+    @callback
+    def get_samples(call: ServiceCall) -> ServiceResponse:
+        """Returns the recent push samples of a device, as one list of values per variable."""
+        sample_buffer: SampleRingBuffer | None = hass.data.get(DATA_SAMPLE_BUFFERS, {}).get(call.data[ATTR_CONFIG_ENTRY])
+        if sample_buffer is None:
+            raise ServiceValidationError(translation_domain=DOMAIN, translation_key='entry_not_loaded')
+
+        # times without a time zone, as entered in the UI, are in Home Assistant's time zone.
+        start, end = (dt_util.as_local(value).timestamp() if (value := call.data.get(attr)) else default
+                      for attr, default in [(ATTR_START, -math.inf), (ATTR_END, math.inf)])
+        return sample_buffer.window(start, end)
+
+    hass.services.async_register(DOMAIN, SERVICE_GET_SAMPLES, get_samples, schema=SERVICE_GET_SAMPLES_SCHEMA,
+                                 supports_response=SupportsResponse.ONLY)
+
+    profiling = False
+
+    async def profile(call: ServiceCall) -> ServiceResponse:
+        """
+        Samples the integration's code running in the event loop and in the Nest proxy's thread for a while, writing the
+        stacks to the config dir.
+        """
+        nonlocal profiling
+        if profiling:
+            raise ServiceValidationError(translation_domain=DOMAIN, translation_key='profile_in_progress')
+
+        profiling = True
+        try:
+            threads = {threading.get_ident(): 'event_loop'}
+            threads |= {t.ident: t.name for t in threading.enumerate() if t.name == NEST_PROXY_THREAD_NAME}
+            sampler = StackSampler(threads)
+            sampler.start()
+            try:
+                await asyncio.sleep(call.data[ATTR_DURATION])
+            finally:
+                sampler.stop()
+        finally:
+            profiling = False
+
+        path = hass.config.path(f'{DOMAIN}_profile_{dt_util.utcnow():%Y%m%dT%H%M%S}.collapsed')
+        await hass.async_add_executor_job(_write_lines, path, sampler.collapsed())
+        _LOGGER.info('Wrote %d of %d profile samples to %s', sampler.stacks.total(), sampler.samples, path)
+        return {'path': path, 'samples': sampler.samples, 'integration_samples': sampler.stacks.total()}
+
+    hass.services.async_register(DOMAIN, SERVICE_PROFILE, profile, schema=SERVICE_PROFILE_SCHEMA,
+                                 supports_response=SupportsResponse.OPTIONAL)
+
+
+def _write_lines(path: str, lines: Iterable[str]) -> None:
+    with open(path, 'w') as f:
+        f.writelines(lines)
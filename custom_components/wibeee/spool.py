@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from .const import NEST_SPOOL_REPLAY_RATE, NEST_SPOOL_SEGMENT_SIZE
+
+LOGGER = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<BHHI')
+"""Record header: flags, method length, path length, body length."""
+
+_FLAG_NO_BODY = 1
+_FLAG_TEXT_BODY = 2
+
+_SEGMENT_SUFFIX = '.seg'
+_CURSOR_FILE = 'cursor'
+
+
+class SpoolRecord(NamedTuple):
+    method: str
+    path_qs: str
+    """Path and query string of the request, which is sent to the upstream configured at the time of replay."""
+    body: str | bytes | None
+
+
+class UpstreamSpool(object):
+    """
+    Persistent store-and-forward buffer for requests that could not be forwarded upstream.
+
+    Records are appended to numbered segment files in `directory` and read back in order from a cursor that is saved next
+    to them. Segments are deleted once they have been replayed, and the oldest segments are deleted when the spool grows
+    beyond `max_bytes`. The blocking methods must be called from an executor, the `async_*` methods do that.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, segment_bytes: int = NEST_SPOOL_SEGMENT_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = min(segment_bytes, max_bytes)
+        self._max_segment_bytes = segment_bytes
+        self.appended = 0
+        self.replayed = 0
+        self.dropped_bytes = 0
+        """Bytes deleted to keep the spool within `max_bytes`, including records that were never replayed."""
+        self._lock = threading.Lock()
+        self._segments: dict[int, int] | None = None
+        """Size of each segment by segment number, oldest first. None until the spool is opened."""
+        self._cursor: tuple[int, int] = (0, 0)
+        """Segment number and offset of the next record to replay."""
+        self._replay_task: asyncio.Task | None = None
+        self._replay_paused = False
+
+    @property
+    def size(self) -> int:
+        """Size of the spool on disk in bytes (including replayed records that haven't been compacted yet)."""
+        return sum(self._segments.values()) if self._segments else 0
+
+    def append(self, record: SpoolRecord) -> None:
+        flags, body = _encode_body(record.body)
+        method, path_qs = record.method.encode(), record.path_qs.encode()
+        data = _HEADER.pack(flags, len(method), len(path_qs), len(body)) + method + path_qs + body
+
+        with self._lock:
+            self._open()
+            segment = next(reversed(self._segments))
+            if self._segments[segment] > 0 and self._segments[segment] + len(data) > self.segment_bytes:
+                segment += 1
+
+            with open(self._segment_path(segment), 'ab') as f:
+                f.write(data)
+
+            self._segments[segment] = self._segments.get(segment, 0) + len(data)
+            self.appended += 1
+            self._enforce_retention()
+
+    def peek(self) -> Optional[tuple[SpoolRecord, tuple[int, int]]]:
+        """Returns the next record to replay and its position, to be passed to `commit`, or None if the spool is empty."""
+        with self._lock:
+            self._open()
+            while True:
+                segment, offset = self._cursor
+                if offset < self._segments.get(segment, 0):
+                    return self._read(segment, offset)[0], self._cursor
+
+                if segment == next(reversed(self._segments)):
+                    return None
+
+                # done with this segment, move on to the next one.
+                self._compact(segment)
+
+    def commit(self, position: tuple[int, int]) -> None:
+        """Marks the record at `position`, as returned by `peek`, as replayed."""
+        with self._lock:
+            if position != self._cursor:
+                # the record was dropped to enforce retention while it was being replayed, the cursor already moved on.
+                return
+
+            segment, offset = position
+            _, length = self._read(segment, offset)
+            self._cursor = (segment, offset + length)
+            self.replayed += 1
+
+            if self._cursor[1] >= self._segments[segment]:
+                self._compact(segment)
+
+            self._save_cursor()
+
+    def resize(self, max_bytes: int) -> None:
+        """Changes the maximum size of the spool, which is enforced on the next append."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.segment_bytes = min(self._max_segment_bytes, max_bytes)
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            self._open()
+            segment, offset = self._cursor
+            return segment == next(reversed(self._segments)) and offset >= self._segments[segment]
+
+    async def async_append(self, record: SpoolRecord) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.append, record)
+
+    async def async_append_if_pending(self, record: SpoolRecord) -> bool:
+        """
+        Appends `record` if there are records waiting to be replayed, so that the upstream receives data in the order it
+        was pushed. Returns whether the record was appended, otherwise it can be sent upstream straight away.
+        """
+        if self._segments is None:
+            pending = not await asyncio.get_running_loop().run_in_executor(None, self.is_empty)
+        else:
+            pending = self._is_pending()
+
+        if pending:
+            await self.async_append(record)
+        return pending
+
+    def async_replay(self, send: Callable[[SpoolRecord], Awaitable[bool]], rate: float = NEST_SPOOL_REPLAY_RATE) -> None:
+        """
+        Starts replaying the spool in the background (unless it's already being replayed), sending at most `rate`
+        records per second. Replay stops when `send` returns False, and resumes on the next call.
+        """
+        if self._replay_paused:
+            return
+        if self._segments is not None and not self._is_pending():
+            return  # nothing to replay.
+
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = asyncio.create_task(self._replay(send, 1 / rate), name=f'wibeee_spool_replay_{self.directory.name}')
+
+    def pause_replay(self) -> None:
+        """
+        Stops replaying the spool until `resume_replay` is called, records can still be appended in the meantime. May be
+        called from any thread, the replay runs on the Nest proxy's event loop.
+        """
+        self._replay_paused = True
+        if self._replay_task is not None:
+            loop = self._replay_task.get_loop()
+            if not loop.is_closed():
+                # the task is kept until it's done, so that a new replay can't start while it's still sending a record.
+                loop.call_soon_threadsafe(self._replay_task.cancel)
+
+    def resume_replay(self) -> None:
+        """Allows the spool to be replayed again, on the next call to `async_replay`."""
+        self._replay_paused = False
+
+    async def _replay(self, send: Callable[[SpoolRecord], Awaitable[bool]], interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._replay_paused and (peeked := await loop.run_in_executor(None, self.peek)) is not None:
+            record, position = peeked
+            if not await send(record):
+                LOGGER.debug('Pausing replay of %s, upstream is not accepting data', self.directory)
+                return
+
+            await loop.run_in_executor(None, self.commit, position)
+            await asyncio.sleep(interval)
+
+        LOGGER.debug('Replayed all spooled requests in %s', self.directory)
+
+    def _is_pending(self) -> bool:
+        """Whether there are records to replay, checked without locking (a record that is being appended may be missed)."""
+        return len(self._segments) > 1 or self._cursor[1] < self._segments.get(self._cursor[0], 0)
+
+    def _open(self) -> None:
+        if self._segments is not None:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        numbers = sorted(int(p.stem) for p in self.directory.glob(f'*{_SEGMENT_SUFFIX}') if p.stem.isdigit())
+        self._segments = {n: self._segment_path(n).stat().st_size for n in numbers} or {0: 0}
+
+        try:
+            segment, offset = (int(n) for n in (self.directory / _CURSOR_FILE).read_text().split())
+        except (FileNotFoundError, ValueError):
+            segment, offset = next(iter(self._segments)), 0
+
+        if segment not in self._segments:
+            segment, offset = next(iter(self._segments)), 0
+        self._cursor = (segment, offset)
+
+        # segments before the cursor were replayed but not compacted yet.
+        for replayed in [n for n in self._segments if n < segment]:
+            self._segment_path(replayed).unlink()
+            del self._segments[replayed]
+
+        self._truncate_torn_record()
+
+    def _truncate_torn_record(self) -> None:
+        """Drops a partially written record at the end of the last segment, e.g. after a crash."""
+        segment = next(reversed(self._segments))
+        offset = self._cursor[1] if self._cursor[0] == segment else 0
+        while offset < self._segments[segment]:
+            try:
+                offset += self._read(segment, offset)[1]
+            except ValueError:
+                LOGGER.warning('Dropping %d bytes of a torn record in %s', self._segments[segment] - offset, self._segment_path(segment))
+                os.truncate(self._segment_path(segment), offset)
+                self._segments[segment] = offset
+
+    def _read(self, segment: int, offset: int) -> tuple[SpoolRecord, int]:
+        """Reads the record at `offset`, returning it and its length."""
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError('Incomplete record header')
+
+            flags, method_len, path_len, body_len = _HEADER.unpack(header)
+            data = f.read(method_len + path_len + body_len)
+            if len(data) < method_len + path_len + body_len:
+                raise ValueError('Incomplete record')
+
+        body = data[method_len + path_len:]
+        record = SpoolRecord(
+            data[:method_len].decode(),
+            data[method_len:method_len + path_len].decode(),
+            None if flags & _FLAG_NO_BODY else body.decode() if flags & _FLAG_TEXT_BODY else body,
+        )
+        return record, _HEADER.size + len(data)
+
+    def _compact(self, segment: int) -> None:
+        """Deletes a fully replayed segment, or empties it if it's the one being appended to."""
+        last = segment == next(reversed(self._segments))
+        self._segment_path(segment).unlink(missing_ok=True)
+        del self._segments[segment]
+        if last:
+            self._segments[segment + 1] = 0
+
+        self._cursor = (next(iter(self._segments)), 0)
+
+    def _enforce_retention(self) -> None:
+        while self.size > self.max_bytes and len(self._segments) > 1:
+            oldest = next(iter(self._segments))
+            self.dropped_bytes += self._segments[oldest] - (self._cursor[1] if self._cursor[0] == oldest else 0)
+            LOGGER.warning('Spool %s exceeds %d bytes, dropping %s', self.directory, self.max_bytes, self._segment_path(oldest))
+            self._compact(oldest)
+            self._save_cursor()
+
+    def _save_cursor(self) -> None:
+        tmp_path = self.directory / f'{_CURSOR_FILE}.tmp'
+        tmp_path.write_text('%d %d' % self._cursor)
+        os.replace(tmp_path, self.directory / _CURSOR_FILE)
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f'{segment:08d}{_SEGMENT_SUFFIX}'
+
+
+def _encode_body(body: str | bytes | None) -> tuple[int, bytes]:
+    if body is None:
+        return _FLAG_NO_BODY, b''
+    if isinstance(body, str):
+        return _FLAG_TEXT_BODY, body.encode()
+    return 0, body
@@ -0,0 +1,148 @@
+"""
+Tracing of the time that each push frame takes at every stage of its handling, exposed in the diagnostics.
+
+The Nest proxy starts a trace when it receives a frame and marks the stages it goes through on the proxy's thread. While
+the frame's push data is being handled, the trace is the `active` trace of the listeners' tracers, so that the sensors
+can mark their own stages without it being passed around. A trace is recorded once both threads are done with it, into
+histograms of each stage's duration and a short history of recent traces.
+"""
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Sequence
+from typing import Any
+
+from .const import DOMAIN, FRAME_TRACE_HISTORY
+from .metrics import Histogram
+
+DATA_FRAME_TRACERS = f'{DOMAIN}_frame_tracers'
+"""Key for the frame tracers of each config entry in hass.data."""
+
+STAGE_DURATIONS = {
+    'decode': ('receive', 'decode'),
+    'handoff': ('handoff', 'handle_start'),
+    'handle_push_data': ('decode', 'handle_push_data'),
+    'update_sensors': ('update_sensors_start', 'update_sensors_end'),
+    'forward': ('forward_start', 'forward_end'),
+    'total': ('receive', 'end'),
+}
+"""The marks that each stage's duration is measured between."""
+
+
+class FrameTrace(object):
+    """
+    Monotonic clock times at which a push frame reached each stage of its handling. A device with several listeners shares
+    the trace between their tracers, so the stages that listeners mark are those of the last listener to mark them.
+    """
+
+    def __init__(self, tracers: Sequence['FrameTracer'], route: str, received_at: float):
+        self.tracers = tuple(tracers)
+        self.route = route
+        self.marks: dict[str, float] = {'receive': received_at}
+        self._pending = 1
+        """Number of threads that are yet to finish with the frame, guarded by `_lock`."""
+        self._lock = threading.Lock()
+
+    def mark(self, stage: str) -> None:
+        self.marks[stage] = time.monotonic()
+
+    def handle(self, handle_push_data: Callable[[dict], None], push_data: dict) -> None:
+        """Calls `handle_push_data`, letting the sensors mark their stages in this trace."""
+        for tracer in self.tracers:
+            tracer.active = self
+        try:
+            handle_push_data(push_data)
+        finally:
+            for tracer in self.tracers:
+                tracer.active = NULL_TRACE
+            self.mark('handle_push_data')
+
+    def handoff(self) -> None:
+        """Marks that the push data is being handed off to another thread, where it's handled by `handle_handed_off`."""
+        with self._lock:
+            self._pending += 1
+        self.mark('handoff')
+
+    def handle_handed_off(self, handle_push_data: Callable[[dict], None], push_data: dict) -> None:
+        """Calls `handle`, recording the trace if the proxy has already finished with the frame."""
+        self.mark('handle_start')
+        try:
+            self.handle(handle_push_data, push_data)
+        finally:
+            self._complete()
+
+    def finish(self) -> None:
+        self.mark('end')
+        self._complete()
+
+    def _complete(self) -> None:
+        with self._lock:
+            self._pending -= 1
+            if self._pending:
+                return
+        for tracer in self.tracers:
+            tracer.record(self)
+
+
+class _NullTrace(FrameTrace):
+    """Trace of frames from devices that aren't traced, which ignores all marks."""
+
+    def __init__(self):
+        pass
+
+    def mark(self, stage: str) -> None:
+        pass
+
+    def handle(self, handle_push_data: Callable[[dict], None], push_data: dict) -> None:
+        handle_push_data(push_data)
+
+    def handoff(self) -> None:
+        pass
+
+    def handle_handed_off(self, handle_push_data: Callable[[dict], None], push_data: dict) -> None:
+        handle_push_data(push_data)
+
+    def finish(self) -> None:
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class FrameTracer(object):
+    """
+    Aggregates the stage durations of a device's push frames into histograms, keeping the last `history` traces. Traces are
+    recorded from the Nest proxy's thread or from Home Assistant's, whichever finishes with the frame last.
+    """
+
+    def __init__(self, history: int = FRAME_TRACE_HISTORY):
+        self.traces: deque[FrameTrace] = deque(maxlen=history)
+        self.histograms = {stage: Histogram() for stage in STAGE_DURATIONS}
+        self.active: FrameTrace = NULL_TRACE
+        """Trace of the frame being handled, for the stages marked outside the Nest proxy."""
+        self._lock = threading.Lock()
+
+    def start(self, route: str, received_at: float) -> FrameTrace:
+        """Starts the trace of a frame received through `route` at `received_at` (in monotonic clock time)."""
+        return FrameTrace((self,), route, received_at)
+
+    def record(self, trace: FrameTrace) -> None:
+        with self._lock:
+            for stage, (start, end) in STAGE_DURATIONS.items():
+                if start in trace.marks and end in trace.marks:
+                    self.histograms[stage].observe(trace.marks[end] - trace.marks[start])
+            self.traces.append(trace)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Returns the histograms and the recent traces, with the time of each mark in ms since the frame was received."""
+        with self._lock:
+            return self._as_dict()
+
+    def _as_dict(self) -> dict[str, Any]:
+        return {
+            'histograms': {stage: histogram.as_dict() for stage, histogram in self.histograms.items()},
+            'traces': [{
+                'route': trace.route,
+                'marks': {stage: round((t - trace.marks['receive']) * 1000, 3) for stage, t in trace.marks.items()},
+            } for trace in self.traces],
+        }
@@ -1,5 +1,3 @@
-from io import BytesIO
-
 from lxml import etree
 
 
@@ -8,14 +6,58 @@ def short_mac(mac_addr):
     return mac_addr.replace(':', '')[-6:].upper()
 
 
-def scrub_values_xml(keys: list[str], xml_text: bytes) -> str:
-    """Scrubs sensitive data from the values.xml response."""
-    tree = etree.parse(BytesIO(xml_text))
+class ValuesXmlParser(object):
+    """
+    Incrementally parses the values.xml and devices.xml responses into a flat dict as the bytes arrive, discarding each
+    element once it has been read instead of building up the whole document.
+
+    `<values><variable><id>macAddr</id><value>11:11:11:11:11:11</value></variable></values>` => {'macAddr': '11:11:11:11:11:11'}
+    `<devices><id>WIBEEE</id></devices>` => {'id': 'WIBEEE'}
+    """
+
+    def __init__(self):
+        self._parser = etree.XMLPullParser(events=('end',))
+        self.values: dict[str, str | None] = {}
+
+    def feed(self, data: bytes) -> None:
+        self._parser.feed(data)
+        self._read_events()
+
+    def close(self) -> dict[str, str | None]:
+        self._parser.close()
+        self._read_events()
+        return self.values
+
+    def _read_events(self) -> None:
+        for _, el in self._parser.read_events():
+            parent = el.getparent()
+            if parent is None or parent.getparent() is not None:
+                # only the root's children are of interest, anything nested is read along with its parent.
+                continue
+
+            if el.tag == 'variable':
+                self.values[_child_text(el, 'id')] = _child_text(el, 'value')
+            elif len(el) == 0:
+                self.values[el.tag] = _text(el)
+
+            # drop the elements that have already been read.
+            el.clear()
+            while el.getprevious() is not None:
+                del parent[0]
+
+
+def parse_values_xml(xml_text: bytes) -> dict[str, str | None]:
+    """Parses a whole values.xml or devices.xml response into a flat dict."""
+    parser = ValuesXmlParser()
+    parser.feed(xml_text)
+    return parser.close()
+
+
+def _child_text(el: etree.ElementBase, tag: str) -> str | None:
+    child = el.find(tag)
+    return _text(child) if child is not None else None
 
-    # <values><variable><id>ssid</id><value>MY_SSID</value></variable></values>
-    for key in keys:
-        values = tree.xpath(f"/values/variable[id/text()='{key}']/value")
-        for v in values:
-            v.text = '**REDACTED**'
 
-    return etree.tostring(tree)
+def _text(el: etree.ElementBase) -> str | None:
+    # same as xmltodict: surrounding whitespace is stripped and empty elements have no value.
+    return (el.text.strip() or None) if el.text else None
@@ -1,11 +1,17 @@
+import asyncio
 import logging
 from datetime import timedelta
+from unittest.mock import patch
 
 import aiohttp
+from aiohttp import web
 from aioresponses import aioresponses
 from pytest_homeassistant_custom_component.common import load_fixture
 
 from custom_components.wibeee import api
+from custom_components.wibeee.const import DEFAULT_MAX_URL_LENGTH
+from custom_components.wibeee.sensor import _known_sensor_slots
+from custom_components.wibeee.util import ValuesXmlParser
 
 DEVICE_INFO = api.DeviceInfo(id='X', macAddr='111111111111', softVersion='4.4.124', model='WB3', ipAddr='10.10.10.100')
 TIMEOUT = timedelta(seconds=5)
@@ -61,3 +67,136 @@ async def test_fetch_values(caplog):
             for k, v in secrets.items():
                 assert k in caplog.text
                 assert v not in caplog.text
+
+
+async def test_fetch_values_1phase():
+    async with aiohttp.ClientSession() as session:
+        with aioresponses() as m:
+            m.get(
+                "http://1.2.3.4/services/user/values.xml?id=WIBEEE",
+                status=200,
+                body=load_fixture('test_api_values_1phase.xml'),
+            )
+
+            wibeee = api.WibeeeAPI(session, '1.2.3.4', timeout=TIMEOUT)
+            values = await wibeee.async_fetch_values("WIBEEE")
+
+            assert values.items() >= ({
+                'model': 'WBM',
+                'serverIpResolved': None,
+                'vrms1': '235.06',
+                'eac1': '9789907',
+            }).items()
+            assert 'vrms2' not in values
+
+
+async def test_fetch_values_single_variable():
+    async with aiohttp.ClientSession() as session:
+        with aioresponses() as m:
+            m.get(
+                "http://1.2.3.4/services/user/values.xml?var=WIBEEE.vrms1",
+                status=200,
+                body='<values><variable><id>vrms1</id><value>235.06</value></variable></values>',
+            )
+
+            wibeee = api.WibeeeAPI(session, '1.2.3.4', timeout=TIMEOUT)
+            values = await wibeee.async_fetch_values("WIBEEE", ['vrms1'])
+
+            assert values == {'vrms1': '235.06'}
+
+
+async def test_fetch_values_splits_long_urls():
+    async with aiohttp.ClientSession() as session:
+        with aioresponses() as m:
+            m.get(
+                "http://1.2.3.4/services/user/values.xml?var=X.macAddr&X.softVersion",
+                status=200,
+                body='<values><variable><id>macAddr</id><value>11:11:11:11:11:11</value></variable>'
+                     '<variable><id>softVersion</id><value>4.4.124</value></variable></values>',
+            )
+            m.get(
+                "http://1.2.3.4/services/user/values.xml?var=X.model&X.ipAddr",
+                status=200,
+                body='<values><variable><id>model</id><value>WB3</value></variable>'
+                     '<variable><id>ipAddr</id><value>10.10.10.100</value></variable></values>',
+            )
+
+            url_length = len('http://1.2.3.4/services/user/values.xml?var=X.macAddr&X.softVersion')
+            wibeee = api.WibeeeAPI(session, '1.2.3.4', timeout=TIMEOUT, max_url_length=url_length)
+            values = await wibeee.async_fetch_values("X", ['macAddr', 'softVersion', 'model', 'ipAddr'])
+
+            assert values == {
+                'macAddr': '11:11:11:11:11:11',
+                'softVersion': '4.4.124',
+                'model': 'WB3',
+                'ipAddr': '10.10.10.100',
+            }
+
+
+async def test_fetch_values_splits_enabled_sensors_at_default_max_url_length():
+    parser = ValuesXmlParser()
+    parser.feed(load_fixture('test_api_values.xml').encode())
+    known_poll_vars = _known_sensor_slots(lambda sensor_type, slot: f"{sensor_type.poll_var_prefix}{slot.value.poll_var_suffix}")
+    var_names = sorted(v for v in parser.close() if v in known_poll_vars)
+
+    with patch.object(api.WibeeeAPI, 'async_fetch_url', autospec=True, return_value={}) as mock_fetch_url:
+        wibeee = api.WibeeeAPI(None, '192.168.100.100', timeout=TIMEOUT)
+        await wibeee.async_fetch_values("WIBEEE", var_names)
+
+    urls = [c.args[1] for c in mock_fetch_url.call_args_list]
+    assert len('http://192.168.100.100/services/user/values.xml?var=' + '&'.join(f'WIBEEE.{v}' for v in var_names)) > DEFAULT_MAX_URL_LENGTH
+    assert len(urls) == 2
+    assert all(len(url) <= DEFAULT_MAX_URL_LENGTH for url in urls)
+    assert [v.removeprefix('WIBEEE.') for url in urls for v in url.split('?var=')[1].split('&')] == var_names
+
+
+async def test_fetch_values_skips_log_formatting(caplog):
+    caplog.set_level(logging.INFO)
+    async with aiohttp.ClientSession() as session:
+        with aioresponses() as m, patch.object(api, 'async_redact_data', wraps=api.async_redact_data) as spy_redact_data:
+            m.get(
+                "http://1.2.3.4/services/user/values.xml?id=WIBEEE",
+                status=200,
+                body=load_fixture('test_api_values.xml'),
+            )
+
+            wibeee = api.WibeeeAPI(session, '1.2.3.4', timeout=TIMEOUT)
+            await wibeee.async_fetch_values("WIBEEE")
+
+            # the response is only redacted once for the returned values, not for logging.
+            assert spy_redact_data.call_count == 1
+
+
+async def test_device_session_reuses_connections(aiohttp_server, socket_enabled):
+    peers = set()
+    in_flight = max_in_flight = 0
+
+    async def values_xml(req: web.Request) -> web.Response:
+        nonlocal in_flight, max_in_flight
+        peers.add(req.transport.get_extra_info('peername'))
+        in_flight += 1
+        max_in_flight = max(in_flight, max_in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return web.Response(body=load_fixture('test_api_values.xml'), content_type='text/xml')
+
+    app = web.Application()
+    app.router.add_get('/services/user/values.xml', values_xml)
+    server = await aiohttp_server(app)
+
+    async with api.create_device_session(max_connections=2) as session:
+        wibeee = api.WibeeeAPI(session, f'{server.host}:{server.port}', timeout=TIMEOUT)
+
+        for _ in range(5):
+            values = await wibeee.async_fetch_values("WIBEEE")
+            assert values['vrms2'] == '235.06'
+
+        # sequential requests reuse one persistent connection
+        assert len(peers) == 1
+
+        concurrent_values = await asyncio.gather(*[wibeee.async_fetch_values("WIBEEE") for _ in range(10)])
+        assert [v['vrms2'] for v in concurrent_values] == ['235.06'] * 10
+
+    # concurrent requests queue up for the pool instead of opening more connections
+    assert len(peers) == 2
+    assert max_in_flight == 2
@@ -0,0 +1,87 @@
+import math
+
+import pytest
+
+from custom_components.wibeee.capture import CaptureReader, PushCapture, main
+
+
+def _capture(tmp_path, **kwargs) -> PushCapture:
+    return PushCapture(tmp_path, {'v1': 'vrms1', 'a1': 'pac1'}, **kwargs)
+
+
+async def test_capture_and_read_time_range(tmp_path):
+    capture = _capture(tmp_path, flush_interval=0)
+    for n in range(10):
+        capture.append(1000.0 + n, {'v1': 230.5 + n, 'a1': 'x' if n == 3 else 100 * n})
+    await capture.async_close()
+
+    [path] = tmp_path.glob('*.wbcap')
+    with CaptureReader(path) as reader:
+        assert reader.column_names == ('vrms1', 'pac1')
+        assert len(reader) == 10
+
+        data = reader.read(1002.0, 1004.0)
+        assert data.timestamps == [1002.0, 1003.0, 1004.0]
+        assert data.columns['vrms1'] == [232.5, 233.5, 234.5]
+        assert data.columns['pac1'][0] == 200 and math.isnan(data.columns['pac1'][1])
+
+        assert reader.read(2000.0).timestamps == []
+        assert len(reader.read().timestamps) == 10
+
+
+async def test_rotates_files(tmp_path):
+    capture = _capture(tmp_path, flush_interval=0, max_file_size=100, max_files=2)
+    for n in range(20):
+        capture.append(1000.0 + n, {'v1': 230, 'a1': 100})
+        await capture.async_close()
+
+    paths = sorted(tmp_path.glob('*.wbcap'))
+    assert len(paths) == 2
+    with CaptureReader(paths[-1]) as reader:
+        assert reader.read().timestamps[-1] == 1019.0
+
+
+async def test_timestamps_never_decrease(tmp_path):
+    capture = _capture(tmp_path, flush_interval=0)
+    for timestamp in [1000.0, 1002.0, 1001.0, 1003.0]:
+        capture.append(timestamp, {'v1': 230, 'a1': 100})
+    await capture.async_close()
+
+    [path] = tmp_path.glob('*.wbcap')
+    with CaptureReader(path) as reader:
+        assert reader.read().timestamps == [1000.0, 1002.0, 1002.0, 1003.0]
+        assert reader.read(1002.0, 1002.0).timestamps == [1002.0, 1002.0]
+
+
+async def test_logs_failed_writes(tmp_path, caplog):
+    (tmp_path / 'capture').write_text('not a directory')
+    capture = PushCapture(tmp_path / 'capture', {'v1': 'vrms1'}, flush_interval=0)
+    capture.append(1000.0, {'v1': 230})
+    await capture.async_close()
+
+    assert 'Failed to write push capture to' in caplog.text
+
+
+def test_ignores_torn_record(tmp_path):
+    capture = _capture(tmp_path)
+    capture.write(capture._record.pack(1000.0, 230, 100) + capture._record.pack(1001.0, 231, 100)[:-3])
+
+    [path] = tmp_path.glob('*.wbcap')
+    with CaptureReader(path) as reader:
+        assert reader.read().timestamps == [1000.0]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.wbcap'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        CaptureReader(path)
+
+
+def test_prints_csv(tmp_path, capsys):
+    capture = _capture(tmp_path)
+    capture.write(capture._record.pack(1000.0, 230, math.nan) + capture._record.pack(1001.0, 231, 100))
+
+    [path] = tmp_path.glob('*.wbcap')
+    main([str(path), '--start', '1000.5'])
+    assert capsys.readouterr().out == 'timestamp,vrms1,pac1\n1001.000,231,100\n'
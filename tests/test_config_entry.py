@@ -4,7 +4,7 @@ import homeassistant.helpers.entity_registry as er
 from homeassistant.core import HomeAssistant
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
-from custom_components.wibeee.api import WibeeeAPI
+from custom_components.wibeee.api import WibeeeAPI, _DATA_DEVICE_SESSIONS
 from custom_components.wibeee.sensor import DeviceInfo
 
 
@@ -151,3 +151,24 @@ async def test_migrate_entry_from_5(_, __, hass: HomeAssistant):
     }
     assert configured_entry.options == {'nest_upstream': 'proxy_null'}
     assert configured_entry.version == 5
+
+
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+async def test_device_session_closed_on_unload(_, mock_async_fetch_device_info, hass: HomeAssistant):
+    mock_async_fetch_device_info.return_value = DeviceInfo('ozymandias', 'abcdabcdabcd', '4.5.6', 'WBB', '127.0.0.2')
+    entry = MockConfigEntry(domain='wibeee', data={'host': '127.0.0.2', 'mac_address': 'abcdabcdabcd', 'wibeee_id': 'ozymandias'},
+                            options={'nest_upstream': 'proxy_null', 'device_connections': 1, 'device_keepalive': 30}, version=5)
+    entry.add_to_hass(hass)
+    await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    session, _ = hass.data[_DATA_DEVICE_SESSIONS]['127.0.0.2']
+    assert session.connector.limit == 1
+    assert not session.closed
+
+    await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert session.closed
+    assert '127.0.0.2' not in hass.data[_DATA_DEVICE_SESSIONS]
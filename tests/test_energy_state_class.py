@@ -10,7 +10,7 @@ import pytest
 from freezegun import freeze_time
 from homeassistant.components.sensor import SensorStateClass
 from homeassistant.core import HomeAssistant
-from pytest_homeassistant_custom_component.common import MockConfigEntry
+from pytest_homeassistant_custom_component.common import MockConfigEntry, async_fire_time_changed
 
 from custom_components.wibeee.api import WibeeeAPI
 from custom_components.wibeee.sensor import (
@@ -146,17 +146,18 @@ async def test_energy_sensor_zero_bypasses_throttle(mock_fetch_device_info, mock
 
         energy_sensor = hass.data['sensor'].get_entity('sensor.test_device_ddeeff_l1_active_energy')
 
-        # First update to consume the throttle window
-        energy_sensor.update_value('1100')
-        await hass.async_block_till_done()
-        assert hass.states.get('sensor.test_device_ddeeff_l1_active_energy').state == '1100'
-
-        # Immediately after, a normal update is throttled
+        # A normal update is throttled
         energy_sensor.update_value('1200')
         await hass.async_block_till_done()
-        assert hass.states.get('sensor.test_device_ddeeff_l1_active_energy').state == '1100'
+        assert hass.states.get('sensor.test_device_ddeeff_l1_active_energy').state == '1000'
 
         # But a zero value (reset event) bypasses the throttle
         energy_sensor.update_value('0')
         await hass.async_block_till_done()
         assert hass.states.get('sensor.test_device_ddeeff_l1_active_energy').state == '0'
+
+        # And the throttled value from before the reset is not applied afterwards
+        frozen_time.tick(timedelta(seconds=60))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+        assert hass.states.get('sensor.test_device_ddeeff_l1_active_energy').state == '0'
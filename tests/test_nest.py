@@ -1,11 +1,23 @@
+import asyncio
+import json
+import re
+import threading
 import time
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
 import pytest_asyncio
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import unused_port
+from pytest_homeassistant_custom_component.common import load_fixture
 
 from custom_components.wibeee.const import NEST_NULL_UPSTREAM
-from custom_components.wibeee.nest import create_application, DeviceConfig
+from custom_components.wibeee.metrics import Histogram
+from custom_components.wibeee.nest import create_application, decode_push_json, DeviceConfig, ForwardRequest, FrameBatcher, NestProxy, \
+    NestProxyThread, UpstreamForwarder, UPSTREAM_FORWARDER
+from custom_components.wibeee.spool import SpoolRecord, UpstreamSpool
+from custom_components.wibeee.tracing import NULL_TRACE
 
 
 @pytest_asyncio.fixture
@@ -53,3 +65,560 @@ async def test_null_upstream_json(nest_fixture):
     response_timestamp = response[len(start):]
     assert float(response_timestamp) == pytest.approx(time.time(), abs=5)
     handle_push_data.assert_called_with(PUSH_DATA)
+
+
+async def test_undecodable_json_is_not_dispatched(nest_fixture):
+    handle_push_data, client = nest_fixture
+
+    res = await client.post(f'/Wibeee/receiverJSON', data=load_fixture('test_nest_push_truncated.json'))
+    assert res.status == 200
+    handle_push_data.assert_not_called()
+
+
+@pytest_asyncio.fixture
+async def nest_proxy_fixture(aiohttp_client, socket_enabled):
+    nest_proxy = NestProxy()
+    client = await aiohttp_client(create_application(nest_proxy.get_device_info))
+
+    return [nest_proxy, client]
+
+
+@pytest.mark.parametrize("method, path, param", [
+    ("get", "receiver", "params"),
+    ("post", "receiverJSON", "json"),
+])
+async def test_multiple_listeners(nest_proxy_fixture, method, path, param):
+    nest_proxy, client = nest_proxy_fixture
+    listeners = [MagicMock(), MagicMock()]
+    unregister = [nest_proxy.register_device('00:11:22:33:44:55', listener, NEST_NULL_UPSTREAM) for listener in listeners]
+
+    res = await getattr(client, method)(f'/Wibeee/{path}', **({param: PUSH_DATA}))
+    assert res.status == 200
+    for listener in listeners:
+        listener.assert_called_once_with(PUSH_DATA)
+
+    # the remaining listener still receives data
+    unregister[0]()
+    res = await getattr(client, method)(f'/Wibeee/{path}', **({param: PUSH_DATA}))
+    assert res.status == 200
+    assert listeners[0].call_count == 1
+    assert listeners[1].call_count == 2
+
+    unregister[1]()
+    res = await getattr(client, method)(f'/Wibeee/{path}', **({param: PUSH_DATA}))
+    assert res.status == 404
+
+
+@pytest.mark.parametrize("method, path, param, response", [
+    ("get", "receiver", "params", r""),
+    ("get", "receiverAvg", "params", r"<<<WBAVG "),
+    ("get", "receiverLeap", "params", r"<<<WGRADIENT=030 "),
+    ("post", "receiverAvgPost", "json", r"<<<WBAVG "),
+    ("post", "receiverJSON", "json", r"<<<WBJSON \d+"),
+])
+async def test_push_interval_reply(nest_proxy_fixture, method, path, param, response):
+    nest_proxy, client = nest_proxy_fixture
+    nest_proxy.register_device('00:11:22:33:44:55', MagicMock(), NEST_NULL_UPSTREAM, push_interval=30)
+
+    # only receiverLeap's reply carries the push interval
+    res = await getattr(client, method)(f'/Wibeee/{path}', **({param: PUSH_DATA}))
+    assert res.status == 200
+    assert re.fullmatch(response, await res.text())
+
+
+async def test_push_interval_of_multiple_listeners(nest_proxy_fixture):
+    nest_proxy, client = nest_proxy_fixture
+    unregister = [nest_proxy.register_device('00:11:22:33:44:55', MagicMock(), NEST_NULL_UPSTREAM, push_interval=push_interval)
+                  for push_interval in [None, 60, 15]]
+
+    # the fastest rate that any listener consumes is requested
+    res = await client.get('/Wibeee/receiverLeap', params=PUSH_DATA)
+    assert await res.text() == '<<<WGRADIENT=015 '
+
+    unregister[2]()
+    unregister[1]()
+    res = await client.get('/Wibeee/receiverLeap', params=PUSH_DATA)
+    assert await res.text() == '<<<WGRADIENT=007 '
+
+
+@pytest.mark.parametrize("method, path, param", [
+    ("get", "receiver", "params"),
+    ("post", "receiverAvgPost", "json"),
+])
+async def test_unknown_device_is_not_decoded(nest_proxy_fixture, method, path, param):
+    nest_proxy, client = nest_proxy_fixture
+    listener = MagicMock()
+    nest_proxy.register_device('aabbccddeeff', listener, NEST_NULL_UPSTREAM)
+
+    with patch('custom_components.wibeee.nest.parse_qsl') as spy_parse_qsl, patch('custom_components.wibeee.nest.json') as spy_json:
+        res = await getattr(client, method)(f'/Wibeee/{path}', **({param: PUSH_DATA}))
+
+    assert res.status == 404
+    spy_parse_qsl.assert_not_called()
+    spy_json.loads.assert_not_called()
+    listener.assert_not_called()
+
+
+def test_routing_table_is_per_instance():
+    nest_proxy = NestProxy()
+    nest_proxy.register_device('001122334455', MagicMock(), NEST_NULL_UPSTREAM)
+
+    assert nest_proxy.get_device_info('00:11:22:33:44:55') is not None
+    assert nest_proxy.get_device_info('001122334455'.upper()) is not None
+    assert nest_proxy.get_device_info(None) is None
+    assert NestProxy().get_device_info('001122334455') is None
+
+
+def test_fan_out_uses_first_cloud_upstream():
+    nest_proxy = NestProxy()
+    nest_proxy.register_device('001122334455', MagicMock(), NEST_NULL_UPSTREAM)
+    nest_proxy.register_device('001122334455', MagicMock(), 'http://upstream.example')
+
+    assert nest_proxy.get_device_info('001122334455').upstream == 'http://upstream.example'
+
+
+async def test_async_forward_replies_before_upstream(aiohttp_client, aiohttp_server, socket_enabled):
+    release_upstream = asyncio.Event()
+    upstream_requests = []
+
+    async def slow_upstream(req: web.Request) -> web.StreamResponse:
+        await release_upstream.wait()
+        upstream_requests.append((req.path_qs, await req.json()))
+        return web.Response(status=200, text='<<<WBAVG ')
+
+    upstream_app = web.Application()
+    upstream_app.router.add_post('/Wibeee/receiverAvgPost', slow_upstream)
+    upstream = await aiohttp_server(upstream_app)
+
+    nest_proxy = NestProxy()
+    app = create_application(nest_proxy.get_device_info)
+    client = await aiohttp_client(app)
+    handle_push_data = MagicMock()
+    nest_proxy.register_device(PUSH_DATA['mac'], handle_push_data, str(upstream.make_url('')).rstrip('/'), async_forward=True)
+
+    res = await client.post('/Wibeee/receiverAvgPost', json=PUSH_DATA)
+    assert res.status == 200
+    assert await res.text() == '<<<WBAVG '
+    handle_push_data.assert_called_with(PUSH_DATA)
+    assert upstream_requests == []
+
+    forwarder = app[UPSTREAM_FORWARDER]
+    release_upstream.set()
+    await forwarder.join()
+
+    assert upstream_requests == [('/Wibeee/receiverAvgPost', PUSH_DATA)]
+    assert forwarder.metrics['forwarded'] == 1
+    assert forwarder.metrics['queue_depth'] == 0
+    assert forwarder.metrics['upstream_latency_max'] > 0
+
+
+async def test_async_forward_drops_oldest_when_full():
+    forwarder = UpstreamForwarder(MagicMock(), max_size=2)
+    for n in range(3):
+        forwarder.submit('GET', 'http://upstream', f'/Wibeee/receiver?n={n}', None)
+
+    assert forwarder.metrics['queue_depth'] == 2
+    assert forwarder.metrics['dropped'] == 1
+    assert [forwarder._queue.get_nowait().url[-3:] for _ in range(2)] == ['n=1', 'n=2']
+
+
+async def test_async_forward_queues_behind_spooled_data(tmp_path):
+    session = MagicMock()
+    forwarder = UpstreamForwarder(session)
+    spool = UpstreamSpool(tmp_path, max_bytes=1024 * 1024)
+    await spool.async_append(SpoolRecord('GET', '/Wibeee/receiver?n=0', None))
+
+    with patch.object(spool, 'async_replay') as mock_async_replay:
+        await forwarder._forward(ForwardRequest('GET', 'http://upstream', '/Wibeee/receiver?n=1', None, time.monotonic(), spool))
+
+    session.request.assert_not_called()
+    mock_async_replay.assert_called_once()
+    spooled = []
+    while (peeked := spool.peek()) is not None:
+        spooled.append(peeked[0].path_qs)
+        spool.commit(peeked[1])
+    assert spooled == ['/Wibeee/receiver?n=0', '/Wibeee/receiver?n=1']
+
+
+async def test_upstream_connection_reuse_and_retry(aiohttp_client, socket_enabled):
+    """The upstream keeps connections alive, but closes idle ones as soon as they receive a new request."""
+    connections = []
+
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connections.append(writer)
+        for served in range(2):
+            request = await reader.readuntil(b'\r\n\r\n')
+            if served == 1:
+                # the upstream timed out the idle connection just as our request arrived
+                break
+
+            headers = dict(line.split(b': ', 1) for line in request.split(b'\r\n')[1:] if line)
+            await reader.readexactly(int(headers.get(b'Content-Length', 0)))
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 9\r\nConnection: keep-alive\r\n\r\n<<<WBAVG ')
+            await writer.drain()
+
+        writer.close()
+
+    upstream = await asyncio.start_server(handle_connection, '127.0.0.1', 0)
+    upstream_url = 'http://127.0.0.1:%d' % upstream.sockets[0].getsockname()[1]
+
+    nest_proxy = NestProxy()
+    client = await aiohttp_client(create_application(nest_proxy.get_device_info))
+    nest_proxy.register_device(PUSH_DATA['mac'], MagicMock(), upstream_url)
+
+    try:
+        for _ in range(2):
+            res = await client.post('/Wibeee/receiverAvgPost', json=PUSH_DATA)
+            assert res.status == 200
+            assert await res.text() == '<<<WBAVG '
+
+        # the second request reused the first connection, and was retried on a new one when that was closed
+        assert len(connections) == 2
+
+    finally:
+        upstream.close()
+        await upstream.wait_closed()
+
+
+async def test_upstream_no_retry_on_new_connection(aiohttp_client, socket_enabled):
+    """A request may already have been processed when a new connection is dropped, so it must not be sent again."""
+    requests = []
+
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        requests.append(await reader.readuntil(b'\r\n\r\n'))
+        writer.close()
+
+    upstream = await asyncio.start_server(handle_connection, '127.0.0.1', 0)
+    upstream_url = 'http://127.0.0.1:%d' % upstream.sockets[0].getsockname()[1]
+
+    nest_proxy = NestProxy()
+    client = await aiohttp_client(create_application(nest_proxy.get_device_info))
+    nest_proxy.register_device(PUSH_DATA['mac'], MagicMock(), upstream_url)
+
+    try:
+        res = await client.post('/Wibeee/receiverAvgPost', json=PUSH_DATA)
+        assert res.status == 500
+        assert len(requests) == 1
+
+    finally:
+        upstream.close()
+        await upstream.wait_closed()
+
+
+async def test_spool_while_upstream_is_down(aiohttp_client, aiohttp_server, socket_enabled, tmp_path):
+    upstream_requests = []
+
+    async def upstream_handler(req: web.Request) -> web.StreamResponse:
+        upstream_requests.append((await req.json())['n'])
+        return web.Response(status=200, text='<<<WBAVG ')
+
+    upstream_app = web.Application()
+    upstream_app.router.add_post('/Wibeee/receiverAvgPost', upstream_handler)
+    upstream_port = unused_port()
+
+    nest_proxy = NestProxy()
+    client = await aiohttp_client(create_application(nest_proxy.get_device_info))
+    spool = UpstreamSpool(tmp_path, max_bytes=1024 * 1024)
+    nest_proxy.register_device(PUSH_DATA['mac'], MagicMock(), f'http://127.0.0.1:{upstream_port}', spool=spool)
+
+    # the device gets its usual reply, even though the upstream is down
+    for n in range(3):
+        res = await client.post('/Wibeee/receiverAvgPost', json=PUSH_DATA | {'n': n})
+        assert res.status == 200
+        assert await res.text() == '<<<WBAVG '
+
+    assert spool.appended == 3
+
+    # once the upstream is back, the spooled requests are replayed in order, followed by the new one
+    await aiohttp_server(upstream_app, host='127.0.0.1', port=upstream_port)
+    res = await client.post('/Wibeee/receiverAvgPost', json=PUSH_DATA | {'n': 3})
+    assert res.status == 200
+    assert await res.text() == '<<<WBAVG '
+    await spool._replay_task
+
+    assert upstream_requests == [0, 1, 2, 3]
+    assert spool.is_empty()
+
+
+async def test_spool_replays_to_current_upstream(aiohttp_client, aiohttp_server, socket_enabled, tmp_path):
+    upstream_requests = []
+
+    async def upstream_handler(req: web.Request) -> web.StreamResponse:
+        upstream_requests.append(req.path_qs)
+        return web.Response(status=200, text='<<<WBAVG ')
+
+    upstream_app = web.Application()
+    upstream_app.router.add_get('/Wibeee/receiverAvg', upstream_handler)
+
+    nest_proxy = NestProxy()
+    client = await aiohttp_client(create_application(nest_proxy.get_device_info))
+    spool = UpstreamSpool(tmp_path, max_bytes=1024 * 1024)
+    unregister = nest_proxy.register_device(PUSH_DATA['mac'], MagicMock(), f'http://127.0.0.1:{unused_port()}', spool=spool)
+    await client.get('/Wibeee/receiverAvg', params={'mac': PUSH_DATA['mac'], 'n': 0})
+    assert spool.appended == 1
+
+    # the upstream option is changed while data is spooled
+    unregister()
+    upstream = await aiohttp_server(upstream_app)
+    nest_proxy.register_device(PUSH_DATA['mac'], MagicMock(), str(upstream.make_url('')).rstrip('/'), spool=spool)
+    await client.get('/Wibeee/receiverAvg', params={'mac': PUSH_DATA['mac'], 'n': 1})
+    await spool._replay_task
+
+    assert upstream_requests == [f'/Wibeee/receiverAvg?mac={PUSH_DATA["mac"]}&n={n}' for n in range(2)]
+
+
+async def test_spool_survives_reload_with_queued_requests(aiohttp_server, socket_enabled, tmp_path):
+    upstream_requests = []
+
+    async def upstream_handler(req: web.Request) -> web.StreamResponse:
+        upstream_requests.append(int(req.query['n']))
+        return web.Response(status=200, text='<<<WBAVG ')
+
+    upstream_app = web.Application()
+    upstream_app.router.add_get('/Wibeee/receiverAvg', upstream_handler)
+    upstream = await aiohttp_server(upstream_app)
+    upstream_url = str(upstream.make_url('')).rstrip('/')
+
+    nest_proxy = NestProxy()
+    spool = nest_proxy.get_spool(PUSH_DATA['mac'], tmp_path, 1024 * 1024)
+    unregister = nest_proxy.register_device(PUSH_DATA['mac'], MagicMock(), upstream_url, async_forward=True, spool=spool)
+    await spool.async_append(SpoolRecord('GET', '/Wibeee/receiverAvg?n=0', None))
+
+    async with aiohttp.ClientSession() as session:
+        forwarder = UpstreamForwarder(session, workers=1)
+        for n in range(1, 3):
+            forwarder.submit('GET', upstream_url, f'/Wibeee/receiverAvg?n={n}', None, spool)
+
+        # the config entry is unloaded while requests are still queued, which are spooled but not replayed
+        unregister()
+        await forwarder.start()
+        await forwarder.join()
+        assert upstream_requests == []
+        assert spool.appended == 3
+
+        # the reloaded entry gets the same spool, so the records are replayed once and in order
+        assert nest_proxy.get_spool(PUSH_DATA['mac'], tmp_path, 1024 * 1024) is spool
+        nest_proxy.register_device(PUSH_DATA['mac'], MagicMock(), upstream_url, async_forward=True, spool=spool)
+        forwarder.submit('GET', upstream_url, '/Wibeee/receiverAvg?n=3', None, spool)
+        await forwarder.join()
+        await spool._replay_task
+        await forwarder.stop()
+
+    assert upstream_requests == [0, 1, 2, 3]
+    assert spool.is_empty()
+
+
+# synthetic frames: a valid frame with the defects that Wibeee devices send at times inserted by hand, not captured frames.
+@pytest.mark.parametrize("fixture", [
+    "test_nest_push_valid.json",
+    "test_nest_push_double_comma.json",
+    "test_nest_push_missing_comma.json",
+    "test_nest_push_trailing_comma.json",
+])
+def test_decode_push_json(fixture):
+    body = load_fixture(fixture)
+    valid_body = load_fixture('test_nest_push_valid.json')
+
+    push_data, forward_body = decode_push_json(body)
+
+    assert push_data == json.loads(valid_body)
+    assert forward_body == valid_body
+    if fixture == 'test_nest_push_valid.json':
+        assert forward_body is body
+
+
+@pytest.mark.parametrize("body, expected", [
+    ('{}', {}),
+    (' { "mac" : "001122334455" , "n": 1.5, "ok": true, "none": null, "esc": "a\\"b" } ', {'mac': '001122334455', 'n': 1.5, 'ok': True, 'none': None, 'esc': 'a"b'}),
+    ('{"mac": "001122334455", "nested": {"a": [1, 2]}}', {'mac': '001122334455', 'nested': {'a': [1, 2]}}),
+])
+def test_decode_push_json_values(body, expected):
+    assert decode_push_json(body) == (expected, body)
+
+
+@pytest.mark.parametrize("body, expected", [
+    ('{"a":"""b":"2"}', ({'a': '', 'b': '2'}, '{"a":"","b":"2"}')),
+    (' {,"a": 1 ,, \n"b":"x,y" ,} ', ({'a': 1, 'b': 'x,y'}, '{"a": 1,"b":"x,y"}')),
+])
+def test_decode_push_json_repairs_commas(body, expected):
+    assert decode_push_json(body) == expected
+
+
+@pytest.mark.parametrize("body", ['[]', 'mac=001122334455', '{"mac": 0x1}', '{"a":"1" x "b":"2"}', '{"a":"1",,"b"}', '"a":"1"}'])
+def test_decode_push_json_invalid(body):
+    with pytest.raises(ValueError):
+        decode_push_json(body)
+
+
+def test_decode_push_json_truncated():
+    with pytest.raises(ValueError):
+        decode_push_json(load_fixture('test_nest_push_truncated.json'))
+
+
+async def test_forwards_repaired_json(aiohttp_client, aiohttp_server, socket_enabled):
+    upstream_bodies = []
+
+    async def upstream_handler(req: web.Request) -> web.StreamResponse:
+        upstream_bodies.append(await req.text())
+        return web.Response(status=200, text='<<<WBAVG ')
+
+    upstream_app = web.Application()
+    upstream_app.router.add_post('/Wibeee/receiverAvgPost', upstream_handler)
+    upstream = await aiohttp_server(upstream_app)
+
+    nest_proxy = NestProxy()
+    client = await aiohttp_client(create_application(nest_proxy.get_device_info))
+    handle_push_data = MagicMock()
+    nest_proxy.register_device('001122334455', handle_push_data, str(upstream.make_url('')).rstrip('/'))
+
+    res = await client.post('/Wibeee/receiverAvgPost', data=load_fixture('test_nest_push_double_comma.json'))
+    assert res.status == 200
+
+    valid_body = load_fixture('test_nest_push_valid.json')
+    handle_push_data.assert_called_once_with(json.loads(valid_body))
+    assert upstream_bodies == [valid_body]
+
+
+async def test_metrics(aiohttp_client, aiohttp_server, socket_enabled):
+    async def upstream_handler(req: web.Request) -> web.StreamResponse:
+        return web.Response(status=201 if 'mac=' in req.query_string else 200, text='<<<WBAVG ')
+
+    upstream_app = web.Application()
+    upstream_app.router.add_route('*', '/{anypath:.*}', upstream_handler)
+    upstream = await aiohttp_server(upstream_app)
+
+    nest_proxy = NestProxy()
+    client = await aiohttp_client(create_application(nest_proxy.get_device_info))
+    nest_proxy.register_device('00:11:22:33:44:55', MagicMock(), str(upstream.make_url('')).rstrip('/'))
+
+    await client.get('/Wibeee/receiverLeap', params=PUSH_DATA)
+    await client.get('/Wibeee/receiverLeap', params=PUSH_DATA)
+    await client.post('/Wibeee/receiverAvgPost', data=load_fixture('test_nest_push_double_comma.json'))
+    await client.get('/Wibeee/receiver', params=PUSH_DATA | {'mac': 'aabbccddeeff'})
+
+    res = await client.get('/metrics')
+    assert res.status == 200
+    assert res.content_type == 'text/plain'
+    metrics = await res.text()
+
+    assert 'wibeee_nest_pushes_total{mac="001122334455",route="receiverLeap"} 2\n' in metrics
+    assert 'wibeee_nest_pushes_total{mac="001122334455",route="receiverAvgPost"} 1\n' in metrics
+    assert 'wibeee_nest_json_repairs_total{route="receiverAvgPost"} 1\n' in metrics
+    assert 'wibeee_nest_unknown_device_total{route="receiver"} 1\n' in metrics
+    assert 'wibeee_nest_upstream_responses_total{status="200"} 1\n' in metrics
+    assert 'wibeee_nest_upstream_responses_total{status="201"} 2\n' in metrics
+    assert 'wibeee_nest_upstream_duration_seconds_bucket{le="+Inf"} 3\n' in metrics
+    assert 'wibeee_nest_handler_duration_seconds_count{route="receiverLeap"} 2\n' in metrics
+    assert 'wibeee_nest_forward_queue_depth 0\n' in metrics
+    assert '# TYPE wibeee_nest_forward_dropped_total counter\n' in metrics
+    assert '# HELP wibeee_nest_forward_dropped_total Queued requests dropped because the queue was full.\n' in metrics
+
+
+async def test_metrics_count_query_params_decode_failures(nest_proxy_fixture):
+    nest_proxy, client = nest_proxy_fixture
+    listener = MagicMock()
+    nest_proxy.register_device('00:11:22:33:44:55', listener, NEST_NULL_UPSTREAM)
+
+    # only extract_mac accepts ';' as a separator
+    res = await client.get('/Wibeee/receiverLeap?v1=230;mac=001122334455')
+    assert res.status == 200
+    listener.assert_not_called()
+
+    res = await client.get('/metrics')
+    assert 'wibeee_nest_decode_failures_total{route="receiverLeap"} 1\n' in await res.text()
+
+
+async def test_frame_batcher_hands_off_one_batch_per_iteration():
+    target_loop = MagicMock()
+    frame_batcher = FrameBatcher(target_loop)
+    handle_push_data = MagicMock()
+
+    for n in range(3):
+        frame_batcher.submit(NULL_TRACE, handle_push_data, {'mac': PUSH_DATA['mac'], 'n': n})
+    await asyncio.sleep(0)
+    frame_batcher.submit(NULL_TRACE, handle_push_data, {'mac': PUSH_DATA['mac'], 'n': 3})
+    await asyncio.sleep(0)
+
+    assert target_loop.call_soon_threadsafe.call_count == 2
+    assert (frame_batcher.batches, frame_batcher.frames) == (2, 4)
+    handle_push_data.assert_not_called()
+
+    for handle_frames, frames in (c.args for c in target_loop.call_soon_threadsafe.call_args_list):
+        handle_frames(frames)
+    assert [c.args[0]['n'] for c in handle_push_data.call_args_list] == [0, 1, 2, 3]
+
+
+async def test_frames_handed_over_before_unregistering_are_dropped():
+    target_loop = MagicMock()
+    frame_batcher = FrameBatcher(target_loop)
+    nest_proxy = NestProxy()
+    listener = MagicMock()
+    unregister = nest_proxy.register_device(PUSH_DATA['mac'], listener, NEST_NULL_UPSTREAM)
+
+    frame_batcher.submit(NULL_TRACE, nest_proxy.get_device_info(PUSH_DATA['mac']).handle_push_data, PUSH_DATA)
+    await asyncio.sleep(0)
+    unregister()
+
+    [(handle_frames, frames)] = (c.args for c in target_loop.call_soon_threadsafe.call_args_list)
+    handle_frames(frames)
+    listener.assert_not_called()
+
+
+async def test_proxy_thread_hands_push_data_to_calling_loop(socket_enabled):
+    loop = asyncio.get_running_loop()
+    received = asyncio.Event()
+    handler_threads = []
+    decoder_threads = []
+
+    def decode_push_data(push_data):
+        decoder_threads.append(threading.get_ident())
+        return push_data | {'decoded': True}
+
+    def handle_push_data(push_data):
+        handler_threads.append((threading.get_ident(), push_data.get('decoded')))
+        received.set()
+
+    nest_proxy = NestProxy()
+    nest_proxy.register_device(PUSH_DATA['mac'], handle_push_data, NEST_NULL_UPSTREAM, decode_push_data=decode_push_data)
+    proxy_thread = NestProxyThread()
+    proxy_thread.start()
+    port = unused_port()
+
+    async def start_server() -> web.AppRunner:
+        runner = web.AppRunner(create_application(nest_proxy.get_device_info, FrameBatcher(loop)))
+        await runner.setup()
+        await web.TCPSite(runner, host='127.0.0.1', port=port).start()
+        return runner
+
+    runner = await proxy_thread.async_run(start_server())
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'http://127.0.0.1:{port}/Wibeee/receiverLeap', params=PUSH_DATA) as res:
+                assert res.status == 200
+                assert await res.text() == '<<<WGRADIENT=007 '
+
+        await asyncio.wait_for(received.wait(), 5)
+        # decoded on the proxy's thread, handled on the calling loop's
+        assert decoder_threads == [proxy_thread.ident]
+        assert handler_threads == [(threading.get_ident(), True)]
+
+    finally:
+        await proxy_thread.async_run(runner.cleanup())
+        await proxy_thread.async_stop()
+
+    assert not proxy_thread.is_alive()
+    assert proxy_thread.loop.is_closed()
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(value)
+
+    assert list(histogram.samples('latency', {'route': 'receiver'})) == [
+        'latency_bucket{route="receiver",le="0.1"} 2',
+        'latency_bucket{route="receiver",le="1.0"} 3',
+        'latency_bucket{route="receiver",le="+Inf"} 4',
+        'latency_sum{route="receiver"} 2.65',
+        'latency_count{route="receiver"} 4',
+    ]
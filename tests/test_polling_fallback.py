@@ -0,0 +1,177 @@
+import logging
+from datetime import timedelta
+from unittest.mock import patch
+
+from freezegun import freeze_time
+import homeassistant.helpers.entity_registry as er
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry, async_fire_time_changed
+
+from custom_components.wibeee.api import WibeeeAPI
+from custom_components.wibeee.nest import get_nest_proxy
+from custom_components.wibeee.sensor import DeviceInfo
+from .test_helpers import build_values
+
+VOLTAGE_ENTITY_ID = 'sensor.test_device_ddeeff_l1_phase_voltage'
+
+
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_polls_only_while_push_is_stale(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant):
+    """Test that values.xml is polled while no push data is received and that polling stops when pushes resume."""
+    dev = DeviceInfo('test_device', 'aabbccddeeff', '100.1', 'WBM', '1.2.3.4')
+    entry = MockConfigEntry(
+        domain='wibeee',
+        data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+        options={'throttle_sensors': 0, 'poll_fallback': 30},
+        version=5
+    )
+    entry.add_to_hass(hass)
+
+    async def advance_time(seconds: int):
+        frozen_time.tick(timedelta(seconds=seconds))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+    with freeze_time("2025-01-01 12:00:00") as frozen_time:
+        mock_async_fetch_device_info.return_value = dev
+        mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230'})
+
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        assert mock_async_fetch_values.call_count == 1
+
+        nest_proxy = await get_nest_proxy(hass)
+        push_data = nest_proxy.get_device_info(dev.macAddr).receive_push_data
+
+        # device is pushing: no polling
+        await advance_time(20)
+        push_data({'mac': dev.macAddr, 'v1': '231'})
+        await advance_time(15)
+
+        assert mock_async_fetch_values.call_count == 1
+        assert hass.states.get(VOLTAGE_ENTITY_ID).state == '231'
+
+        # pushes have stopped: poll once per interval
+        mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '240'})
+        await advance_time(30)
+
+        assert mock_async_fetch_values.call_count == 2
+        assert hass.states.get(VOLTAGE_ENTITY_ID).state == '240'
+
+        await advance_time(30)
+        assert mock_async_fetch_values.call_count == 3
+
+        # pushes resumed: polling stops
+        push_data({'mac': dev.macAddr, 'v1': '250'})
+        await advance_time(15)
+        push_data({'mac': dev.macAddr, 'v1': '250'})
+        await advance_time(15)
+
+        assert mock_async_fetch_values.call_count == 3
+        assert hass.states.get(VOLTAGE_ENTITY_ID).state == '250'
+
+
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_polls_enabled_sensor_vars(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant):
+    """Test that polling only requests the variables of enabled sensors."""
+    dev = DeviceInfo('test_device', 'aabbccddeeff', '100.1', 'WBM', '1.2.3.4')
+    entry = MockConfigEntry(
+        domain='wibeee',
+        data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+        options={'throttle_sensors': 0, 'poll_fallback': 10},
+        version=5
+    )
+    entry.add_to_hass(hass)
+
+    def polled_var_names():
+        _, _, var_names = mock_async_fetch_values.call_args.args
+        return var_names
+
+    with freeze_time("2025-01-01 12:00:00") as frozen_time:
+        mock_async_fetch_device_info.return_value = dev
+        mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230', 'pac1': '1000'})
+
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+        frozen_time.tick(timedelta(seconds=10))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+        assert polled_var_names() == ['ipAddr', 'macAddr', 'pac1', 'softVersion', 'vrms1']
+
+        er.async_get(hass).async_update_entity('sensor.test_device_ddeeff_l1_active_power', disabled_by=er.RegistryEntryDisabler.USER)
+        frozen_time.tick(timedelta(seconds=10))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+        assert polled_var_names() == ['ipAddr', 'macAddr', 'softVersion', 'vrms1']
+
+
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_ignores_other_entities_registry_updates(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant, caplog):
+    """Test that enabling or disabling entities of other integrations doesn't recompute the polled sensors."""
+    dev = DeviceInfo('test_device', 'aabbccddeeff', '100.1', 'WBM', '1.2.3.4')
+    entry = MockConfigEntry(
+        domain='wibeee',
+        data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+        options={'throttle_sensors': 0, 'poll_fallback': 10},
+        version=5
+    )
+    entry.add_to_hass(hass)
+    other_entity = er.async_get(hass).async_get_or_create('sensor', 'other', 'other_sensor')
+    caplog.set_level(logging.DEBUG, logger='custom_components.wibeee.sensor')
+
+    with freeze_time("2025-01-01 12:00:00") as frozen_time:
+        mock_async_fetch_device_info.return_value = dev
+        mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230', 'pac1': '1000'})
+
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+        for disabled_by in [er.RegistryEntryDisabler.USER, None]:
+            frozen_time.tick(timedelta(seconds=10))
+            async_fire_time_changed(hass)
+            await hass.async_block_till_done()
+            er.async_get(hass).async_update_entity(other_entity.entity_id, disabled_by=disabled_by)
+
+        assert mock_async_fetch_values.call_count == 3
+        assert caplog.text.count('Polling 5 enabled sensors of 5') == 1
+
+
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_malformed_polled_value_keeps_last_value(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant):
+    """Test that a malformed number in values.xml leaves the sensor's last value, while a missing one makes it unavailable."""
+    dev = DeviceInfo('test_device', 'aabbccddeeff', '100.1', 'WBM', '1.2.3.4')
+    entry = MockConfigEntry(
+        domain='wibeee',
+        data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+        options={'throttle_sensors': 0, 'poll_fallback': 10},
+        version=5
+    )
+    entry.add_to_hass(hass)
+
+    async def poll(values: dict[str, str]):
+        mock_async_fetch_values.return_value = build_values(dev, values)
+        frozen_time.tick(timedelta(seconds=10))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+    with freeze_time("2025-01-01 12:00:00") as frozen_time:
+        mock_async_fetch_device_info.return_value = dev
+        mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230.10', 'pac1': '1000'})
+
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        assert hass.states.get(VOLTAGE_ENTITY_ID).state == '230.10'
+
+        await poll({'vrms1': '23?.1', 'pac1': '1001'})
+        assert hass.states.get(VOLTAGE_ENTITY_ID).state == '230.10'
+        assert hass.states.get('sensor.test_device_ddeeff_l1_active_power').state == '1001'
+
+        await poll({'pac1': '1002'})
+        assert hass.states.get(VOLTAGE_ENTITY_ID).state == 'unavailable'
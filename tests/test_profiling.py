@@ -0,0 +1,61 @@
+import threading
+import time
+
+from homeassistant.core import HomeAssistant
+from homeassistant.setup import async_setup_component
+from pytest_homeassistant_custom_component.common import load_fixture
+
+from custom_components.wibeee.nest import NEST_PROXY_THREAD_NAME, decode_push_json
+from custom_components.wibeee.profiling import StackSampler
+
+
+def test_samples_only_integration_code():
+    body = load_fixture('test_nest_push_double_comma.json')
+    sampler = StackSampler({threading.get_ident(): 'main'}, interval=0.001)
+    sampler.start()
+    try:
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            decode_push_json(body)
+        time.sleep(0.05)
+    finally:
+        sampler.stop()
+
+    assert sampler.samples > sampler.stacks.total() > 0
+    assert all(stack.startswith('main;nest.py:decode_push_json') for stack in sampler.stacks)
+    assert next(iter(sampler.collapsed())).endswith(f' {sampler.stacks.most_common(1)[0][1]}\n')
+
+
+def test_samples_every_thread():
+    body = load_fixture('test_nest_push_double_comma.json')
+    stopped = threading.Event()
+
+    def decode_until_stopped():
+        while not stopped.is_set():
+            decode_push_json(body)
+
+    proxy_thread = threading.Thread(target=decode_until_stopped, name=NEST_PROXY_THREAD_NAME)
+    proxy_thread.start()
+    sampler = StackSampler({threading.get_ident(): 'event_loop', proxy_thread.ident: proxy_thread.name}, interval=0.001)
+    sampler.start()
+    try:
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            decode_push_json(body)
+    finally:
+        sampler.stop()
+        stopped.set()
+        proxy_thread.join()
+
+    assert {stack.split(';', 1)[0] for stack in sampler.stacks} == {'event_loop', NEST_PROXY_THREAD_NAME}
+
+
+async def test_profile_service(hass: HomeAssistant, tmp_path):
+    assert await async_setup_component(hass, 'wibeee', {})
+    hass.config.config_dir = str(tmp_path)
+
+    response = await hass.services.async_call('wibeee', 'profile', {'duration': 1}, blocking=True, return_response=True)
+
+    [path] = tmp_path.glob('wibeee_profile_*.collapsed')
+    assert response['path'] == str(path)
+    assert response['samples'] > 0
@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+import pytest
+from freezegun import freeze_time
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ServiceValidationError
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.wibeee.api import WibeeeAPI
+from custom_components.wibeee.nest import get_nest_proxy
+from custom_components.wibeee.samples import SampleRingBuffer
+from custom_components.wibeee.sensor import DeviceInfo, _make_push_dispatcher
+from .test_helpers import build_values
+
+
+def test_ring_buffer_keeps_latest_frames():
+    sample_buffer = SampleRingBuffer({'v1': 'vrms1', 'a1': 'pac1', 'e1': 'eac1'}, capacity=3)
+    for n in range(5):
+        sample_buffer.append(1000.0 + n, {'v1': 230 + n, 'a1': 100 * n if n != 3 else 'x'})
+
+    assert len(sample_buffer) == 3
+    assert sample_buffer.window() == {
+        'timestamps': [1002.0, 1003.0, 1004.0],
+        'columns': {'vrms1': [232, 233, 234], 'pac1': [200, None, 400]},
+    }
+    assert sample_buffer.window(1003.0, 1003.5) == {
+        'timestamps': [1003.0],
+        'columns': {'vrms1': [233]},
+    }
+
+
+def test_ring_buffer_empty():
+    assert SampleRingBuffer({'v1': 'vrms1'}, capacity=3).window() == {'timestamps': [], 'columns': {}}
+
+
+def test_dispatcher_fills_empty_sample_buffer():
+    sample_buffer = SampleRingBuffer({'v1': 'vrms1'}, capacity=3)
+    dispatch_push_data = _make_push_dispatcher([], sample_buffer=sample_buffer)
+
+    dispatch_push_data({'v1': 230})
+    assert len(sample_buffer) == 1
+
+
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_get_samples_service(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant):
+    dev = DeviceInfo('samples', 'aabbccddeeff', '100.1', 'WBM', '1.2.3.4')
+    mock_async_fetch_device_info.return_value = dev
+    mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230', 'pac1': '100'})
+
+    entry = MockConfigEntry(domain='wibeee', data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+                            options={'throttle_sensors': 60}, version=5)
+    entry.add_to_hass(hass)
+    await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    push_data = (await get_nest_proxy(hass)).get_device_info(dev.macAddr).receive_push_data
+    for second, voltage in enumerate(['231.5', '232', '233']):
+        with freeze_time(f"2025-01-01 12:00:0{second}+00:00"):
+            push_data({'mac': dev.macAddr, 'v1': voltage, 'a1': '101', 'soft': '100.1'})
+
+    # samples are recorded before throttling
+    response = await hass.services.async_call('wibeee', 'get_samples', {'config_entry': entry.entry_id, 'start': '2025-01-01 12:00:01+00:00'},
+                                              blocking=True, return_response=True)
+    assert response == {
+        'timestamps': [1735732801.0, 1735732802.0],
+        'columns': {'pac1': [101, 101], 'vrms1': [232, 233]},
+    }
+
+    # times without a time zone are local (US/Pacific in tests)
+    response = await hass.services.async_call('wibeee', 'get_samples', {'config_entry': entry.entry_id, 'start': '2025-01-01 04:00:02'},
+                                              blocking=True, return_response=True)
+    assert response['timestamps'] == [1735732802.0]
+
+    await hass.config_entries.async_unload(entry.entry_id)
+    with pytest.raises(ServiceValidationError):
+        await hass.services.async_call('wibeee', 'get_samples', {'config_entry': entry.entry_id}, blocking=True, return_response=True)
@@ -1,9 +1,11 @@
 import logging
+import threading
 from typing import Dict
 from unittest.mock import patch
 
 import homeassistant.helpers.entity_registry as er
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers import device_registry, entity_registry
 from homeassistant.helpers.entity_platform import EntityPlatform
@@ -11,7 +13,8 @@ from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 from custom_components import wibeee
 from custom_components.wibeee.api import WibeeeAPI
-from custom_components.wibeee.sensor import DeviceInfo, Slot
+from custom_components.wibeee.nest import get_nest_proxy
+from custom_components.wibeee.sensor import DeviceInfo, NUMERIC_PUSH_VARS, Slot, ValueDecoder, WibeeeSensor
 from .test_helpers import build_values
 
 
@@ -215,9 +218,96 @@ async def test_device_configuration_url(mock_async_fetch_device_info, mock_async
     assert_configuration_url('http://4.3.2.1/')
 
 
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_push_frames_coalesce_state_writes(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant):
+    dev = DeviceInfo('coalesce', 'abcdabcdabcd', '100.1', 'WBM', '1.2.3.4')
+    mock_async_fetch_device_info.return_value = dev
+    mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230', 'pac1': '100'})
+
+    entry = MockConfigEntry(domain='wibeee', data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+                            options={'throttle_sensors': 0}, version=5)
+    entry.add_to_hass(hass)
+    await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    nest_proxy = await get_nest_proxy(hass)
+    push_data = nest_proxy.get_device_info(dev.macAddr).receive_push_data
+    state_writer = hass.data['sensor'].get_entity('sensor.coalesce_abcdab_l1_phase_voltage').state_writer
+
+    with patch.object(WibeeeSensor, 'async_write_ha_state', autospec=True, wraps=WibeeeSensor.async_write_ha_state) as spy_write:
+        push_data({'mac': dev.macAddr, 'v1': '231', 'a1': '101'})
+        push_data({'mac': dev.macAddr, 'v1': '232', 'a1': '102'})
+
+        # nothing is written until the event loop runs the flush
+        assert spy_write.call_count == 0
+        await hass.async_block_till_done()
+
+        assert spy_write.call_count == 2
+
+    assert hass.states.get('sensor.coalesce_abcdab_l1_phase_voltage').state == '232'
+    assert hass.states.get('sensor.coalesce_abcdab_l1_active_power').state == '102'
+    assert (state_writer.frames, state_writer.coalesced_frames) == (2, 1)
+
+
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_push_values_are_decoded(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant, caplog):
+    dev = DeviceInfo('decode', 'abcdabcdabcd', '100.1', 'WBM', '1.2.3.4')
+    mock_async_fetch_device_info.return_value = dev
+    mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230.5', 'pac1': '100'})
+
+    entry = MockConfigEntry(domain='wibeee', data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+                            options={'throttle_sensors': 0}, version=5)
+    entry.add_to_hass(hass)
+    await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    voltage = hass.data['sensor'].get_entity('sensor.decode_abcdab_l1_phase_voltage')
+    power = hass.data['sensor'].get_entity('sensor.decode_abcdab_l1_active_power')
+    firmware = hass.data['sensor'].get_entity('sensor.decode_abcdab_firmware')
+    assert (voltage.native_value, power.native_value, firmware.native_value) == (230.5, 100, '100.1')
+
+    nest_proxy = await get_nest_proxy(hass)
+    push_data = nest_proxy.get_device_info(dev.macAddr).receive_push_data
+    push_data({'mac': dev.macAddr, 'v1': '231.25', 'a1': '-101', 'soft': '100.2'})
+    await hass.async_block_till_done()
+
+    assert (voltage.native_value, power.native_value, firmware.native_value) == (231.25, -101, '100.2')
+
+    # malformed numbers never reach the sensors
+    push_data({'mac': dev.macAddr, 'v1': '23?.1', 'a1': 'nan'})
+    await hass.async_block_till_done()
+
+    assert (voltage.native_value, power.native_value) == (231.25, -101)
+    assert hass.states.get('sensor.decode_abcdab_l1_phase_voltage').state == '231.25'
+    assert "Ignoring malformed number received from Nest push for 'decode': v1='23?.1'" in caplog.text
+
+
+def test_value_decoder():
+    decoder = ValueDecoder('test')
+    decoded = decoder.decode({'v1': '230', 'vt': ' 230.50 ', 'a1': 'x', 'e1': 1000, 'mac': '001122334455', 'soft': '4.4'},
+                             NUMERIC_PUSH_VARS, 'test')
+
+    assert decoded == {'v1': 230, 'vt': 230.5, 'e1': 1000, 'mac': '001122334455', 'soft': '4.4'}
+    assert str(decoded['vt']) == '230.50'  # decimal places sent by the device are kept
+    assert decoder.malformed == 1
+
+
 def async_devices_for_config_entry(hass: HomeAssistant, entry: ConfigEntry):
     return device_registry.async_entries_for_config_entry(device_registry.async_get(hass), config_entry_id=entry.entry_id)
 
 
 def async_entities_for_config_entry(hass: HomeAssistant, entry: ConfigEntry):
     return entity_registry.async_entries_for_config_entry(er.async_get(hass), config_entry_id=entry.entry_id)
+
+
+async def test_nest_proxy_stops_with_home_assistant(hass: HomeAssistant, socket_enabled):
+    await get_nest_proxy(hass)
+    [proxy_thread] = [t for t in threading.enumerate() if t.name == 'wibeee_nest_proxy']
+    assert proxy_thread.is_alive()
+
+    hass.bus.async_fire(EVENT_HOMEASSISTANT_STOP)
+    await hass.async_block_till_done()
+
+    assert not proxy_thread.is_alive()
@@ -1,22 +1,26 @@
 from datetime import timedelta
+from decimal import Decimal
 from unittest.mock import patch
 
 from freezegun import freeze_time
 from homeassistant.core import HomeAssistant
-from pytest_homeassistant_custom_component.common import MockConfigEntry
+from pytest_homeassistant_custom_component.common import MockConfigEntry, async_fire_time_changed
 
+from custom_components.wibeee import sensor
 from custom_components.wibeee.api import WibeeeAPI
 from custom_components.wibeee.sensor import DeviceInfo
 from .test_helpers import build_values
 
 
-async def setup_wibeee_sensors(hass: HomeAssistant, throttle_seconds: int = None) -> tuple[DeviceInfo, MockConfigEntry]:
+async def setup_wibeee_sensors(hass: HomeAssistant, throttle_seconds: int = None, aggregate: bool = None) -> tuple[DeviceInfo, MockConfigEntry]:
     """Setup Wibeee sensors for testing with optional throttle configuration."""
     dev = DeviceInfo('test_device', 'aabbccddeeff', '100.1', 'WBM', '1.2.3.4')
 
     options = {}
     if throttle_seconds is not None:
         options['throttle_sensors'] = throttle_seconds
+    if aggregate is not None:
+        options['throttle_aggregate'] = aggregate
 
     entry = MockConfigEntry(
         domain='wibeee',
@@ -48,32 +52,36 @@ async def test_sensor_throttling_enabled(mock_async_fetch_device_info, mock_asyn
         voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
         assert voltage_state.state == '230'
 
-        # Push first update - should go through immediately
+        # Push updates - should be held until the end of the throttle window
         voltage_sensor = hass.data['sensor'].get_entity('sensor.test_device_ddeeff_l1_phase_voltage')
         voltage_sensor.update_value('235')
+        voltage_sensor.update_value('240')
         await hass.async_block_till_done()
 
         voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
-        assert voltage_state.state == '235'
+        assert voltage_state.state == '230'  # Should still be old value
 
-        # Push second update immediately - should be throttled (blocked)
-        voltage_sensor.update_value('240')
+        # Advance time by 1 second - still within throttle window
+        frozen_time.tick(timedelta(seconds=1))
+        async_fire_time_changed(hass)
+        voltage_sensor.update_value('245')
         await hass.async_block_till_done()
 
         voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
-        assert voltage_state.state == '235'  # Should still be old value
+        assert voltage_state.state == '230'  # Should still be old value
 
-        # Advance time by 1 second - still within throttle window
+        # Advance time to the end of the throttle window
         frozen_time.tick(timedelta(seconds=1))
-        voltage_sensor.update_value('245')
+        async_fire_time_changed(hass)
         await hass.async_block_till_done()
 
         voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
-        assert voltage_state.state == '235'  # Should still be old value
+        assert voltage_state.state == '245'  # Latest value is applied, not dropped
 
-        # Advance time past throttle window (2+ seconds from first update)
-        frozen_time.tick(timedelta(seconds=1.1))  # Total: 2.1 seconds
+        # Push during the next throttle window
         voltage_sensor.update_value('250')
+        frozen_time.tick(timedelta(seconds=2))
+        async_fire_time_changed(hass)
         await hass.async_block_till_done()
 
         voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
@@ -140,25 +148,74 @@ async def test_sensor_throttling_default(mock_async_fetch_device_info, mock_asyn
         voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
         assert voltage_state.state == '230'
 
-        # Push first update
+        # Push updates
         voltage_sensor = hass.data['sensor'].get_entity('sensor.test_device_ddeeff_l1_phase_voltage')
         voltage_sensor.update_value('235')
+        voltage_sensor.update_value('240')
         await hass.async_block_till_done()
 
         voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
-        assert voltage_state.state == '235'
+        assert voltage_state.state == '230'  # Should still be old value (throttled)
 
-        # Push second update immediately - should be throttled
-        voltage_sensor.update_value('240')
+        # Advance time to the end of the default throttle window (5 seconds)
+        frozen_time.tick(timedelta(seconds=5))
+        async_fire_time_changed(hass)
         await hass.async_block_till_done()
 
         voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
-        assert voltage_state.state == '235'  # Should still be old value (throttled)
+        assert voltage_state.state == '240'  # Should now update to the latest value
 
-        # Advance time past default throttle window (5+ seconds)
-        frozen_time.tick(timedelta(seconds=5.1))
-        voltage_sensor.update_value('250')
+
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_sensor_throttling_aggregate(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant):
+    """Test that measurements are averaged over the throttle window when aggregating."""
+    dev, entry = await setup_wibeee_sensors(hass, throttle_seconds=2, aggregate=True)
+
+    with freeze_time("2025-01-01 12:00:00") as frozen_time:
+        mock_async_fetch_device_info.return_value = dev
+        mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230'})
+
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+        voltage_sensor = hass.data['sensor'].get_entity('sensor.test_device_ddeeff_l1_phase_voltage')
+        firmware_sensor = hass.data['sensor'].get_entity('sensor.test_device_ddeeff_firmware')
+        for value in ['230.10', '231.20', '235.30']:
+            voltage_sensor.update_value(value)
+        firmware_sensor.update_value('100.2')
+
+        frozen_time.tick(timedelta(seconds=2))
+        async_fire_time_changed(hass)
         await hass.async_block_till_done()
 
         voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
-        assert voltage_state.state == '250'  # Should now update
+        assert voltage_state.state == '232.2'
+        assert voltage_state.attributes['min'] == 230.1
+        assert voltage_state.attributes['max'] == 235.3
+        assert voltage_state.attributes['samples'] == 3
+
+        # non-measurement sensors use the latest value
+        assert hass.states.get('sensor.test_device_ddeeff_firmware').state == '100.2'
+
+        # each window is aggregated separately
+        voltage_sensor.update_value('240.00')
+        frozen_time.tick(timedelta(seconds=2))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+        voltage_state = hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage')
+        assert voltage_state.state == '240.0'
+        assert voltage_state.attributes['samples'] == 1
+
+        # the mean keeps the decimal places of the fractional samples, counted once per window and not per sample
+        for values in [[230, Decimal('230.25')], [Decimal('230.25'), 230]]:
+            with patch.object(sensor, '_decimals', wraps=sensor._decimals) as spy_decimals:
+                for value in values:
+                    voltage_sensor.update_value(value)
+                frozen_time.tick(timedelta(seconds=2))
+                async_fire_time_changed(hass)
+                await hass.async_block_till_done()
+
+            assert hass.states.get('sensor.test_device_ddeeff_l1_phase_voltage').state == '230.12'
+            assert spy_decimals.call_count == 1
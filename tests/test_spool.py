@@ -0,0 +1,137 @@
+import asyncio
+import os
+
+from custom_components.wibeee.spool import SpoolRecord, UpstreamSpool
+
+
+def _records(n: int, start: int = 0) -> list[SpoolRecord]:
+    return [SpoolRecord('POST', f'/Wibeee/receiverAvgPost?n={i}', f'{{"mac": "001122334455", "n": {i}}}') for i in range(start, start + n)]
+
+
+def _replay_all(spool: UpstreamSpool) -> list[SpoolRecord]:
+    replayed = []
+    while (peeked := spool.peek()) is not None:
+        record, position = peeked
+        replayed.append(record)
+        spool.commit(position)
+
+    return replayed
+
+
+def test_replays_in_order(tmp_path):
+    spool = UpstreamSpool(tmp_path, max_bytes=1024 * 1024, segment_bytes=200)
+    records = _records(10) + [SpoolRecord('GET', '/Wibeee/receiver?mac=001122334455', None),
+                              SpoolRecord('POST', '/Wibeee/receiverJSON', b'\xff{}')]
+    for record in records:
+        spool.append(record)
+
+    assert len(list(tmp_path.glob('*.seg'))) > 1
+    assert _replay_all(spool) == records
+    assert spool.is_empty()
+
+    # replayed segments are compacted
+    assert spool.size == 0
+    assert list(tmp_path.glob('*.seg')) == []
+
+
+def test_resumes_from_cursor(tmp_path):
+    spool = UpstreamSpool(tmp_path, max_bytes=1024 * 1024, segment_bytes=200)
+    for record in _records(6):
+        spool.append(record)
+
+    for _ in range(4):
+        _, position = spool.peek()
+        spool.commit(position)
+
+    reopened = UpstreamSpool(tmp_path, max_bytes=1024 * 1024, segment_bytes=200)
+    reopened.append(_records(1, start=6)[0])
+    assert _replay_all(reopened) == _records(3, start=4)
+
+
+def test_retention_drops_oldest_segments(tmp_path):
+    spool = UpstreamSpool(tmp_path, max_bytes=400, segment_bytes=200)
+    for record in _records(20):
+        spool.append(record)
+
+    assert spool.size <= 400
+    assert spool.dropped_bytes > 0
+
+    replayed = _replay_all(spool)
+    assert replayed == _records(len(replayed), start=20 - len(replayed))
+
+
+def test_commit_after_retention_dropped_the_record(tmp_path):
+    spool = UpstreamSpool(tmp_path, max_bytes=400, segment_bytes=200)
+    for record in _records(4):
+        spool.append(record)
+
+    # the record being replayed is dropped by retention before it's committed
+    record, position = spool.peek()
+    assert record == _records(1)[0]
+    for record in _records(4, start=4):
+        spool.append(record)
+    assert spool.dropped_bytes > 0
+    spool.commit(position)
+
+    # the commit doesn't skip the first record that was kept
+    replayed = _replay_all(spool)
+    assert replayed == _records(len(replayed), start=8 - len(replayed))
+
+
+def test_truncates_torn_record(tmp_path):
+    spool = UpstreamSpool(tmp_path, max_bytes=1024 * 1024)
+    for record in _records(2):
+        spool.append(record)
+
+    # simulate a crash in the middle of writing a record
+    [segment] = tmp_path.glob('*.seg')
+    os.truncate(segment, segment.stat().st_size - 5)
+
+    assert _replay_all(UpstreamSpool(tmp_path, max_bytes=1024 * 1024)) == _records(1)
+
+
+async def test_replay_pauses_while_upstream_is_down(tmp_path):
+    spool = UpstreamSpool(tmp_path, max_bytes=1024 * 1024)
+    for record in _records(3):
+        await spool.async_append(record)
+
+    upstream_up = False
+    sent = []
+
+    async def send(record: SpoolRecord) -> bool:
+        if upstream_up:
+            sent.append(record)
+        return upstream_up
+
+    spool.async_replay(send, rate=1000)
+    await spool._replay_task
+    assert sent == []
+
+    upstream_up = True
+    spool.async_replay(send, rate=1000)
+    await spool._replay_task
+    assert sent == _records(3)
+
+    spool.async_replay(send, rate=1000)
+    await asyncio.sleep(0)
+    assert sent == _records(3)
+    spool.pause_replay()
+
+
+async def test_paused_replay_does_not_start(tmp_path):
+    spool = UpstreamSpool(tmp_path, max_bytes=1024 * 1024)
+    await spool.async_append(_records(1)[0])
+    sent = []
+
+    async def send(record: SpoolRecord) -> bool:
+        sent.append(record)
+        return True
+
+    spool.pause_replay()
+    spool.async_replay(send, rate=1000)
+    assert spool._replay_task is None
+
+    spool.resume_replay()
+    spool.async_replay(send, rate=1000)
+    await spool._replay_task
+    assert sent == _records(1)
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer, unused_port
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.wibeee.api import WibeeeAPI
+from custom_components.wibeee.const import NEST_NULL_UPSTREAM
+from custom_components.wibeee.diagnostics import async_get_config_entry_diagnostics
+from custom_components.wibeee.nest import create_application, get_nest_proxy, FrameBatcher, NestProxy, NestProxyThread
+from custom_components.wibeee.sensor import DeviceInfo
+from custom_components.wibeee.tracing import FrameTracer
+from .test_helpers import build_values
+from .test_nest import PUSH_DATA
+
+
+def test_frame_tracer_histograms():
+    frame_tracer = FrameTracer(history=2)
+    for n in range(3):
+        trace = frame_tracer.start('receiverLeap', 100.0 + n)
+        trace.marks |= {'decode': 100.001 + n, 'handle_push_data': 100.004 + n, 'end': 100.02 + n}
+        frame_tracer.record(trace)
+
+    timing = frame_tracer.as_dict()
+    assert timing['histograms']['decode']['count'] == 3
+    assert timing['histograms']['handle_push_data']['buckets']['0.005'] == 3
+    assert timing['histograms']['total']['buckets']['0.01'] == 0
+    assert timing['histograms']['total']['buckets']['0.025'] == 3
+    assert timing['histograms']['forward']['count'] == 0
+    assert [t['marks']['end'] for t in timing['traces']] == [20.0, 20.0]
+
+
+async def test_traces_push_frames(aiohttp_client, socket_enabled):
+    nest_proxy = NestProxy()
+    client = await aiohttp_client(create_application(nest_proxy.get_device_info))
+    frame_tracer = FrameTracer()
+
+    def handle_push_data(_):
+        frame_tracer.active.mark('update_sensors_start')
+        frame_tracer.active.mark('update_sensors_end')
+
+    nest_proxy.register_device(PUSH_DATA['mac'], handle_push_data, NEST_NULL_UPSTREAM, frame_tracer=frame_tracer)
+    await client.get('/Wibeee/receiverLeap', params=PUSH_DATA)
+
+    [trace] = frame_tracer.as_dict()['traces']
+    assert trace['route'] == 'receiverLeap'
+    assert list(trace['marks']) == ['receive', 'decode', 'update_sensors_start', 'update_sensors_end', 'handle_push_data', 'end']
+    assert frame_tracer.active.mark('ignored') is None
+
+
+async def test_traces_push_frames_of_every_listener(aiohttp_client, socket_enabled):
+    nest_proxy = NestProxy()
+    client = await aiohttp_client(create_application(nest_proxy.get_device_info))
+    frame_tracers = [FrameTracer(), FrameTracer()]
+    active_traces = []
+
+    for frame_tracer in frame_tracers:
+        nest_proxy.register_device(PUSH_DATA['mac'], lambda _, t=frame_tracer: active_traces.append(t.active), NEST_NULL_UPSTREAM,
+                                   frame_tracer=frame_tracer)
+    await client.get('/Wibeee/receiverLeap', params=PUSH_DATA)
+
+    # both listeners see the trace of the frame that they handle, and both record it
+    assert len(active_traces) == 2 and active_traces[0] is active_traces[1] and active_traces[0].marks
+    assert [len(frame_tracer.as_dict()['traces']) for frame_tracer in frame_tracers] == [1, 1]
+
+
+def test_handed_off_trace_is_recorded_once_handled():
+    frame_tracer = FrameTracer()
+    trace = frame_tracer.start('receiverLeap', time.monotonic())
+    trace.handoff()
+    trace.finish()
+    assert frame_tracer.as_dict()['traces'] == []
+
+    trace.handle_handed_off(lambda _: frame_tracer.active.mark('update_sensors_start'), PUSH_DATA)
+    [recorded] = frame_tracer.as_dict()['traces']
+    assert list(recorded['marks']) == ['receive', 'handoff', 'end', 'handle_start', 'update_sensors_start', 'handle_push_data']
+    assert frame_tracer.histograms['handoff'].as_dict()['count'] == 1
+
+
+async def test_traces_push_frames_handed_over_by_proxy_thread(socket_enabled):
+    loop = asyncio.get_running_loop()
+    received = asyncio.Event()
+    frame_tracer = FrameTracer()
+
+    def handle_push_data(_):
+        frame_tracer.active.mark('update_sensors_start')
+        frame_tracer.active.mark('update_sensors_end')
+        received.set()
+
+    nest_proxy = NestProxy()
+    nest_proxy.register_device(PUSH_DATA['mac'], handle_push_data, NEST_NULL_UPSTREAM, frame_tracer=frame_tracer)
+    proxy_thread = NestProxyThread()
+    proxy_thread.start()
+    port = unused_port()
+
+    async def start_server() -> web.AppRunner:
+        runner = web.AppRunner(create_application(nest_proxy.get_device_info, FrameBatcher(loop)))
+        await runner.setup()
+        await web.TCPSite(runner, host='127.0.0.1', port=port).start()
+        return runner
+
+    runner = await proxy_thread.async_run(start_server())
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'http://127.0.0.1:{port}/Wibeee/receiverLeap', params=PUSH_DATA) as res:
+                assert res.status == 200
+        await asyncio.wait_for(received.wait(), 5)
+    finally:
+        await proxy_thread.async_run(runner.cleanup())
+        await proxy_thread.async_stop()
+
+    # recorded once, by whichever thread finished with the frame last
+    [trace] = frame_tracer.as_dict()['traces']
+    assert {'receive', 'decode', 'handoff', 'end', 'handle_start', 'update_sensors_start', 'update_sensors_end',
+            'handle_push_data'} == trace['marks'].keys()
+    assert frame_tracer.histograms['handoff'].as_dict()['count'] == 1
+    assert frame_tracer.histograms['update_sensors'].as_dict()['count'] == 1
+
+
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_diagnostics(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant, socket_enabled):
+    dev = DeviceInfo('diagnostics', '001122334455', '4.4.171', 'WBB', '1.2.3.4')
+    mock_async_fetch_device_info.return_value = dev
+    mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230', 'pac1': '100'})
+
+    entry = MockConfigEntry(domain='wibeee', title='Wibeee 4455', unique_id='00:11:22:33:44:55',
+                            data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+                            options={'nest_upstream': NEST_NULL_UPSTREAM}, version=5)
+    entry.add_to_hass(hass)
+    await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    nest_proxy = await get_nest_proxy(hass)
+    async with TestClient(TestServer(create_application(nest_proxy.get_device_info))) as client:
+        await client.get('/Wibeee/receiverLeap', params=PUSH_DATA)
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+    assert diagnostics['entry']['data']['mac_address'] == '**REDACTED**'
+    assert diagnostics['entry']['title'] == '**REDACTED**'
+    assert '001122334455' not in str(diagnostics)
+
+    [trace] = diagnostics['push_frame_timing']['traces']
+    assert {'decode', 'update_sensors_start', 'update_sensors_end', 'handle_push_data'} <= trace['marks'].keys()
+    assert diagnostics['push_frame_timing']['histograms']['update_sensors']['count'] == 1
+    assert diagnostics['upstream_forwarder']['queue_depth'] == 0
+    assert diagnostics['upstream_forwarder']['dropped'] == 0
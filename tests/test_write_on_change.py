@@ -0,0 +1,61 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from freezegun import freeze_time
+from homeassistant.const import STATE_UNAVAILABLE
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.wibeee.api import WibeeeAPI
+from custom_components.wibeee.sensor import DeviceInfo, WibeeeSensor
+from .test_helpers import build_values
+
+VOLTAGE_ENTITY_ID = 'sensor.test_device_ddeeff_l1_phase_voltage'
+
+
+@patch.object(WibeeeAPI, 'async_fetch_values', autospec=True)
+@patch.object(WibeeeAPI, 'async_fetch_device_info', autospec=True)
+async def test_write_on_change(mock_async_fetch_device_info, mock_async_fetch_values, hass: HomeAssistant):
+    """Test that unchanged values and changes within the deadband are not written until the max age is reached."""
+    dev = DeviceInfo('test_device', 'aabbccddeeff', '100.1', 'WBM', '1.2.3.4')
+    entry = MockConfigEntry(
+        domain='wibeee',
+        data=dict(host=dev.ipAddr, mac_address=dev.macAddr, wibeee_id=dev.id),
+        options={'throttle_sensors': 0, 'write_on_change': True},
+        version=5
+    )
+    entry.add_to_hass(hass)
+
+    with freeze_time("2025-01-01 12:00:00") as frozen_time:
+        mock_async_fetch_device_info.return_value = dev
+        mock_async_fetch_values.return_value = build_values(dev, {'vrms1': '230'})
+
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+        voltage_sensor: WibeeeSensor = hass.data['sensor'].get_entity(VOLTAGE_ENTITY_ID)
+
+        async def update_voltage(value: str) -> int:
+            """Returns the number of times the state was written."""
+            with patch.object(voltage_sensor, 'async_write_ha_state', wraps=voltage_sensor.async_write_ha_state) as spy_write:
+                voltage_sensor.update_value(value)
+                await hass.async_block_till_done()
+                return spy_write.call_count
+
+        assert await update_voltage('230') == 1  # first update is always written
+        assert await update_voltage('230') == 0  # unchanged
+        assert await update_voltage('230.3') == 0  # within 0.5 V deadband
+        assert hass.states.get(VOLTAGE_ENTITY_ID).state == '230'
+
+        assert await update_voltage('230.6') == 1
+        assert hass.states.get(VOLTAGE_ENTITY_ID).state == '230.6'
+
+        # unchanged value is written again once the max age is reached
+        frozen_time.tick(timedelta(seconds=59))
+        assert await update_voltage('230.6') == 0
+        frozen_time.tick(timedelta(seconds=1))
+        assert await update_voltage('230.6') == 1
+
+        # becoming unavailable is always a change
+        assert await update_voltage(STATE_UNAVAILABLE) == 1
+        assert hass.states.get(VOLTAGE_ENTITY_ID).state == 'unavailable'